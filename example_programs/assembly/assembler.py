@@ -1,200 +1,181 @@
-import re
+import sys
 import pathlib
 import argparse
 
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[2] / "test"))
+from jrb16.assembler import CU_FLAGS, Assembler, AssemblerError, load_translation
+from jrb16.image import write_raw
+from jrb16.peephole import optimize, summary
+
+# Separates programs on stdin in --stream mode
+STREAM_SEPARATOR = "---"
+
+
+def parse(
+    input_file,
+    output_file,
+    binary=False,
+    cu_flags=CU_FLAGS,
+    assembler=None,
+    optimized=False,
+):
+    if assembler is None:
+        try:
+            assembler = Assembler(load_translation(cu_flags))
+        except AssemblerError as e:
+            print(e)
+            return False
+    source = input_file.read().splitlines()
+    try:
+        if optimized:
+            lines, changes = optimize(source, assembler)
+            for change in changes:
+                print(change)
+            print(summary(assembler, source, lines))
+            source = lines
+        image = assembler.assemble(source)
+    except AssemblerError as e:
+        if e.text is not None:
+            print(e.text)
+        print(e)
+        return False
+    finally:
+        for line, warning in assembler.warnings:
+            print(line)
+            print(warning)
 
-def check_mov(args):
-    r = re.match(r"([abcd]) ([abcd])", args)
-    if r is not None:
-        return r.group(1) != r.group(2)
-
-
-def check_load(args):
-    r = re.match(r"ram\[[abcd]\] [abcd]", args)
-    if r is not None:
-        return True
-    r = re.match(r"ram\[[0-9]+\] [abcd]", args)
-    if r is not None:
-        return True
-    r = re.match(r"rom [abcd] [0-9]+", args)
-    return r is not None
-
+    if binary:
+        if output_file is None:
+            path = pathlib.Path(input_file.name).stem + ".img"
+        else:
+            path = output_file.name
+            output_file.close()
+        image.save(path)
 
-def check_save(args):
-    r = re.match(r"[abcd] ram", args)
-    if r is not None:
+        print("Successfully compiled")
+        print("File written to %s" % path)
         return True
-    r = re.match(r"[abcd] ram\[[abcd]\]", args)
-    if r is not None:
-        return True
-    r = re.match(r"[abcd] ram\[[0-9]+\]", args)
-    if r is not None:
-        return True
-    r = re.match(r"[abcd] mar", args)
-    return r is not None
-
-
-operations = {
-    "nop": lambda x: x == "",
-    "mov": check_mov,
-    "cmp": re.compile(r"([abcd]) ([abcd]|0|1|-1|255)").match,
-    "jmp": re.compile(r"(\.?(<=|<|=|>|>=) [abcd])|(.+)").match,
-    "jmpr": re.compile(r"(\.?(<=|<|=|>|>=) [abcd])|(.+)").match,
-    "opp": re.compile(r"").match,
-    "load": check_load,
-    "save": check_save,
-    "in": re.compile(r"[abcd]").match,
-    "out": re.compile(r"[abcd]|[0-9]+|ram\[[0-9]+\]|ram\[[abcd]\]").match,
-    "halt": lambda x: x == "",
-}
-
-import csv
-
-cu_flags = list(csv.reader(open("../../rom/cu_flags.csv", "r")))
-assembler_column_ind = cu_flags[0].index("ASSEMBLER INST")
-translation = {v[assembler_column_ind]: ind - 1 for ind, v in enumerate(cu_flags)}
-
-translation_stage_two = list(
-    filter(lambda x: "{label}" in x or "{number}" in x, translation)
-)
-
-
-def opp_to_hex(line):
-    global offset
-
-    if line in translation:
-        offset += 1
-        return [translation[line]]
-
-    for instruction in translation_stage_two:
-        match_whole_ins = "^" + re.escape(instruction) + "$"
-
-        ins_temp = match_whole_ins.replace(r"\{label\}", "([^ ]+)")
-        match = re.match(ins_temp, line)
-        if match is not None:
-            # Instructions with labels are 3 bytes
-            offset += 3
-            return [translation[instruction], *match.groups()]
-
-        ins_temp = match_whole_ins.replace(
-            r"\{number\}", "(?:(0x([0-9a-fA-F]+))|(0b([01]+))|([0-9]+))"
-        )
-        match = re.match(ins_temp, line)
-        if match is not None:
-            # Instructions with numbers are 2 bytes
-            offset += 2
-
-            # TODO: Only supports one number per instruction
-            if match.group(1):
-                number = int(match.group(2), 16)
-            elif match.group(3):
-                number = int(match.group(4), 2)
-            elif match.group(5):
-                number = int(match.group(5))
-
-            if number > 0xFF:
-                print(line)
-                print("Number larger than can fit in register")
-                return None
-
-            return [translation[instruction], number]
-    return None
-
-
-def parse(input_file, output_file):
-    final = []
-    labels = {}
-    global offset
-    offset = 0
-
-    for ln, line in enumerate(input_file):
-        line = re.sub(r"//.*", r"", line)
-        line = line.strip()
-        if not line:
-            continue
-
-        variables = line.split()
-        opp = variables[0]
-        opp_args = " ".join(variables[1:])
-
-        label_match = re.match(":(.+)", opp)
-        if label_match is not None:
-            # print(line, offset)
-            label_match = label_match.group(1)
-            if label_match not in labels:
-                labels[label_match] = offset
-            else:
-                print(line)
-                print("Line %d duplicate label detected" % (ln + 1))
-        elif opp in operations:
-            if not operations[opp](opp_args):
-                print(line)
-                print("Line %d is not valid" % (ln + 1))
-                return
-
-            hex_op = opp_to_hex(line)
-            if hex_op is None:
-                print(line)
-                print("Line %d couldn't find translation for instruction" % (ln + 1))
-                return
-            final.extend(hex_op)
-        else:
-            print(line)
-            print("Line %d couldn't find matching instruction" % (ln + 1))
-            return
-
-    # for x in final:
-    #    if isinstance(x, int):
-    #        print(hex(int(x)), end=' ')
-    #    else:
-    #        print(x, end=' ')
-    # print()
-
-    # print(final)
-    file_output = []
-    for ins in final:
-        if isinstance(ins, str):
-            if ins not in labels:
-                print("Label %s has not been defined" % (ins))
-                return
-
-            ins = labels[ins]
-            file_output.append("%02x" % (ins >> 4 * 2))
-            file_output.append("%02x" % (ins & 0xFF))
-        else:
-            file_output.append("%02x" % ins)
-    # print(file_output)
 
     if output_file is None:
         output_file = open(pathlib.Path(input_file.name).stem + ".o", "w")
 
-    output_file.write("v2.0 raw\n")
-    output_file.write(" ".join(file_output))
-    output_file.write("\n")
+    write_raw(output_file, image.words)
     output_file.close()
 
     print("Successfully compiled")
     print("File written to %s" % output_file.name)
+    return True
+
+
+def programs(lines):
+    """Split a stream of lines into programs at the separator lines."""
+    program = []
+    for line in lines:
+        if line.strip() == STREAM_SEPARATOR:
+            yield program
+            program = []
+        else:
+            program.append(line)
+    if any(line.strip() for line in program):
+        yield program
+
+
+def stream(input_file, output_file, assembler, optimized=False):
+    """Assemble every program on input_file, one output line each.
+
+    A line is the program's bytes in the "v2.0 raw" hex format without the
+    header, or "error: <message>" if it failed to assemble.
+    """
+    failed = 0
+    for program in programs(input_file):
+        try:
+            if optimized:
+                program = optimize(program, assembler)[0]
+            image = assembler.assemble(program)
+        except AssemblerError as e:
+            failed += 1
+            output_file.write("error: %s\n" % e)
+        else:
+            write_raw(output_file, image.words, header=False)
+        output_file.flush()
+    return failed
 
 
 parser = argparse.ArgumentParser(description="Process some integers.")
 parser.add_argument(
     "input",
-    type=argparse.FileType("r"),
-    help="The assembly file to compile to machine level code",
+    nargs="*",
+    type=pathlib.Path,
+    help="The assembly files to compile to machine level code",
 )
 parser.add_argument(
     "--output",
     "-o",
     type=argparse.FileType("w"),
-    help="The machine level filename to write",
+    help="The machine level filename to write, only for a single input",
+)
+parser.add_argument(
+    "--output-dir",
+    "-d",
+    type=pathlib.Path,
+    help="Write the outputs into this directory instead of the current one",
+)
+parser.add_argument(
+    "--binary",
+    "-b",
+    action="store_true",
+    help="Write a binary image with the labels instead of v2.0 raw text",
+)
+parser.add_argument(
+    "--stream",
+    "-s",
+    action="store_true",
+    help="Assemble programs separated by --- lines from stdin to stdout",
+)
+parser.add_argument(
+    "--optimize",
+    "-O",
+    action="store_true",
+    help="Run the peephole optimizer first and print what it saved",
+)
+parser.add_argument(
+    "--cu-flags",
+    default=CU_FLAGS,
+    help="The cu_flags.ts or cu_flags.csv to take the instruction translation from",
 )
-import sys
 
 if len(sys.argv) > 1:
     args = parser.parse_args()
-    input_file = args.input
-    output_file = args.output
+    # One translation table for every program in this run
+    try:
+        assembler = Assembler(load_translation(args.cu_flags))
+    except AssemblerError as e:
+        sys.exit(str(e))
+
+    if args.stream:
+        failed = stream(sys.stdin, sys.stdout, assembler, args.optimize)
+        sys.exit(1 if failed else 0)
+    if not args.input:
+        parser.error("no input files")
+    if args.output is not None and len(args.input) > 1:
+        parser.error("--output only works with a single input")
+
+    failed = 0
+    for path in args.input:
+        output_file = args.output
+        if output_file is None and args.output_dir is not None:
+            suffix = ".img" if args.binary else ".o"
+            output_file = open(args.output_dir / (path.stem + suffix), "w")
+        with open(path, "r") as input_file:
+            if not parse(
+                input_file,
+                output_file,
+                args.binary,
+                assembler=assembler,
+                optimized=args.optimize,
+            ):
+                failed += 1
+    sys.exit(1 if failed else 0)
 else:
     import tkinter as tk
     from tkinter import filedialog
@@ -205,5 +186,7 @@ else:
     filename = filedialog.askopenfilename()
     input_file = open(filename, "r")
     output_file = None
+    binary = False
+    cu_flags = CU_FLAGS
 
-parse(input_file, output_file)
+    parse(input_file, output_file, binary, cu_flags)
@@ -0,0 +1,61 @@
+"""Benchmark the workloads of jrb16.bench, RTL or gate level depending on GATES.
+
+    make MODULE=bench
+    make MODULE=bench GATES=yes
+    python -m jrb16.bench            # compare with benchmarks/baseline.json
+
+BENCH_CYCLES is the cycle budget of each run, BENCH_OUT and BENCH_BASELINE
+the result and baseline files. The test fails on a regression against the
+baseline, see jrb16/bench.py for what counts as one. Without a baseline
+only runs that stop with an error fail.
+"""
+
+import os
+import time
+from pathlib import Path
+
+import cocotb
+
+from jrb16 import bench
+from test_full import STATS, run
+
+BENCH_CYCLES = int(os.environ.get("BENCH_CYCLES", bench.CYCLES))
+
+
+@cocotb.test()
+async def test_benchmark(dut):
+    netlist = "gl" if os.environ.get("GATES") == "yes" else "rtl"
+
+    results = []
+    for name, words in bench.workloads(BENCH_CYCLES).items():
+        for address_bits in bench.ADDRESS_BITS:
+            address_24bit = address_bits == 24
+            start = time.perf_counter()
+            await run(dut, words, BENCH_CYCLES, address_24bit)
+            wall = time.perf_counter() - start
+
+            instructions = STATS.instructions
+            if instructions is None:
+                # The model is cycle accurate, so it retires the same
+                # instructions in the same cycles
+                instructions = bench.model_instructions(words, STATS.cycles)
+            results.append(
+                bench.result(
+                    name,
+                    address_bits,
+                    netlist,
+                    STATS.cycles,
+                    instructions,
+                    wall,
+                    STATS.reason,
+                )
+            )
+
+    out = os.environ.get("BENCH_OUT", bench.RESULTS)
+    bench.save(out, results, simulator=os.environ.get("SIM", "icarus"))
+
+    baseline_path = Path(os.environ.get("BENCH_BASELINE", bench.BASELINE))
+    baseline = bench.load(baseline_path) if baseline_path.exists() else []
+    rows, regressions = bench.compare(results, baseline)
+    print(bench.format_rows(rows))
+    assert not regressions, "\n".join(regressions)
@@ -0,0 +1,99 @@
+import pickle
+
+# Every flip-flop in src/*.sv by module instance, the rest of the design is
+# combinational so these are enough to put the RTL back where it was
+STATE = {
+    "cu_module": ["cu_state", "alu_done_reg", "ir_reg", "pc_reg"],
+    "registers_module": [
+        "areg",
+        "breg",
+        "creg",
+        "dreg",
+        "ereg",
+        "freg",
+        "greg",
+        "hreg",
+        "mar_reg",
+        "mpage_reg",
+        "oreg_reg",
+        "ireg_reg",
+    ],
+    "alu_module": [
+        "state",
+        "done_reg",
+        "flags_mode",
+        "carry_mode",
+        "signed_mode",
+        "val",
+        "aandz",
+        "bandz",
+        "xora",
+        "xorb",
+        "muxoutput",
+    ],
+    "cmp_module": ["zflag", "oflag", "cflag", "sflag"],
+    "qspi_rom_module": ["qspi_state", "shift_counter", "sclk_reg", "qspi_in_reg"],
+}
+
+# Pins driven by the testbench
+INPUTS = ["ui_in", "uio_in", "ena"]
+
+QSPI_IDLE = 0
+
+
+class Checkpoint(object):
+    """A snapshot of the RTL and the testbench taken between two clock edges.
+
+    Snapshots are only taken while the ROM QSPI is idle, so nothing has to be
+    saved for the QspiMemory transaction in flight.
+    """
+
+    def __init__(self, cycle, signals, ram, current_input, outputs):
+        self.cycle = cycle
+        self.signals = signals
+        # Only the RAM pages that were written, see Memory.snapshot()
+        self.ram = ram
+        self.current_input = current_input
+        self.outputs = outputs
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def handles(computer):
+    try:
+        for module, names in STATE.items():
+            instance = getattr(computer, module)
+            for name in names:
+                yield (module, name), getattr(instance, name)
+    except AttributeError:
+        raise AssertionError("checkpoints need the RTL, not the gate level netlist")
+    for name in INPUTS:
+        yield (None, name), getattr(computer, name)
+
+
+def can_capture(computer):
+    # Call between clock edges (e.g. on the falling edge)
+    return computer.qspi_rom_module.qspi_state.value == QSPI_IDLE
+
+
+def capture(computer, cycle, ram, current_input, outputs):
+    signals = {}
+    for key, handle in handles(computer):
+        value = handle.value
+        assert value.is_resolvable, "%s.%s is not resolvable" % key
+        signals[key] = value.integer
+    return Checkpoint(cycle, signals, ram.snapshot(), current_input, list(outputs))
+
+
+def restore(checkpoint, computer, ram):
+    # Call between clock edges, the values are picked up by the next one
+    for key, handle in handles(computer):
+        handle.value = checkpoint.signals[key]
+    ram.restore(checkpoint.ram)
@@ -0,0 +1,5 @@
+from .consts import *
+from .rom import load_roms, read_mem
+from .memory import Memory
+from .image import Image, load_image, load_program, parse_raw, read_image
+from .model import Computer, ModelError
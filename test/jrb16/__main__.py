@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from .image import load_image
+from .model import Computer
+
+parser = argparse.ArgumentParser(
+    description="Run a program on the Python model of the computer"
+)
+parser.add_argument("program", help="The v2.0 raw image to run")
+parser.add_argument("--cycles", "-c", type=int, default=5000, help="Cycle budget")
+parser.add_argument(
+    "--inputs", "-i", default="", help="Comma separated values fed to ui_in"
+)
+parser.add_argument(
+    "--expected-outputs", "-n", type=int, help="Stop after this many outputs"
+)
+args = parser.parse_args()
+
+inputs = [int(x, 0) for x in args.inputs.split(",") if x]
+computer = Computer(load_image(args.program))
+
+start = time.perf_counter()
+outputs = computer.run(args.cycles, inputs, args.expected_outputs)
+elapsed = time.perf_counter() - start
+
+print("Outputs:", " ".join(str(x) for x in outputs))
+print(
+    "Ran %d of %d cycles, stopped by %s"
+    % (computer.cycles_run, args.cycles, computer.stop_reason)
+)
+if computer.stop_reason == "error":
+    print(computer.error)
+print("%.0f cycles/s" % (computer.cycles_run / elapsed))
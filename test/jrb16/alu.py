@@ -0,0 +1,182 @@
+"""Vectorized reference for the ALU opcodes, over NumPy arrays of operands.
+
+    ops = alu_operations()           # {opcode: "a+b", ...} from test/assembly
+    result, overflow = expected(0xEB, a, b)
+
+expected() is what an opcode should do according to its mnemonic, with the
+register names standing for the ALU's a and b inputs (unary ops use a).
+datapath() is what the ALU ROM makes src/alu.sv do, the same way the Python
+model works it out. Both take and return uint16 arrays.
+"""
+
+import re
+
+import numpy as np
+
+from .isa import read_assembly
+from .model import ALU_FIELDS
+from .rom import load_roms
+
+MASK = 0xFFFF
+
+# Opcodes that only change the ALU mode, there is no result to check
+MODE_INSTRUCTIONS = ("clr", "flags off", "flags on", "carry off", "carry on")
+MODE_INSTRUCTIONS += ("sign off", "sign on")
+
+# Operations src/alu.sv has no implementation for yet, MULT and DIV are
+# empty states and the ALU ROM rows for >>> do not select a shift
+UNIMPLEMENTED = ("*", "/", ">>>")
+
+_REGISTER = "[a-h]"
+_FORMS = [
+    (re.compile(r"(-?[01])$"), "constant"),
+    (re.compile(r"%s$" % _REGISTER), "a"),
+    (re.compile(r"~%s$" % _REGISTER), "~"),
+    (re.compile(r"-%s$" % _REGISTER), "neg"),
+    (re.compile(r"%s\+1$" % _REGISTER), "inc"),
+    (re.compile(r"%s-1$" % _REGISTER), "dec"),
+    (re.compile(r"%s(>>>|>>|<<|[-+&|^*/])%s$" % (_REGISTER, _REGISTER)), None),
+]
+
+
+def parse_operation(text):
+    """The operation of an "opp ..." mnemonic without its operands."""
+    for pattern, name in _FORMS:
+        match = pattern.match(text)
+        if match is not None:
+            if name == "constant":
+                return match.group(1)
+            return name or match.group(1)
+    return None
+
+
+def alu_operations():
+    """{opcode: operation} for every opp instruction that produces a value."""
+    operations = {}
+    for opcode, text in read_assembly().items():
+        if not text.startswith("opp "):
+            continue
+        text = text[len("opp ") :]
+        if text in MODE_INSTRUCTIONS:
+            continue
+        operation = parse_operation(text)
+        if operation is None:
+            raise ValueError("unknown ALU instruction %r" % text)
+        operations[opcode] = operation
+    return operations
+
+
+def _signed(x):
+    return x.astype(np.uint16).view(np.int16).astype(np.int32)
+
+
+def _overflow(a, b, result):
+    # Operands with the same sign giving a result with the other sign
+    sign = 0x8000
+    return ((a & sign) == (b & sign)) & ((a & sign) != (result & sign))
+
+
+def evaluate(operation, a, b):
+    """(result, overflow) for an operation over uint16 arrays a and b."""
+    a = np.asarray(a, dtype=np.uint32) & MASK
+    b = np.asarray(b, dtype=np.uint32) & MASK
+    overflow = np.zeros(a.shape, dtype=bool)
+
+    if operation in ("0", "1", "-1"):
+        result = np.full(a.shape, int(operation) & MASK, dtype=np.uint32)
+    elif operation == "a":
+        result = a
+    elif operation == "~":
+        result = ~a
+    elif operation == "neg":
+        result = -a
+        overflow = a == 0x8000
+    elif operation == "inc":
+        result = a + 1
+        overflow = a == 0x7FFF
+    elif operation == "dec":
+        result = a - 1
+        overflow = a == 0x8000
+    elif operation == "+":
+        result = (a + b) & MASK
+        overflow = _overflow(a, b, result)
+    elif operation == "-":
+        result = (a - b) & MASK
+        overflow = _overflow(a, ~b & MASK, result)
+    elif operation == "&":
+        result = a & b
+    elif operation == "|":
+        result = a | b
+    elif operation == "^":
+        result = a ^ b
+    elif operation == "<<":
+        result = np.where(b < 16, a << np.minimum(b, 16), 0)
+    elif operation == ">>":
+        result = np.where(b < 16, a >> np.minimum(b, 16), 0)
+    elif operation == ">>>":
+        result = _signed(a) >> np.minimum(b, 15)
+    elif operation == "*":
+        result = a * b
+    elif operation == "/":
+        # Division by zero gives all ones
+        result = np.where(b == 0, MASK, a // np.maximum(b, 1))
+    else:
+        raise ValueError("unknown ALU operation %r" % operation)
+    return (np.asarray(result) & MASK).astype(np.uint16), overflow
+
+
+def expected(opcode, a, b, operations=None):
+    operations = operations or alu_operations()
+    return evaluate(operations[opcode], a, b)
+
+
+def datapath(opcode, a, b, roms=None):
+    """(result, overflow) the ALU ROM entry for opcode makes src/alu.sv give.
+
+    Carry in is taken as 0. MULT and DIV leave the previous result in the
+    RTL, here they give 0.
+    """
+    roms = roms or load_roms()
+    za, ia, zb, ib, inv, po, _, cselect = ALU_FIELDS[roms.alu[opcode] & 0x7FF]
+    a = np.asarray(a, dtype=np.uint32) & MASK
+    b = np.asarray(b, dtype=np.uint32) & MASK
+
+    xora = (a * (1 - za)) ^ (MASK * ia)
+    xorb = (b * (1 - zb)) ^ (MASK * ib)
+    if cselect == 0:
+        mux = (xora + xorb + po) & MASK
+    elif cselect == 1:
+        mux = xora & xorb
+    elif cselect == 2:
+        mux = xora ^ xorb
+    elif cselect == 3:
+        mux = np.where(xorb < 16, xora << np.minimum(xorb, 16), 0) & MASK
+    elif cselect == 4:
+        mux = np.where(xorb < 16, xora >> np.minimum(xorb, 16), 0)
+    else:
+        mux = np.zeros(a.shape, dtype=np.uint32)
+
+    overflow = ((~mux & xora & xorb) | (mux & ~xora & ~xorb)) >> 15 & 1
+    result = (mux ^ (MASK * inv)) & MASK
+    return result.astype(np.uint16), overflow.astype(bool)
+
+
+def random_operands(operation, count, rng=None):
+    """count random (a, b) uint16 pairs, the edge cases first in up to half
+    of them.
+
+    Shift amounts stay below 16 and divisors are never 0, the cases where
+    the result is a matter of definition.
+    """
+    rng = rng or np.random.default_rng()
+    edges = np.array([0, 1, 0x7FFF, 0x8000, 0xFFFF], dtype=np.uint16)
+    a = rng.integers(0, 1 << 16, count, dtype=np.uint32).astype(np.uint16)
+    b = rng.integers(0, 1 << 16, count, dtype=np.uint32).astype(np.uint16)
+    n = min(count // 2, len(edges) ** 2)
+    a[:n] = np.repeat(edges, len(edges))[:n]
+    b[:n] = np.tile(edges, len(edges))[:n]
+    if operation in ("<<", ">>", ">>>"):
+        b %= 16
+    elif operation == "/":
+        b[b == 0] = 1
+    return a, b
@@ -0,0 +1,289 @@
+"""Assembler for the .j programs in example_programs/assembly.
+
+    image = assemble(open("primes.j").read())
+
+The translation from instruction text to opcode comes from the compiler's
+compiler/src/utils/cu_flags.ts, the table generated from the microcode
+spreadsheet. A cu_flags.csv export of that spreadsheet can be passed instead.
+The table is parsed once per process and also pickled in __pycache__, the
+pickle is thrown away as soon as the table changes.
+"""
+
+import csv
+import hashlib
+import pickle
+import re
+from pathlib import Path
+
+from .image import Image
+from .vm import CU_FLAGS_TS, read_cu_flags
+
+# Bump whenever the same source would assemble to different output
+ASSEMBLER_VERSION = 1
+
+CU_FLAGS = CU_FLAGS_TS
+ASSEMBLER_COLUMN = "ASSEMBLER INST"
+
+# Bump when the pickled Translation changes shape
+TRANSLATION_VERSION = 1
+PICKLE_DIR = Path(__file__).resolve().parent / "__pycache__"
+
+# Instructions with an operand, e.g. "jmp {label}" or "load ram[{number}] a"
+PLACEHOLDERS = ("{label}", "{number}")
+NUMBER = re.compile(r"(?:(0x([0-9a-fA-F]+))|(0b([01]+))|([0-9]+))")
+
+
+def check_mov(args):
+    r = re.match(r"([abcd]) ([abcd])", args)
+    if r is not None:
+        return r.group(1) != r.group(2)
+
+
+def check_load(args):
+    r = re.match(r"ram\[[abcd]\] [abcd]", args)
+    if r is not None:
+        return True
+    r = re.match(r"ram\[[0-9]+\] [abcd]", args)
+    if r is not None:
+        return True
+    r = re.match(r"rom [abcd] [0-9]+", args)
+    return r is not None
+
+
+def check_save(args):
+    r = re.match(r"[abcd] ram", args)
+    if r is not None:
+        return True
+    r = re.match(r"[abcd] ram\[[abcd]\]", args)
+    if r is not None:
+        return True
+    r = re.match(r"[abcd] ram\[[0-9]+\]", args)
+    if r is not None:
+        return True
+    r = re.match(r"[abcd] mar", args)
+    return r is not None
+
+
+operations = {
+    "nop": lambda x: x == "",
+    "mov": check_mov,
+    "cmp": re.compile(r"([abcd]) ([abcd]|0|1|-1|255)").match,
+    "jmp": re.compile(r"(\.?(<=|<|=|>|>=) [abcd])|(.+)").match,
+    "jmpr": re.compile(r"(\.?(<=|<|=|>|>=) [abcd])|(.+)").match,
+    "opp": re.compile(r"").match,
+    "load": check_load,
+    "save": check_save,
+    "in": re.compile(r"[abcd]").match,
+    "out": re.compile(r"[abcd]|[0-9]+|ram\[[0-9]+\]|ram\[[abcd]\]").match,
+    "halt": lambda x: x == "",
+}
+
+
+class AssemblerError(Exception):
+    def __init__(self, message, text=None):
+        super().__init__(message)
+        self.text = text
+
+
+class Translation(object):
+    """Instruction text to opcode, with the operand instructions indexed.
+
+    The instructions with an operand are keyed by their shape: the text with
+    the operand token left as its placeholder. A line is looked up by swapping
+    each of its tokens for the placeholders it could stand for, so matching
+    costs a few dict lookups instead of a regex per instruction.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.shapes = {}
+        affixes = set()
+        for index, instruction in enumerate(table):
+            for token in instruction.split(" "):
+                for placeholder in PLACEHOLDERS:
+                    if placeholder in token:
+                        prefix, suffix = token.split(placeholder)
+                        affixes.add((placeholder, prefix, suffix))
+                        self.shapes.setdefault(instruction, (index, placeholder))
+        self.affixes = sorted(affixes)
+
+    def operand_shapes(self, token):
+        for placeholder, prefix, suffix in self.affixes:
+            if (
+                len(token) > len(prefix) + len(suffix)
+                and token.startswith(prefix)
+                and token.endswith(suffix)
+            ):
+                operand = token[len(prefix) : len(token) - len(suffix)]
+                if placeholder == "{number}":
+                    operand = NUMBER.fullmatch(operand)
+                    if operand is None:
+                        continue
+                yield prefix + placeholder + suffix, operand
+
+    def match(self, line):
+        """The instruction a line assembles to and its operand, or None."""
+        tokens = line.split(" ")
+        best = None
+        for i, token in enumerate(tokens):
+            for shape, operand in self.operand_shapes(token):
+                instruction = " ".join(tokens[:i] + [shape] + tokens[i + 1 :])
+                hit = self.shapes.get(instruction)
+                # Earlier rows of the table win, like the table order always did
+                if hit is not None and (best is None or hit[0] < best[0]):
+                    best = (hit[0], hit[1], instruction, operand)
+        return best
+
+
+def read_translation(path=CU_FLAGS):
+    """{instruction: opcode} from cu_flags.ts or a cu_flags.csv, in table order."""
+    path = Path(path)
+    if path.suffix == ".ts":
+        return read_cu_flags(path)[0]
+    with open(path, "r") as f:
+        cu_flags = list(csv.reader(f))
+    column = cu_flags[0].index(ASSEMBLER_COLUMN)
+    return {v[column]: ind - 1 for ind, v in enumerate(cu_flags)}
+
+
+_cache = {}
+
+
+def load_translation(path=CU_FLAGS):
+    """The Translation for an instruction table, from memory or the pickle if
+    fresh."""
+    path = Path(path).resolve()
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise AssemblerError("No instruction table at %s" % path)
+    key = (TRANSLATION_VERSION, stat.st_mtime_ns, stat.st_size)
+    if path in _cache and _cache[path][0] == key:
+        return _cache[path][1]
+
+    name = hashlib.sha1(str(path).encode()).hexdigest()[:12]
+    pickled = PICKLE_DIR / ("translation-%s.pickle" % name)
+    translation = None
+    try:
+        with open(pickled, "rb") as f:
+            saved_key, saved = pickle.load(f)
+        if saved_key == key:
+            translation = saved
+    except (OSError, EOFError, ImportError, AttributeError, pickle.PickleError):
+        pass
+
+    if translation is None:
+        translation = Translation(read_translation(path))
+        try:
+            PICKLE_DIR.mkdir(exist_ok=True)
+            with open(pickled, "wb") as f:
+                pickle.dump((key, translation), f)
+        except OSError:
+            # A read-only checkout still works, just without the cache
+            pass
+
+    _cache[path] = (key, translation)
+    return translation
+
+
+class Assembler(object):
+    """Turns .j source into an Image, keeping no state between programs."""
+
+    def __init__(self, translation=None):
+        self.translation = translation or load_translation()
+        self.warnings = []
+
+    def encode(self, line):
+        """The words for one instruction, labels are left as their name."""
+        table = self.translation.table
+        if line in table:
+            return [table[line]]
+
+        match = self.translation.match(line)
+        if match is None:
+            return None
+        _, placeholder, instruction, operand = match
+
+        if placeholder == "{label}":
+            # Instructions with labels are 3 bytes once the label is filled in
+            return [table[instruction], operand]
+
+        # TODO: Only supports one number per instruction
+        if operand.group(1):
+            number = int(operand.group(2), 16)
+        elif operand.group(3):
+            number = int(operand.group(4), 2)
+        elif operand.group(5):
+            number = int(operand.group(5))
+
+        if number > 0xFF:
+            raise AssemblerError("Number larger than can fit in register", line)
+
+        # Instructions with numbers are 2 bytes
+        return [table[instruction], number]
+
+    def assemble(self, source):
+        if isinstance(source, str):
+            source = source.splitlines()
+
+        final = []
+        labels = {}
+        offset = 0
+        self.warnings = []
+
+        for ln, line in enumerate(source):
+            line = re.sub(r"//.*", r"", line)
+            line = line.strip()
+            if not line:
+                continue
+
+            variables = line.split()
+            opp = variables[0]
+            opp_args = " ".join(variables[1:])
+
+            label_match = re.match(":(.+)", opp)
+            if label_match is not None:
+                label_match = label_match.group(1)
+                if label_match not in labels:
+                    labels[label_match] = offset
+                else:
+                    self.warnings.append(
+                        (line, "Line %d duplicate label detected" % (ln + 1))
+                    )
+            elif opp in operations:
+                if not operations[opp](opp_args):
+                    raise AssemblerError("Line %d is not valid" % (ln + 1), line)
+
+                hex_op = self.encode(line)
+                if hex_op is None:
+                    raise AssemblerError(
+                        "Line %d couldn't find translation for instruction" % (ln + 1),
+                        line,
+                    )
+                # Labels take two bytes
+                offset += len(hex_op) + isinstance(hex_op[-1], str)
+                final.extend(hex_op)
+            else:
+                raise AssemblerError(
+                    "Line %d couldn't find matching instruction" % (ln + 1), line
+                )
+
+        words = []
+        for ins in final:
+            if isinstance(ins, str):
+                if ins not in labels:
+                    raise AssemblerError("Label %s has not been defined" % (ins))
+
+                ins = labels[ins]
+                words.append((ins >> 4 * 2) & 0xFF)
+                words.append(ins & 0xFF)
+            else:
+                words.append(ins)
+
+        # Labels are 16 bit byte addresses
+        return Image(words, address_width=16, symbols=labels, width=8)
+
+
+def assemble(source, translation=None):
+    """Assemble .j source (a string or lines) into an Image."""
+    return Assembler(translation).assemble(source)
@@ -0,0 +1,285 @@
+"""Benchmark workloads, their results and the comparison with a baseline.
+
+    python -m jrb16.bench benchmarks/results.json --baseline benchmarks/baseline.json
+    python -m jrb16.bench --model
+
+bench.py (MODULE=bench) runs every workload in 16 and 24 bit address mode
+and records one result per workload, mode and netlist:
+
+    cycles               clock cycles until the run stopped
+    instructions         instructions retired, UPDATE_IR states of the CU
+    cpi                  cycles per instruction
+    wall                 seconds the simulator took
+    cycles_per_second    simulated cycles per wall clock second
+
+A result is a regression when its CPI grew by more than cpi_tolerance or its
+cycles per second fell by more than speed_tolerance, both relative to the
+baseline. CPI is deterministic, simulator speed is not, hence the defaults.
+A run that stopped with an error fails whatever the baseline says.
+
+The example programs are jrb8 encoded and stop with an error on the current
+RTL, so the workloads are 10 bit instruction streams built with rtl_word()
+that run for the whole budget instead.
+
+--model runs the workloads on the Python model, which is cycle accurate to
+the RTL, and compares them with the RTL rows of the baseline without saving
+anything. It has no simulator speed, so the baseline itself comes from make
+MODULE=bench with and without GATES=yes. The RTL ignores the address mode
+pin, so both modes get the same numbers.
+"""
+
+import argparse
+import datetime
+import json
+import sys
+from pathlib import Path
+
+from .isa import read_assembly
+from .model import UPDATE_IR, Computer, ModelError
+
+BENCH_DIR = Path(__file__).resolve().parents[1] / "benchmarks"
+RESULTS = BENCH_DIR / "results.json"
+BASELINE = BENCH_DIR / "baseline.json"
+
+CPI_TOLERANCE = 0.0
+SPEED_TOLERANCE = 0.5
+
+# Cycle budget of each run
+CYCLES = 20000
+ADDRESS_BITS = (16, 24)
+
+# Every instruction walks at least these CU states, so a run never gets
+# further into its image than cycles // MIN_CPI words
+MIN_CPI = 5
+
+# Stop reasons of runs that went wrong, see test_full.run()
+FAILED_REASONS = ("error", "lockstep")
+
+FORMAT_VERSION = 1
+
+
+def result(program, address_bits, netlist, cycles, instructions, wall, reason):
+    return {
+        "program": program,
+        "address_bits": address_bits,
+        "netlist": netlist,
+        "cycles": cycles,
+        "instructions": instructions,
+        "cpi": cycles / instructions if instructions else None,
+        "wall": wall,
+        "cycles_per_second": cycles / wall if wall else None,
+        "reason": reason,
+    }
+
+
+def key(r):
+    return (r["program"], r["address_bits"], r["netlist"])
+
+
+def model_instructions(words, cycles):
+    """Instructions the Python model starts in cycles, for netlists without
+    the CU state to count them from."""
+    computer = Computer(words)
+    count = 0
+    for _ in range(cycles):
+        count += computer.cu_state == UPDATE_IR
+        try:
+            computer.step()
+        except ModelError:
+            break
+    return count
+
+
+def rtl_word(opcode):
+    """The ROM word the current src/qspi.sv hands the IR as opcode.
+
+    qspi_in_reg[shift_counter -: 4] overlaps the nibbles it shifts in, so bit
+    n of the IR is the top bit of nibble n of the word and IR[9:8] stay 0.
+    """
+    if opcode >> 8:
+        raise ValueError("IR[9:8] are never set, %03x can not be fetched" % opcode)
+    return sum((opcode >> n & 1) << (4 * n + 3) for n in range(8))
+
+
+def workloads(cycles=CYCLES):
+    """{name: image} of the benchmarked programs, long enough for cycles."""
+    opcodes = {text: opcode for opcode, text in read_assembly().items()}
+    length = cycles // MIN_CPI + 1
+    return {
+        # The fastest instruction, the fetch and CU states alone
+        "nop": [rtl_word(opcodes["nop"])] * length,
+        # An ALU operation in both halves of the CU ROM
+        "alu": [rtl_word(opcodes["opp a+b"])] * length,
+        # Every opcode the IR can hold, in turn
+        "sweep": [rtl_word(address & 0xFF) for address in range(length)],
+    }
+
+
+def model_results(programs, cycles=CYCLES):
+    """A result per workload and address mode from the Python model."""
+    results = []
+    for name, words in programs.items():
+        computer = Computer(words)
+        step = computer.step
+        instructions = 0
+
+        def counted_step():
+            nonlocal instructions
+            instructions += computer.cu_state == UPDATE_IR
+            step()
+
+        computer.step = counted_step
+        computer.run(cycles)
+        for address_bits in ADDRESS_BITS:
+            results.append(
+                result(
+                    name,
+                    address_bits,
+                    "rtl",
+                    computer.cycles_run,
+                    instructions,
+                    None,
+                    computer.stop_reason,
+                )
+            )
+    return results
+
+
+def load(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            "%s: unknown benchmark format %r" % (path, data.get("version"))
+        )
+    return data["results"]
+
+
+def save(path, results, **meta):
+    """Write results to path, keeping the ones there for other netlists or
+    programs so RTL and gate level runs end up in one file."""
+    path = Path(path)
+    merged = {}
+    if path.exists():
+        merged = {key(r): r for r in load(path)}
+    merged.update((key(r), r) for r in results)
+    data = {
+        "version": FORMAT_VERSION,
+        "updated": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "meta": meta,
+        "results": sorted(merged.values(), key=key),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def _change(new, old):
+    if new is None or not old:
+        return None
+    return new / old - 1
+
+
+def compare(
+    results, baseline, cpi_tolerance=CPI_TOLERANCE, speed_tolerance=SPEED_TOLERANCE
+):
+    """(rows, regressions), a row per result with its change on the baseline."""
+    previous = {key(r): r for r in baseline}
+    rows = []
+    regressions = []
+    for r in sorted(results, key=key):
+        old = previous.get(key(r))
+        row = dict(r, cpi_change=None, speed_change=None)
+        if r["reason"] in FAILED_REASONS:
+            regressions.append("%s: stopped by %s" % (_name(r), r["reason"]))
+        if old is not None:
+            row["cpi_change"] = _change(r["cpi"], old["cpi"])
+            row["speed_change"] = _change(
+                r["cycles_per_second"], old["cycles_per_second"]
+            )
+            if row["cpi_change"] is not None and row["cpi_change"] > cpi_tolerance:
+                regressions.append(
+                    "%s: CPI %.3f -> %.3f" % (_name(r), old["cpi"], r["cpi"])
+                )
+            if (
+                row["speed_change"] is not None
+                and -row["speed_change"] > speed_tolerance
+            ):
+                regressions.append(
+                    "%s: %.0f -> %.0f cycles/s"
+                    % (_name(r), old["cycles_per_second"], r["cycles_per_second"])
+                )
+        rows.append(row)
+    return rows, regressions
+
+
+def _name(r):
+    return "%s %dbit %s" % (r["program"], r["address_bits"], r["netlist"])
+
+
+def _percent(change):
+    return "" if change is None else "%+.1f%%" % (100 * change)
+
+
+def format_rows(rows):
+    lines = [
+        "%-30s %8s %8s %7s %8s %9s %10s %8s"
+        % ("program", "cycles", "instrs", "cpi", "", "cycles/s", "", "reason")
+    ]
+    for row in rows:
+        lines.append(
+            "%-30s %8d %8d %7s %8s %9s %10s %8s"
+            % (
+                _name(row),
+                row["cycles"],
+                row["instructions"],
+                "-" if row["cpi"] is None else "%.3f" % row["cpi"],
+                _percent(row["cpi_change"]),
+                (
+                    "-"
+                    if row["cycles_per_second"] is None
+                    else "%.0f" % row["cycles_per_second"]
+                ),
+                _percent(row["speed_change"]),
+                row["reason"],
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("results", nargs="?", default=RESULTS)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--cpi-tolerance", type=float, default=CPI_TOLERANCE)
+    parser.add_argument("--speed-tolerance", type=float, default=SPEED_TOLERANCE)
+    parser.add_argument(
+        "--model",
+        action="store_true",
+        help="run the workloads on the Python model instead of reading results",
+    )
+    parser.add_argument("--cycles", type=int, default=CYCLES, help="model budget")
+    args = parser.parse_args(argv)
+
+    if args.model:
+        results = model_results(workloads(args.cycles), args.cycles)
+    else:
+        results = load(args.results)
+    baseline = load(args.baseline) if Path(args.baseline).exists() else []
+    rows, regressions = compare(
+        results, baseline, args.cpi_tolerance, args.speed_tolerance
+    )
+    print(format_rows(rows))
+    if regressions:
+        print("\nregressions against %s:" % args.baseline)
+        for regression in regressions:
+            print("  " + regression)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Incremental build of the example programs.
+
+    python -m jrb16.build                 # every .j in example_programs/assembly
+    python -m jrb16.build primes.j -j 4
+
+Each program is keyed by a hash of its source, the instruction table
+(cu_flags.ts unless --cu-flags says otherwise) and the assembler version.
+Outputs are kept under that key in a cache directory, so only the programs
+whose key changed are assembled again, spread over a process pool.
+The .o (and with --binary the .img) next to each source is then updated if it
+differs from the cached one.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .assembler import ASSEMBLER_VERSION, CU_FLAGS, AssemblerError, assemble
+from .assembler import load_translation
+from .image import PROGRAM_DIR, format_raw
+
+CACHE_DIR = PROGRAM_DIR / ".build"
+
+
+def flags_digest(cu_flags=CU_FLAGS):
+    try:
+        with open(cu_flags, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        raise AssemblerError("No instruction table at %s" % cu_flags)
+
+
+def program_key(source, flags):
+    """The cache key for a program's source bytes and an instruction table
+    digest."""
+    h = hashlib.sha256()
+    h.update(b"assembler %d\n" % ASSEMBLER_VERSION)
+    h.update(flags.encode() + b"\n")
+    h.update(source)
+    return h.hexdigest()
+
+
+def _assemble(source, cu_flags, outputs):
+    # Runs in a worker process, the translation is loaded once per worker
+    try:
+        image = assemble(source.decode(), load_translation(cu_flags))
+    except AssemblerError as e:
+        return None, "%s: %s" % (e, e.text) if e.text else str(e)
+
+    for path in outputs:
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        if path.suffix == ".img":
+            image.save(tmp)
+        else:
+            with open(tmp, "w") as f:
+                f.write(format_raw(image.words))
+        os.replace(tmp, path)
+    return outputs, None
+
+
+def _install(cached, target):
+    if target.exists() and target.read_bytes() == cached.read_bytes():
+        return False
+    shutil.copyfile(cached, target)
+    return True
+
+
+def build(
+    sources,
+    cu_flags=CU_FLAGS,
+    cache_dir=CACHE_DIR,
+    jobs=None,
+    binary=False,
+    install=True,
+):
+    """Assemble the sources that are not cached yet.
+
+    Returns one (source, state, message) per source, state is "cached",
+    "built" or "failed".
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    flags = flags_digest(cu_flags)
+    suffixes = [".o", ".img"] if binary else [".o"]
+
+    results = {}
+    pending = {}
+    for source in map(Path, sources):
+        text = source.read_bytes()
+        key = program_key(text, flags)
+        outputs = [cache_dir / (key + suffix) for suffix in suffixes]
+        if all(path.exists() for path in outputs):
+            results[source] = ("cached", outputs, None)
+        else:
+            pending[source] = (text, outputs)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                source: pool.submit(_assemble, text, str(cu_flags), outputs)
+                for source, (text, outputs) in pending.items()
+            }
+            for source, future in futures.items():
+                outputs, error = future.result()
+                if error is None:
+                    results[source] = ("built", outputs, None)
+                else:
+                    results[source] = ("failed", [], error)
+
+    report = []
+    for source in map(Path, sources):
+        state, outputs, message = results[source]
+        if install:
+            for cached in outputs:
+                target = source.with_suffix(Path(cached).suffix)
+                if _install(Path(cached), target):
+                    message = "updated %s" % target.name
+        report.append((source, state, message))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("sources", nargs="*", help="programs to build")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes")
+    parser.add_argument("--cu-flags", default=CU_FLAGS, help="instruction table to use")
+    parser.add_argument("--cache", default=CACHE_DIR, help="cache directory")
+    parser.add_argument(
+        "--binary", "-b", action="store_true", help="also write .img images"
+    )
+    parser.add_argument(
+        "--no-install",
+        dest="install",
+        action="store_false",
+        help="only fill the cache, leave the files next to the sources alone",
+    )
+    args = parser.parse_args(argv)
+
+    sources = args.sources or sorted(PROGRAM_DIR.glob("*.j"))
+    try:
+        report = build(
+            sources, args.cu_flags, args.cache, args.jobs, args.binary, args.install
+        )
+    except AssemblerError as e:
+        print(e)
+        return 1
+
+    counts = {"cached": 0, "built": 0, "failed": 0}
+    for source, state, message in report:
+        counts[state] += 1
+        if state != "cached" or message:
+            print("%-8s %s%s" % (state, source, " (%s)" % message if message else ""))
+    print("%(built)d built, %(cached)d cached, %(failed)d failed" % counts)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# Mirrors src/consts.sv, keep the two in sync
+FLAGS_LEN = 28
+
+AI_BIT = 0
+BI_BIT = 1
+CI_BIT = 2
+DI_BIT = 3
+EI_BIT = 4
+FI_BIT = 5
+GI_BIT = 6
+HI_BIT = 7
+RAMI_BIT = 8
+MARI_BIT = 9
+MPAGEI_BIT = 10
+OI_BIT = 11
+AO_BIT = 12
+BO_BIT = 13
+CO_BIT = 14
+DO_BIT = 15
+EO_BIT = 16
+FO_BIT = 17
+GO_BIT = 18
+HO_BIT = 19
+ALUO_BIT = 20
+ROMO_BIT = 21
+RAMO_BIT = 22
+JMPO_BIT = 23
+IO_BIT = 24
+PCC_BIT = 25
+HALT_BIT = 26
+AC_BIT = 27
+
+FLAG_NAMES = [
+    "AI",
+    "BI",
+    "CI",
+    "DI",
+    "EI",
+    "FI",
+    "GI",
+    "HI",
+    "RAMI",
+    "MARI",
+    "MPAGEI",
+    "OI",
+    "AO",
+    "BO",
+    "CO",
+    "DO",
+    "EO",
+    "FO",
+    "GO",
+    "HO",
+    "ALUO",
+    "ROMO",
+    "RAMO",
+    "JMPO",
+    "IO",
+    "PCC",
+    "HALT",
+    "AC",
+]
+
+UPDATE_IR_FLAGS = 1 << PCC_BIT | 1 << ROMO_BIT
+
+# src/cu.sv declares its ROMs as logic [26:0], so AC_BIT never reaches the CU
+CU_ROM_WIDTH = 27
+
+# Special ALU instructions, see src/alu.sv
+CLR_CMP_INS = 0xB9
+FLAGS_OFF_INS = 0xBA
+FLAGS_ON_INS = 0xBB
+CARRY_OFF_INS = 0xBC
+CARRY_ON_INS = 0xBD
+SIGN_OFF_INS = 0xBE
+SIGN_ON_INS = 0xBF
+
+REGISTER_NAMES = "abcdefgh"
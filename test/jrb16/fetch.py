@@ -0,0 +1,328 @@
+"""What-if model of an instruction fetch buffer in front of the ROM QSPI.
+
+    python -m jrb16.fetch                                # every example program
+    python -m jrb16.fetch primes.o --line-words 1 4 --lines 2 8 --prefetch
+    python -m jrb16.fetch --trace traces/primes.csv      # from QSPI_TRACE
+
+A trace is the (pc, word) of every ROM word a program reads, in order. The
+example programs are still jrb8 encoded, so by default they run on
+HardwareVM, which reads an opcode and its operand bytes as separate words.
+Each opcode is traced as the 10 bit opcode with the same mnemonic, like
+jrb16.hazards matches them, or as nop when there is none, and operand words
+as None. --model runs 10 bit images on the cycle accurate model instead,
+and --trace takes the ROM reads of a QSPI_TRACE log.
+
+A trace is replayed against each buffer configuration with the fetch made
+blocking: a word is used once it is in the buffer, and a miss reads a whole
+line in one QSPI transaction. An opcode then costs its CU cycles from
+jrb16.timing, an operand nothing more. Projected cycles are compared with
+no buffer at all, i.e. one 57 cycle transaction per word.
+"""
+
+import argparse
+import csv
+import itertools
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+from .consts import HALT_BIT
+from .image import PROGRAM_DIR, load_image
+from .isa import read_assembly
+from .mix import STEPS
+from .model import FETCH_CYCLES, ROM_BASE, UPDATE_IR, Computer, ModelError
+from .timing import static_timing
+from .vm import HardwareVM, read_cu_flags
+
+NOP = 0x000
+
+# Clock cycles of a quad read without its data: IDLE, then command, address
+# and dummy nibbles at two edges each
+TRANSACTION_CYCLES = 1 + 2 * (8 + 8 + 4)
+# Eight nibbles per 32 bit word
+WORD_CYCLES = 2 * 8
+
+assert TRANSACTION_CYCLES + WORD_CYCLES == FETCH_CYCLES
+
+
+def line_cycles(line_words):
+    """Clock cycles to read a line of line_words words in one transaction."""
+    return TRANSACTION_CYCLES + WORD_CYCLES * line_words
+
+
+def model_trace(words, cycles=5000):
+    """The (pc, word) of every instruction the Python model starts, until it
+    halts or the budget runs out.
+
+    Raises ModelError if the program runs past its end or the model stops
+    with an error, what was traced so far would not be the program's.
+    """
+    computer = Computer(words)
+    trace = []
+    for cycle in range(cycles):
+        if computer.flags >> HALT_BIT & 1:
+            break
+        if computer.cu_state == UPDATE_IR:
+            pc = computer.pc
+            if pc >= len(words):
+                raise ModelError("ran past the end of the image at cycle %d" % cycle)
+            trace.append((pc, words[pc]))
+        try:
+            computer.step()
+        except ModelError as e:
+            raise ModelError("error at cycle %d: %s" % (cycle, e))
+    return trace
+
+
+def vm_trace(words, steps=STEPS, cu_flags=None, mnemonics=None):
+    """The (pc, word) of every ROM word HardwareVM reads running a jrb8
+    image, until it halts, runs off the end or the budget runs out.
+
+    Opcodes become the 10 bit opcode of the same mnemonic, or NOP if there
+    is none, and operand words None.
+    """
+    cu_flags = cu_flags or read_cu_flags()
+    jrb8 = {opcode: name for name, opcode in cu_flags[0].items()}
+    opcodes = {text: opcode for opcode, text in (mnemonics or read_assembly()).items()}
+
+    vm = HardwareVM(words, cu_flags)
+    pcs = []
+    fetch = vm.fetch
+
+    def traced_fetch():
+        pcs.append(vm.pc)
+        return fetch()
+
+    vm.fetch = traced_fetch
+    trace = []
+    for _ in range(steps):
+        start = len(pcs)
+        running = vm.step()
+        for i, pc in enumerate(pcs[start:]):
+            word = None
+            if i == 0:
+                word = opcodes.get(jrb8.get(vm.rom[pc]), NOP)
+            trace.append((pc, word))
+        if not running or vm.pc >= len(vm.rom):
+            break
+    return trace
+
+
+def qspi_trace(path, rom_base=ROM_BASE):
+    """The (pc, word) of every ROM quad read in a QSPI_TRACE CSV."""
+    trace = []
+    with open(path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            address = int(row["address"], 16)
+            if int(row["command"], 16) == 0xEB and address >= rom_base:
+                trace.append((address - rom_base, int(row["data"], 16)))
+    return trace
+
+
+class FetchBuffer(object):
+    """Fully associative, LRU replaced lines of consecutive ROM words.
+
+    With prefetch the next line is requested as soon as a line is used and
+    the bus is free. Branch target entries hold single words for the PCs
+    that were reached by a jump, so a taken branch into a loop does not have
+    to wait for a line fill.
+    """
+
+    def __init__(self, line_words=1, lines=1, prefetch=False, branch_targets=0):
+        self.line_words = line_words
+        self.lines = lines
+        self.prefetch = prefetch
+        self.branch_targets = branch_targets
+
+    @property
+    def name(self):
+        name = "%dx%d" % (self.lines, self.line_words)
+        if self.prefetch:
+            name += " +prefetch"
+        if self.branch_targets:
+            name += " +btb%d" % self.branch_targets
+        return name
+
+    def replay(self, trace, execute_cycles):
+        """Run a trace and return its statistics.
+
+        execute_cycles maps a traced word to the cycles it needs once
+        fetched.
+        """
+        fill = line_cycles(self.line_words)
+        # line -> cycle its data is available
+        buffer = OrderedDict()
+        targets = OrderedDict()
+        now = 0
+        bus_free = 0
+        hits = misses = late = target_hits = 0
+        previous = None
+
+        for pc, word in trace:
+            line = pc // self.line_words
+            jumped = previous is not None and pc != previous + 1
+            previous = pc
+
+            if jumped and pc in targets:
+                targets.move_to_end(pc)
+                target_hits += 1
+                hits += 1
+            elif line in buffer:
+                buffer.move_to_end(line)
+                if buffer[line] > now:
+                    # Prefetched but still on its way
+                    late += 1
+                    now = buffer[line]
+                hits += 1
+            else:
+                misses += 1
+                start = max(now, bus_free)
+                bus_free = start + fill
+                now = bus_free
+                self._insert(buffer, line, now, self.lines)
+
+            if jumped and self.branch_targets:
+                targets[pc] = True
+                targets.move_to_end(pc)
+                while len(targets) > self.branch_targets:
+                    targets.popitem(last=False)
+
+            if self.prefetch and line + 1 not in buffer:
+                start = max(now, bus_free)
+                bus_free = start + fill
+                # The line in use was touched last, so this only evicts it
+                # from a single line buffer
+                self._insert(buffer, line + 1, bus_free, self.lines)
+
+            now += execute_cycles(word)
+
+        accesses = hits + misses
+        return {
+            "buffer": self.name,
+            "accesses": accesses,
+            "hits": hits,
+            "late_prefetches": late,
+            "branch_target_hits": target_hits,
+            "hit_rate": hits / accesses if accesses else 0,
+            "cycles": now,
+        }
+
+    @staticmethod
+    def _insert(buffer, line, ready, capacity):
+        buffer[line] = ready
+        buffer.move_to_end(line)
+        while len(buffer) > capacity:
+            buffer.popitem(last=False)
+
+
+def unbuffered_cycles(trace, execute_cycles):
+    """Cycles with a blocking single word fetch for every word."""
+    return sum(FETCH_CYCLES + execute_cycles(word) for _, word in trace)
+
+
+def sweep(trace, configurations, execute_cycles):
+    baseline = unbuffered_cycles(trace, execute_cycles)
+    results = []
+    for buffer in configurations:
+        result = buffer.replay(trace, execute_cycles)
+        result["speedup"] = baseline / result["cycles"] if result["cycles"] else 0
+        results.append(result)
+    return baseline, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("programs", nargs="*", help="images to trace")
+    parser.add_argument(
+        "--trace", action="append", default=[], help="QSPI_TRACE CSV to replay"
+    )
+    parser.add_argument(
+        "--model", action="store_true", help="run 10 bit images on the model"
+    )
+    parser.add_argument("--cycles", type=int, default=5000, help="model budget")
+    parser.add_argument("--steps", type=int, default=STEPS, help="VM step budget")
+    parser.add_argument("--line-words", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--prefetch", action="store_true", help="also try next line prefetch"
+    )
+    parser.add_argument(
+        "--branch-targets",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="branch target entries to try",
+    )
+    parser.add_argument("--csv", action="store_true", help="print CSV instead")
+    args = parser.parse_args(argv)
+
+    timing = static_timing()
+
+    def execute_cycles(word):
+        return 0 if word is None else timing[word & 0x3FF].cycles
+
+    traces = []
+    for path in args.trace:
+        traces.append((Path(path).stem, qspi_trace(path)))
+    programs = args.programs
+    if not programs and not traces:
+        programs = sorted(PROGRAM_DIR.glob("*.o"))
+    for path in programs:
+        words = load_image(path)
+        if not args.model:
+            traces.append((Path(path).stem, vm_trace(words, args.steps)))
+            continue
+        try:
+            trace = model_trace(words, args.cycles)
+        except ModelError as e:
+            print("%s: not traced, %s" % (Path(path).stem, e), file=sys.stderr)
+            continue
+        traces.append((Path(path).stem, trace))
+    if not traces:
+        print("nothing to replay", file=sys.stderr)
+        return 1
+
+    configurations = [
+        FetchBuffer(line_words, lines, prefetch, branch_targets)
+        for line_words, lines, prefetch, branch_targets in itertools.product(
+            args.line_words,
+            args.lines,
+            [False, True] if args.prefetch else [False],
+            args.branch_targets,
+        )
+    ]
+
+    writer = None
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(
+            ["program", "buffer", "accesses", "hit_rate", "cycles", "speedup"]
+        )
+    for name, trace in traces:
+        baseline, results = sweep(trace, configurations, execute_cycles)
+        if writer is not None:
+            for r in results:
+                writer.writerow(
+                    [
+                        name,
+                        r["buffer"],
+                        r["accesses"],
+                        "%.4f" % r["hit_rate"],
+                        r["cycles"],
+                        "%.3f" % r["speedup"],
+                    ]
+                )
+            continue
+        print("%s: %d words read, %d cycles unbuffered" % (name, len(trace), baseline))
+        for r in sorted(results, key=lambda r: r["cycles"]):
+            print(
+                "  %-22s hit rate %5.1f%%  %8d cycles  %.2fx"
+                % (r["buffer"], 100 * r["hit_rate"], r["cycles"], r["speedup"])
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Dead microcycles and hazards in the CU ROMs, weighted by how often they run.
+
+    python -m jrb16.hazards                  # weighted by the example programs
+    python -m jrb16.hazards --csv > hazards.csv
+
+Each opcode runs its cu_rom word in FLAGS_1/FLAGS_1_EVENTS and its cu_rom_2
+word in FLAGS_2/FLAGS_2_EVENTS, two cycles each plus the ALU states. The
+findings are:
+
+    empty_phase        a phase whose flag word is all zero, its two cycles
+                       only let FLAGS_2_EVENTS step the PC
+    foldable           the opcode's work fits in FLAGS_1, with AC and PCC set
+                       it would skip FLAGS_2 altogether, once the CU ROMs
+                       are wide enough for AC
+    contention         more than one output enable on the databus, all but
+                       the first in src/registers.sv's priority are lost
+    jmpo_in_phase_1    JMPO in cu_rom, pcin is only loaded in FLAGS_2_EVENTS
+    ac_truncated       AC set in cu_rom, which the 27 bit CU ROM drops
+    ac_skips_phase_2   AC set next to a cu_rom_2 word that is needed, if AC
+                       reached the CU that word would never run
+
+Cycles saved are per run of the opcode, and are multiplied by how often the
+example programs use it. Those are still jrb8 images, so they are counted by
+jrb16.mix on HardwareVM and every jrb8 mnemonic is credited to the 10 bit
+opcode with the same text. The few jrb8 mnemonics without one are dropped.
+"""
+
+import argparse
+import csv
+import sys
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from .consts import CU_ROM_WIDTH, FLAG_NAMES
+from .image import PROGRAM_DIR, load_image
+from .isa import read_assembly
+from .microcode import Microcode
+from .mix import STEPS, program_mix
+from .vm import read_cu_flags
+
+Finding = namedtuple("Finding", "opcode mnemonic kind phase detail cycles")
+
+# FLAGS_x and FLAGS_x_EVENTS
+PHASE_CYCLES = 2
+
+# The databus sources, in src/registers.sv priority order
+BUS_DRIVERS = ("ALUO", "AO", "BO", "CO", "DO", "EO", "FO", "GO", "HO")
+BUS_DRIVERS += ("ROMO", "RAMO", "IO")
+REGISTER_OUTPUTS = BUS_DRIVERS[1:9]
+
+
+def flags_set(word):
+    return [name for name in FLAG_NAMES if word[name]]
+
+
+def bus_contention(flags):
+    """(winner, losers) of the databus enables, losers is [] if there is no
+    contention and winner None if nothing drives the bus.
+
+    With ALUO set the first register output is the ALU's b operand and not a
+    bus source.
+    """
+    drivers = [name for name in BUS_DRIVERS if name in flags]
+    if "ALUO" in drivers:
+        registers = [name for name in drivers if name in REGISTER_OUTPUTS]
+        if registers:
+            drivers.remove(registers[0])
+    if not drivers:
+        return None, []
+    return drivers[0], drivers[1:]
+
+
+def analyze_opcode(opcode, mnemonic, word_1, word_2):
+    findings = []
+    flags_1 = flags_set(word_1)
+    flags_2 = flags_set(word_2)
+
+    def add(kind, phase, detail="", cycles=0):
+        findings.append(Finding(opcode, mnemonic, kind, phase, detail, cycles))
+
+    for phase, flags in ((1, flags_1), (2, flags_2)):
+        winner, lost = bus_contention(flags)
+        if lost:
+            add("contention", phase, "%s over %s" % (winner, "|".join(lost)))
+
+    if "JMPO" in flags_1:
+        add("jmpo_in_phase_1", 1, "|".join(flags_1))
+
+    if "AC" in flags_1 and FLAG_NAMES.index("AC") >= CU_ROM_WIDTH:
+        add("ac_truncated", 1)
+        if flags_2:
+            add("ac_skips_phase_2", 2, "|".join(flags_2))
+
+    if not flags_1:
+        # Nothing happens in FLAGS_1, the work of FLAGS_2 could move up
+        add("empty_phase", 1, "", PHASE_CYCLES)
+    work_2 = [name for name in flags_2 if name != "PCC"]
+    if not work_2 and "JMPO" not in flags_1:
+        if flags_1:
+            add("foldable", 2, "|".join(flags_1), PHASE_CYCLES)
+        else:
+            add("empty_phase", 2, "", 0)
+    return findings
+
+
+def analyze(microcode=None, mnemonics=None):
+    """Every Finding for the opcodes that have a mnemonic."""
+    microcode = microcode or Microcode.load()
+    mnemonics = mnemonics or read_assembly()
+    findings = []
+    for opcode, text in sorted(mnemonics.items()):
+        findings += analyze_opcode(
+            opcode, text, microcode.cu[opcode], microcode.cu_2[opcode]
+        )
+    return findings
+
+
+def opcode_counts(paths, steps=STEPS, mnemonics=None):
+    """Static and dynamic counts of the 10 bit opcodes over jrb8 images,
+    matched up by mnemonic."""
+    cu_flags = read_cu_flags()
+    jrb8 = {opcode: name for name, opcode in cu_flags[0].items()}
+    opcodes = {text: opcode for opcode, text in (mnemonics or read_assembly()).items()}
+
+    static = Counter()
+    dynamic = Counter()
+    for path in paths:
+        program = program_mix(Path(path).stem, load_image(path), cu_flags, steps)
+        for kind, counts in (("static", static), ("dynamic", dynamic)):
+            for opcode, count in program[kind].items():
+                opcode = opcodes.get(jrb8.get(opcode))
+                if opcode is not None:
+                    counts[opcode] += count
+    return static, dynamic
+
+
+def savings(findings, static, dynamic):
+    """Cycles saved per finding kind, per run and weighted by frequency."""
+    totals = {}
+    for finding in findings:
+        total = totals.setdefault(
+            finding.kind,
+            {"opcodes": 0, "cycles": 0, "static": 0, "dynamic": 0},
+        )
+        total["opcodes"] += 1
+        total["cycles"] += finding.cycles
+        total["static"] += finding.cycles * static[finding.opcode]
+        total["dynamic"] += finding.cycles * dynamic[finding.opcode]
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "programs", nargs="*", help="images to weight by, the examples by default"
+    )
+    parser.add_argument("--steps", type=int, default=STEPS, help="VM step budget")
+    parser.add_argument("--csv", action="store_true", help="one row per finding")
+    args = parser.parse_args(argv)
+
+    programs = args.programs or sorted(PROGRAM_DIR.glob("*.o"))
+    static, dynamic = opcode_counts(programs, args.steps)
+    findings = analyze()
+
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(Finding._fields + ("static", "dynamic"))
+        for finding in findings:
+            writer.writerow(
+                ("%03x" % finding.opcode,)
+                + finding[1:]
+                + (static[finding.opcode], dynamic[finding.opcode])
+            )
+        return 0
+
+    totals = savings(findings, static, dynamic)
+    print("%d programs, %d instructions run" % (len(programs), sum(dynamic.values())))
+    print(
+        "%-18s %8s %8s %10s %10s"
+        % ("finding", "opcodes", "cycles", "static", "dynamic")
+    )
+    for kind, total in sorted(totals.items(), key=lambda item: -item[1]["dynamic"]):
+        print(
+            "%-18s %8d %8d %10d %10d"
+            % (
+                kind,
+                total["opcodes"],
+                total["cycles"],
+                total["static"],
+                total["dynamic"],
+            )
+        )
+    hot = sorted(
+        (f for f in findings if f.cycles and dynamic[f.opcode]),
+        key=lambda f: -f.cycles * dynamic[f.opcode],
+    )
+    if hot:
+        print("\nmost cycles to gain:")
+        for f in hot[:10]:
+            print(
+                "  %03x %-24s %-12s phase %d  %d x %d"
+                % (f.opcode, f.mnemonic, f.kind, f.phase, f.cycles, dynamic[f.opcode])
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
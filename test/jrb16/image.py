@@ -0,0 +1,159 @@
+import array
+import mmap
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+from .memory import TYPECODES, Memory
+
+PROGRAM_DIR = Path(__file__).resolve().parents[2] / "example_programs" / "assembly"
+
+# Binary image container, all fields little endian:
+#   header   magic, version, word width in bits, address width in bits,
+#            entry point, number of words, number of symbols, CRC32 of
+#            everything after the header
+#   words    the ROM contents, word width / 8 bytes each
+#   symbols  address (u32), name length (u8), name (UTF-8) per label
+IMAGE_MAGIC = b"JRBI"
+IMAGE_VERSION = 1
+HEADER = struct.Struct("<4sHBBIIII8x")
+SYMBOL = struct.Struct("<IB")
+
+
+class Image(object):
+    """A program as loaded into the ROM, with its entry point and labels."""
+
+    def __init__(self, words, entry=0, address_width=16, symbols=None, width=32):
+        if not isinstance(words, Memory):
+            words = Memory.from_words(words, width)
+        self.words = words
+        self.width = words.width
+        self.entry = entry
+        self.address_width = address_width
+        self.symbols = dict(symbols or {})
+
+    def to_bytes(self):
+        words = self.words[:]
+        if sys.byteorder != "little":
+            words = _byteswapped(words, self.width)
+
+        body = bytearray(words.tobytes())
+        for name, address in sorted(self.symbols.items(), key=lambda s: s[1]):
+            encoded = name.encode("utf-8")
+            body += SYMBOL.pack(address, len(encoded)) + encoded
+
+        header = HEADER.pack(
+            IMAGE_MAGIC,
+            IMAGE_VERSION,
+            self.width,
+            self.address_width,
+            self.entry,
+            len(self.words),
+            len(self.symbols),
+            zlib.crc32(body),
+        )
+        return header + bytes(body)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    def label(self, address):
+        """The closest label at or before address, as label+offset."""
+        best = None
+        for name, value in self.symbols.items():
+            if value <= address and (best is None or value > best[1]):
+                best = (name, value)
+        if best is None:
+            return None
+        return best[0] if best[1] == address else "%s+%d" % best
+
+
+def _byteswapped(words, width):
+    swapped = array.array(TYPECODES[width], words.tolist())
+    swapped.byteswap()
+    return swapped
+
+
+def parse_image(data):
+    """Parse a binary image, the words are a zero-copy view of data."""
+    data = memoryview(data)
+    if len(data) < HEADER.size:
+        raise ValueError("image is too short for its header")
+
+    magic, version, width, address_width, entry, count, symbol_count, crc = (
+        HEADER.unpack_from(data)
+    )
+    if magic != IMAGE_MAGIC:
+        raise ValueError("not a binary image")
+    if version != IMAGE_VERSION:
+        raise ValueError("unsupported image version %d" % version)
+    if width not in TYPECODES:
+        raise ValueError("unsupported word width %d" % width)
+    if zlib.crc32(data[HEADER.size :]) != crc:
+        raise ValueError("image CRC does not match")
+
+    end = HEADER.size + count * width // 8
+    if end > len(data):
+        raise ValueError("image is truncated")
+    if sys.byteorder == "little":
+        words = Memory.from_buffer(data[HEADER.size : end], width)
+    else:
+        view = data[HEADER.size : end].cast(TYPECODES[width])
+        words = Memory.from_words(_byteswapped(view, width), width)
+
+    symbols = {}
+    offset = end
+    for _ in range(symbol_count):
+        address, length = SYMBOL.unpack_from(data, offset)
+        offset += SYMBOL.size
+        symbols[bytes(data[offset : offset + length]).decode("utf-8")] = address
+        offset += length
+
+    return Image(words, entry, address_width, symbols)
+
+
+def read_image(path):
+    """Map a binary image from disk, nothing is copied until it is written."""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return parse_image(data)
+
+
+def parse_raw(text):
+    """Parse a Logisim style "v2.0 raw" image into a list of ROM entries."""
+    lines = text.splitlines()
+    assert lines and lines[0].strip() == "v2.0 raw", "not a v2.0 raw image"
+    return [int(x, 16) for line in lines[1:] for x in line.split()]
+
+
+def format_raw(words):
+    """ROM entries as a Logisim style "v2.0 raw" image."""
+    return "v2.0 raw\n" + " ".join("%02x" % x for x in words) + "\n"
+
+
+def write_raw(f, words, header=True, chunk=4096):
+    """Write a "v2.0 raw" image to a file a chunk of entries at a time."""
+    if header:
+        f.write("v2.0 raw\n")
+    for start in range(0, len(words), chunk):
+        if start:
+            f.write(" ")
+        f.write(" ".join("%02x" % x for x in words[start : start + chunk]))
+    f.write("\n")
+
+
+def load_program(path):
+    """Load either image format as an Image, raw images have no labels."""
+    with open(path, "rb") as f:
+        magic = f.read(len(IMAGE_MAGIC))
+    if magic == IMAGE_MAGIC:
+        return read_image(path)
+    with open(path, "r") as f:
+        return Image(parse_raw(f.read()))
+
+
+def load_image(path):
+    """The ROM contents of either image format."""
+    return load_program(path).words
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+ASSEMBLY_TABLE = Path(__file__).resolve().parents[1] / "assembly"
+
+
+def read_assembly(path=ASSEMBLY_TABLE):
+    """Read the tab separated mnemonic/opcode table into {opcode: mnemonic}."""
+    mnemonics = {}
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 2 or not parts[0] or not parts[1]:
+                continue
+            mnemonics[int(parts[1], 16)] = parts[0]
+    return mnemonics
+
+
+_mnemonics = None
+
+
+def mnemonic(opcode):
+    global _mnemonics
+    if _mnemonics is None:
+        _mnemonics = read_assembly()
+    return _mnemonics.get(opcode, "??? %03x" % opcode)
@@ -0,0 +1,50 @@
+"""Truth table of the jump conditions, for every jump opcode and flag state.
+
+    table = truth_table()            # {opcode: (taken for each flag state)}
+    z, c, o, s = flag_state(5)       # flag state 5 is z and o set
+
+A flag state is a 4 bit number with z, c, o and s from bit 0 up. Whether a
+jump is taken comes from the low four bits of its jmp_rom.mem entry, which
+select one of the flags[] conditions in src/jmp.sv, bit 4 makes the target
+relative to pcin.
+"""
+
+from .isa import read_assembly
+from .model import JMP_CONDITIONS, jump_target
+from .rom import load_roms
+
+FLAG_STATES = 16
+
+
+def flag_state(state):
+    """(z, c, o, s) of a flag state number."""
+    return state & 1, state >> 1 & 1, state >> 2 & 1, state >> 3 & 1
+
+
+def jump_opcodes():
+    """Every opcode whose mnemonic is a jmp or jmpr, in order."""
+    return sorted(
+        opcode
+        for opcode, text in read_assembly().items()
+        if text.split(" ")[0] in ("jmp", "jmpr")
+    )
+
+
+def taken(val, state):
+    """Whether jmp.sv raises pcoe for a jmp_rom entry in a flag state."""
+    z, c, o, s = flag_state(state)
+    return bool(JMP_CONDITIONS[val & 0xF](z, o, c, s))
+
+
+def target(val, pcin, databus):
+    """pcout for a taken jump, as src/jmp.sv computes it."""
+    return jump_target(val, pcin, databus & 0xFFFF)
+
+
+def truth_table(roms=None):
+    """{opcode: tuple of taken, one per flag state} for every jump opcode."""
+    roms = roms or load_roms()
+    return {
+        opcode: tuple(taken(roms.jmp[opcode], state) for state in range(FLAG_STATES))
+        for opcode in jump_opcodes()
+    }
@@ -0,0 +1,181 @@
+import array
+import mmap
+
+# Item types for memoryview.cast(), by word width in bits
+TYPECODES = {8: "B", 16: "H", 32: "I", 64: "Q"}
+
+# 256 words, one mpage of the {mpage, mar} address space
+PAGE_BITS = 8
+PAGE_WORDS = 1 << PAGE_BITS
+
+# Buffers from this size up are anonymous mmaps, the OS only hands out the
+# pages that are actually touched
+MMAP_THRESHOLD = 1 << 20
+
+# Largest block written at once by fill(), keeps the temporary small
+FILL_CHUNK = 1 << 20
+
+
+class Memory(object):
+    """Word addressed memory backed by a bytearray or an anonymous mmap.
+
+    Indexing with an int reads or writes a single word, slicing returns a
+    memoryview into the buffer without copying. Pages written since the last
+    reset() are tracked, so reset() and snapshot() only touch those.
+
+    With a non-zero fill value a page is only filled in the buffer once it is
+    written or sliced, until then it reads as the fill value. Untouched pages
+    of an mmap never cost any memory that way.
+    """
+
+    def __init__(self, words, width=32, fill=0, use_mmap=None):
+        assert width in TYPECODES, "unsupported word width %d" % width
+        self.width = width
+        self.fill_value = fill
+
+        nbytes = words * width // 8
+        if use_mmap is None:
+            use_mmap = nbytes >= MMAP_THRESHOLD
+        self._buffer = mmap.mmap(-1, nbytes) if use_mmap else bytearray(nbytes)
+        self.words = memoryview(self._buffer).cast(TYPECODES[width])
+        self.dirty = set()
+
+        # Pages that hold their contents in the buffer, None when all do. A
+        # fresh buffer is all zeroes already.
+        self.present = set() if fill else None
+
+    @classmethod
+    def from_words(cls, values, width=32, **kwargs):
+        memory = cls(len(values), width, **kwargs)
+        memory.load(values)
+        memory.dirty.clear()
+        return memory
+
+    @classmethod
+    def from_buffer(cls, buffer, width=32):
+        """Use an existing buffer, e.g. a mapped file, without copying it."""
+        memory = cls.__new__(cls)
+        memory.width = width
+        memory.fill_value = 0
+        memory._buffer = buffer
+        memory.words = memoryview(buffer).cast(TYPECODES[width])
+        memory.dirty = set()
+        memory.present = None
+        return memory
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self))
+            self._materialize(start, stop)
+        elif self.present is not None:
+            if index % len(self) >> PAGE_BITS not in self.present:
+                return self.fill_value
+        return self.words[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            assert step == 1, "only contiguous slices can be written"
+            self.load(value, start)
+            return
+        index %= len(self)
+        self._materialize(index, index + 1)
+        self.words[index] = value
+        self.dirty.add(index >> PAGE_BITS)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, Memory):
+            return self.tolist() == other.tolist()
+        return self.tolist() == list(other)
+
+    def tolist(self):
+        if self.present is None:
+            return self.words.tolist()
+        values = []
+        for start in range(0, len(self), PAGE_WORDS):
+            stop = min(start + PAGE_WORDS, len(self))
+            if start >> PAGE_BITS in self.present:
+                values += self.words[start:stop].tolist()
+            else:
+                values += [self.fill_value] * (stop - start)
+        return values
+
+    def load(self, values, offset=0):
+        """Write a run of words starting at offset."""
+        if not isinstance(values, memoryview):
+            values = memoryview(array.array(TYPECODES[self.width], values))
+        end = offset + len(values)
+        self._materialize(offset, end)
+        self.words[offset:end] = values
+        self._mark(offset, end)
+
+    def fill(self, value, start=0, stop=None):
+        """Set every word in [start, stop) to value."""
+        stop = len(self) if stop is None else stop
+        self._materialize(start, stop)
+        self._fill(value, start, stop)
+        self._mark(start, stop)
+
+    def _fill(self, value, start, stop):
+        pattern = array.array(TYPECODES[self.width], [value]).tobytes()
+        chunk = pattern * min(FILL_CHUNK, stop - start)
+        data = memoryview(self._buffer)
+        itemsize = len(pattern)
+        for offset in range(start, stop, FILL_CHUNK):
+            count = min(FILL_CHUNK, stop - offset)
+            begin = offset * itemsize
+            data[begin : begin + count * itemsize] = chunk[: count * itemsize]
+        data.release()
+
+    def reset(self):
+        """Put the fill value back in every page written since the last reset."""
+        if self.present is not None:
+            # They read as the fill value again without writing anything
+            self.present -= self.dirty
+        else:
+            for page in self.dirty:
+                start = page << PAGE_BITS
+                self._fill(self.fill_value, start, min(start + PAGE_WORDS, len(self)))
+        self.dirty.clear()
+
+    def snapshot(self):
+        """The contents of every dirty page, restore() puts them back."""
+        pages = {}
+        for page in sorted(self.dirty):
+            start = page << PAGE_BITS
+            pages[page] = self.words[start : start + PAGE_WORDS].tobytes()
+        return pages
+
+    def restore(self, pages):
+        self.reset()
+        data = memoryview(self._buffer)
+        itemsize = self.width // 8
+        for page, contents in pages.items():
+            begin = (page << PAGE_BITS) * itemsize
+            data[begin : begin + len(contents)] = contents
+            self.dirty.add(page)
+            if self.present is not None:
+                self.present.add(page)
+        data.release()
+
+    def _materialize(self, start, stop):
+        """Fill the pages in [start, stop) that only exist as the fill value."""
+        if self.present is None or stop <= start:
+            return
+        for page in range(start >> PAGE_BITS, ((stop - 1) >> PAGE_BITS) + 1):
+            if page not in self.present:
+                first = page << PAGE_BITS
+                self._fill(self.fill_value, first, min(first + PAGE_WORDS, len(self)))
+                self.present.add(page)
+
+    def _mark(self, start, stop):
+        if stop > start:
+            first = start >> PAGE_BITS
+            last = (stop - 1) >> PAGE_BITS
+            self.dirty.update(range(first, last + 1))
@@ -0,0 +1,332 @@
+"""The microcode ROMs as NumPy arrays with named fields.
+
+    python -m jrb16.microcode table > ../rom/microcode.csv
+    python -m jrb16.microcode diff old_rom/ ../rom/
+    python -m jrb16.microcode build ../rom/microcode.csv --out ../rom/
+    python -m jrb16.microcode check
+
+Every ROM decodes to a structured array with one entry per opcode:
+
+    cu, cu_2  one bool field per CU flag, AI to AC as in src/consts.sv
+    alu       za, ia, zb, ib, inv, po, carry and cselect, see src/alu.sv
+    jmp       condition, the flags[] select of src/jmp.sv, and relative
+
+rom/microcode.csv is the source of truth the .mem files are built from, one
+row per opcode with the fields that are set in each ROM, e.g.
+
+    opcode,mnemonic,cu,cu_2,alu,jmp
+    0eb,opp a+b,BI|AO|ALUO,,carry,
+
+diff and check accept either a ROM directory or a table.
+"""
+
+import argparse
+import csv
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from .consts import FLAG_NAMES, FLAGS_LEN
+from .isa import mnemonic
+from .rom import ROM_DEPTH, ROM_DIR, Roms, read_mem
+
+TABLE = ROM_DIR / "microcode.csv"
+
+ROMS = ("cu", "cu_2", "alu", "jmp")
+ROM_FILES = {
+    "cu": "cu_rom.mem",
+    "cu_2": "cu_rom_2.mem",
+    "alu": "alu_rom.mem",
+    "jmp": "jmp_rom.mem",
+}
+
+assert len(FLAG_NAMES) == FLAGS_LEN
+
+CU_DTYPE = np.dtype([(name, np.bool_) for name in FLAG_NAMES])
+
+# Field, bit and width of an ALU ROM entry, bit 6 is unused
+ALU_LAYOUT = (
+    ("za", 0, 1),
+    ("ia", 1, 1),
+    ("zb", 2, 1),
+    ("ib", 3, 1),
+    ("inv", 4, 1),
+    ("po", 5, 1),
+    ("carry", 7, 1),
+    ("cselect", 8, 3),
+)
+ALU_DTYPE = np.dtype(
+    [(name, np.bool_ if width == 1 else np.uint8) for name, _, width in ALU_LAYOUT]
+)
+
+JMP_DTYPE = np.dtype([("condition", np.uint8), ("relative", np.bool_)])
+
+# The flags[] entries of src/jmp.sv, in select order
+JMP_CONDITION_NAMES = (
+    "always",
+    "eq",
+    "neq",
+    "less",
+    "less_or_equal",
+    "larger",
+    "larger_or_equal",
+    "signed_less",
+    "signed_less_or_equal",
+    "signed_larger",
+    "signed_larger_or_equal",
+    "z",
+    "o",
+    "c",
+    "s",
+)
+
+
+class MicrocodeError(Exception):
+    pass
+
+
+def decode_cu(values):
+    values = np.asarray(values, dtype=np.uint32)
+    words = np.zeros(len(values), dtype=CU_DTYPE)
+    for bit, name in enumerate(FLAG_NAMES):
+        words[name] = values >> bit & 1
+    return words
+
+
+def encode_cu(words):
+    values = np.zeros(len(words), dtype=np.uint32)
+    for bit, name in enumerate(FLAG_NAMES):
+        values |= words[name].astype(np.uint32) << bit
+    return values
+
+
+def decode_alu(values):
+    values = np.asarray(values, dtype=np.uint32)
+    entries = np.zeros(len(values), dtype=ALU_DTYPE)
+    for name, bit, width in ALU_LAYOUT:
+        entries[name] = values >> bit & ((1 << width) - 1)
+    return entries
+
+
+def encode_alu(entries):
+    values = np.zeros(len(entries), dtype=np.uint32)
+    for name, bit, width in ALU_LAYOUT:
+        values |= entries[name].astype(np.uint32) << bit
+    return values
+
+
+def decode_jmp(values):
+    values = np.asarray(values, dtype=np.uint32)
+    entries = np.zeros(len(values), dtype=JMP_DTYPE)
+    entries["condition"] = values & 0xF
+    entries["relative"] = values >> 4 & 1
+    return entries
+
+
+def encode_jmp(entries):
+    return entries["condition"].astype(np.uint32) | (
+        entries["relative"].astype(np.uint32) << 4
+    )
+
+
+DECODERS = {"cu": decode_cu, "cu_2": decode_cu, "alu": decode_alu, "jmp": decode_jmp}
+ENCODERS = {"cu": encode_cu, "cu_2": encode_cu, "alu": encode_alu, "jmp": encode_jmp}
+
+
+def mem_length(path):
+    """Number of entries a $readmemh file sets, counting from address 0."""
+    length = address = 0
+    with open(path, "r") as f:
+        for line in f:
+            for token in line.split("//")[0].split():
+                if token.startswith("@"):
+                    address = int(token[1:], 16)
+                    continue
+                address += 1
+                length = max(length, address)
+    return length
+
+
+def write_mem(path, values):
+    """Write values the way the ROMs are stored, on one line."""
+    with open(path, "w") as f:
+        f.write(" ".join("%X" % value for value in values))
+
+
+def format_fields(rom, entry):
+    """The fields set in one decoded entry, as name|name|name=value."""
+    if rom in ("cu", "cu_2"):
+        return "|".join(name for name in FLAG_NAMES if entry[name])
+    if rom == "alu":
+        fields = [name for name, _, width in ALU_LAYOUT if width == 1 and entry[name]]
+        if entry["cselect"]:
+            fields.append("cselect=%d" % entry["cselect"])
+        return "|".join(fields)
+    fields = []
+    if entry["condition"]:
+        fields.append(JMP_CONDITION_NAMES[entry["condition"]])
+    if entry["relative"]:
+        fields.append("relative")
+    return "|".join(fields)
+
+
+def parse_fields(rom, text, entries, opcode):
+    """Set entries[opcode] from a format_fields() string."""
+    for field in text.split("|") if text else ():
+        name, _, value = field.partition("=")
+        if rom == "jmp" and name in JMP_CONDITION_NAMES:
+            name, value = "condition", JMP_CONDITION_NAMES.index(name)
+        if name not in entries.dtype.names:
+            raise MicrocodeError("%03x: unknown %s field %r" % (opcode, rom, field))
+        entries[opcode][name] = int(value) if value != "" else 1
+
+
+class Microcode(object):
+    """The decoded ROMs, length is how many entries the .mem files hold."""
+
+    def __init__(self, cu, cu_2, alu, jmp, length=None):
+        self.cu = cu
+        self.cu_2 = cu_2
+        self.alu = alu
+        self.jmp = jmp
+        self.length = length or len(cu)
+
+    @classmethod
+    def from_values(cls, roms, length=None):
+        """Decode a Roms, or anything with cu, cu_2, alu and jmp lists."""
+        return cls(*(DECODERS[rom](getattr(roms, rom)) for rom in ROMS), length=length)
+
+    @classmethod
+    def load(cls, rom_dir=ROM_DIR):
+        rom_dir = Path(rom_dir)
+        paths = [rom_dir / ROM_FILES[rom] for rom in ROMS]
+        length = max(mem_length(path) for path in paths)
+        return cls(
+            *(DECODERS[rom](read_mem(path)) for rom, path in zip(ROMS, paths)),
+            length=length
+        )
+
+    @classmethod
+    def read_table(cls, path=TABLE):
+        entries = {
+            rom: np.zeros(ROM_DEPTH, dtype=DECODERS[rom]([]).dtype) for rom in ROMS
+        }
+        length = 0
+        with open(path, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                opcode = int(row["opcode"], 16)
+                for rom in ROMS:
+                    parse_fields(rom, row[rom], entries[rom], opcode)
+                length = max(length, opcode + 1)
+        return cls(*(entries[rom] for rom in ROMS), length=length)
+
+    @classmethod
+    def open(cls, path):
+        """A ROM directory or a table file."""
+        path = Path(path)
+        return cls.load(path) if path.is_dir() else cls.read_table(path)
+
+    def values(self, rom):
+        """The raw ROM words, ROM_DEPTH of them like read_mem() gives."""
+        return [int(value) for value in ENCODERS[rom](getattr(self, rom))]
+
+    def roms(self):
+        """A Roms for Computer and the other users of load_roms()."""
+        return Roms(*(self.values(rom) for rom in ROMS))
+
+    def write(self, rom_dir=ROM_DIR):
+        rom_dir = Path(rom_dir)
+        rom_dir.mkdir(parents=True, exist_ok=True)
+        for rom in ROMS:
+            write_mem(rom_dir / ROM_FILES[rom], self.values(rom)[: self.length])
+
+    def rows(self):
+        for opcode in range(self.length):
+            row = {"opcode": "%03x" % opcode, "mnemonic": mnemonic(opcode)}
+            for rom in ROMS:
+                row[rom] = format_fields(rom, getattr(self, rom)[opcode])
+            yield row
+
+    def write_table(self, f):
+        writer = csv.DictWriter(f, ["opcode", "mnemonic"] + list(ROMS))
+        writer.writeheader()
+        writer.writerows(self.rows())
+
+
+def diff(old, new):
+    """The entries that differ between two Microcode, one dict per change."""
+    changes = []
+    for rom in ROMS:
+        a, b = getattr(old, rom), getattr(new, rom)
+        for opcode in np.flatnonzero(a != b):
+            before = set(format_fields(rom, a[opcode]).split("|")) - {""}
+            after = set(format_fields(rom, b[opcode]).split("|")) - {""}
+            changes.append(
+                {
+                    "opcode": int(opcode),
+                    "rom": rom,
+                    "removed": sorted(before - after),
+                    "added": sorted(after - before),
+                }
+            )
+    changes.sort(key=lambda change: (change["opcode"], ROMS.index(change["rom"])))
+    return changes
+
+
+def format_diff(changes):
+    lines = []
+    for change in changes:
+        lines.append(
+            "%03x %-24s %-4s %s"
+            % (
+                change["opcode"],
+                mnemonic(change["opcode"]),
+                change["rom"],
+                " ".join(
+                    ["-" + f for f in change["removed"]]
+                    + ["+" + f for f in change["added"]]
+                ),
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    table = commands.add_parser("table", help="print the ROMs as a table")
+    table.add_argument("source", nargs="?", default=ROM_DIR)
+    compare = commands.add_parser("diff", help="compare two ROM versions")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    build = commands.add_parser("build", help="write the .mem files from a table")
+    build.add_argument("table", nargs="?", default=TABLE)
+    build.add_argument("--out", default=ROM_DIR, help="ROM directory to write")
+    check = commands.add_parser("check", help="check the ROMs match the table")
+    check.add_argument("table", nargs="?", default=TABLE)
+    check.add_argument("--rom-dir", default=ROM_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "table":
+        Microcode.open(args.source).write_table(sys.stdout)
+    elif args.command == "diff":
+        changes = diff(Microcode.open(args.old), Microcode.open(args.new))
+        if changes:
+            print(format_diff(changes))
+        return 1 if changes else 0
+    elif args.command == "build":
+        Microcode.read_table(args.table).write(args.out)
+    else:
+        changes = diff(Microcode.read_table(args.table), Microcode.load(args.rom_dir))
+        if changes:
+            print("%s and %s differ:" % (args.table, args.rom_dir))
+            print(format_diff(changes))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Static and dynamic opcode mix of the example programs, as JSON or CSV.
+
+    python -m jrb16.mix > mix.json
+    python -m jrb16.mix primes.o fibonacci.o --csv
+    python -m jrb16.mix --assemble
+
+The static mix counts the instructions in each image, walking it from
+address 0 with the operand bytes skipped. The dynamic mix counts the
+instructions HardwareVM retires running it. Both are grouped by the
+MOV/CMP/JMP/JMP2/OPP/LOAD/SAVE/IN_OUT/HALT ranges of cu_flags.ts.
+"""
+
+import argparse
+import csv
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+from .assembler import AssemblerError
+from .image import PROGRAM_DIR, load_image
+from .vm import HardwareVM, family, instruction_length, read_cu_flags
+
+# Instructions a program may run before it is cut off, most never halt
+STEPS = 20000
+
+
+def static_counts(words, cu_flags):
+    flags, ranges = cu_flags
+    mnemonics = {opcode: name for name, opcode in flags.items()}
+    counts = Counter()
+    address = 0
+    while address < len(words):
+        opcode = words[address]
+        counts[opcode] += 1
+        address += instruction_length(opcode, mnemonics.get(opcode), ranges)
+    return counts
+
+
+def dynamic_counts(words, cu_flags, steps=STEPS, inputs=()):
+    vm = HardwareVM(words, cu_flags, inputs)
+    vm.run(steps)
+    return vm.counts, vm.stop_reason
+
+
+def program_mix(name, words, cu_flags, steps=STEPS, inputs=()):
+    dynamic, stop_reason = dynamic_counts(words, cu_flags, steps, inputs)
+    return {
+        "name": name,
+        "bytes": len(words),
+        "static": static_counts(words, cu_flags),
+        "dynamic": dynamic,
+        "stop_reason": stop_reason,
+    }
+
+
+def _shares(counts):
+    total = sum(counts.values()) or 1
+    return {key: count / total for key, count in counts.items()}
+
+
+def report(programs, cu_flags):
+    """The mix of every program and the totals, ready for json.dump()."""
+    flags, ranges = cu_flags
+    mnemonics = {opcode: name for name, opcode in flags.items()}
+    static = Counter()
+    dynamic = Counter()
+    for program in programs:
+        static.update(program["static"])
+        dynamic.update(program["dynamic"])
+
+    families = {}
+    for name in list(ranges) + [None]:
+        members = [
+            opcode
+            for opcode in set(static) | set(dynamic)
+            if family(opcode, ranges) == name
+        ]
+        if name is None and not members:
+            continue
+        families[name or "UNKNOWN"] = {
+            "static": sum(static[opcode] for opcode in members),
+            "dynamic": sum(dynamic[opcode] for opcode in members),
+        }
+    for kind in ("static", "dynamic"):
+        shares = _shares({name: f[kind] for name, f in families.items()})
+        for name, share in shares.items():
+            families[name][kind + "_share"] = round(share, 6)
+
+    opcodes = [
+        {
+            "opcode": "%02x" % opcode,
+            "mnemonic": mnemonics.get(opcode, "?"),
+            "family": family(opcode, ranges) or "UNKNOWN",
+            "static": static[opcode],
+            "dynamic": dynamic[opcode],
+        }
+        for opcode in sorted(set(static) | set(dynamic))
+    ]
+    opcodes.sort(key=lambda row: (-row["dynamic"], -row["static"]))
+
+    return {
+        "programs": [
+            {
+                "name": program["name"],
+                "bytes": program["bytes"],
+                "stop_reason": program["stop_reason"],
+                "instructions": sum(program["static"].values()),
+                "retired": sum(program["dynamic"].values()),
+                "static": {"%02x" % k: v for k, v in sorted(program["static"].items())},
+                "dynamic": {
+                    "%02x" % k: v for k, v in sorted(program["dynamic"].items())
+                },
+            }
+            for program in programs
+        ],
+        "families": families,
+        "opcodes": opcodes,
+        "unused_opcodes": len(flags)
+        - len([row for row in opcodes if row["mnemonic"] != "?"]),
+    }
+
+
+def load_programs(paths, assemble_with=None):
+    """(name, words) of every program, assembled from .j when asked."""
+    translation = None
+    if assemble_with is not None:
+        from .assembler import assemble, load_translation
+
+        translation = load_translation(assemble_with)
+    for path in paths:
+        path = Path(path)
+        if translation is not None:
+            words = assemble(path.read_text(), translation).words
+        else:
+            words = load_image(path)
+        yield path.stem, words
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("programs", nargs="*", help="the examples by default")
+    parser.add_argument(
+        "--assemble", action="store_true", help="assemble the .j sources instead"
+    )
+    parser.add_argument("--cu-flags", help="instruction table for --assemble")
+    parser.add_argument("--steps", type=int, default=STEPS, help="VM step budget")
+    parser.add_argument(
+        "--inputs", "-i", default="", help="comma separated values for in"
+    )
+    parser.add_argument("--csv", action="store_true", help="one row per opcode")
+    args = parser.parse_args(argv)
+
+    pattern = "*.j" if args.assemble else "*.o"
+    paths = args.programs or sorted(PROGRAM_DIR.glob(pattern))
+    assemble_with = None
+    if args.assemble:
+        from .assembler import CU_FLAGS
+
+        assemble_with = args.cu_flags or CU_FLAGS
+    inputs = [int(x, 0) for x in args.inputs.split(",") if x]
+
+    cu_flags = read_cu_flags()
+    try:
+        programs = [
+            program_mix(name, words, cu_flags, args.steps, inputs)
+            for name, words in load_programs(paths, assemble_with)
+        ]
+    except AssemblerError as e:
+        print(e, file=sys.stderr)
+        return 1
+    result = report(programs, cu_flags)
+
+    if args.csv:
+        writer = csv.DictWriter(sys.stdout, list(result["opcodes"][0]))
+        writer.writeheader()
+        writer.writerows(result["opcodes"])
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,522 @@
+"""Cycle accurate Python model of tt_um_aerox2_jrb16_computer.
+
+Every clock edge is evaluated the same way the RTL does it: the combinational
+logic is worked out from the register values before the edge and then all
+registers are updated at once. The model follows src/*.sv as written,
+including its current quirks (the 27 bit wide CU ROMs, the overlapping nibble
+write into the QSPI data register, the free running instruction fetch), so it
+can be compared against the simulator directly.
+"""
+
+from .consts import *
+from .rom import load_roms
+
+# CU states, in src/cu.sv order
+UPDATE_IR = 0
+FLAGS_1 = 1
+FLAGS_1_ALU = 2
+FLAGS_1_EVENTS = 3
+FLAGS_2 = 4
+FLAGS_2_ALU = 5
+FLAGS_2_EVENTS = 6
+
+CU_STATE_NAMES = [
+    "UPDATE_IR",
+    "FLAGS_1",
+    "FLAGS_1_ALU",
+    "FLAGS_1_EVENTS",
+    "FLAGS_2",
+    "FLAGS_2_ALU",
+    "FLAGS_2_EVENTS",
+]
+
+# ALU states, in src/alu.sv order
+ALU_IDLE = 0
+ALU_DECODE = 1
+ALU_ANDZ = 2
+ALU_XORZ = 3
+ALU_SUM = 4
+ALU_AND = 5
+ALU_XOR = 6
+ALU_LEFT_SHIFT = 7
+ALU_RIGHT_SHIFT = 8
+ALU_MULT = 9
+ALU_DIV = 10
+ALU_INVERT = 11
+
+# QSPI states, in src/qspi.sv order
+QSPI_IDLE = 0
+QSPI_SEND_COMMAND = 1
+QSPI_SEND_ADDRESS = 2
+QSPI_DUMMY = 3
+QSPI_SEND_DATA = 4
+QSPI_RECEIVE_DATA = 5
+
+QUAD_READ_COMMAND = 0xEB
+
+# Clock cycles from one ROM fetch to the next: IDLE plus two edges for each
+# command, address, dummy and data nibble
+FETCH_CYCLES = 1 + 2 * (8 + 8 + 4 + 8)
+
+# The ROM QSPI reads from {1'b1, pc}
+ROM_BASE = 0x800000
+
+PC_MASK = (1 << 23) - 1
+
+# The PC has to sit still for this many cycles to count as a fixed point,
+# longer than any single instruction takes to execute
+PC_LOOP_CYCLES = 64
+
+# Selects of the JMP module condition vector, see src/jmp.sv
+JMP_CONDITIONS = [
+    lambda z, o, c, s: 1,
+    lambda z, o, c, s: z,
+    lambda z, o, c, s: not z,
+    lambda z, o, c, s: c,
+    lambda z, o, c, s: c or z,
+    lambda z, o, c, s: not c and not z,
+    lambda z, o, c, s: not c,
+    lambda z, o, c, s: o != s,
+    lambda z, o, c, s: o != s or z,
+    lambda z, o, c, s: o == s and not z,
+    lambda z, o, c, s: o == s,
+    lambda z, o, c, s: z,
+    lambda z, o, c, s: o,
+    lambda z, o, c, s: c,
+    lambda z, o, c, s: s,
+    lambda z, o, c, s: 0,
+]
+
+
+def jump_target(val, pc, databus):
+    """pcout of a taken jump, {pcin[22:17], databus} or pcin plus that."""
+    address = (((pc >> 17) & 0x3F) << 16) | databus
+    return ((pc + address) & PC_MASK) if val & 0x10 else address
+
+
+class ModelError(Exception):
+    pass
+
+
+def first_bit(word, offset):
+    for i in range(8):
+        if (word >> (offset + i)) & 1:
+            return i
+    return -1
+
+
+def decode_flags(word):
+    """Split a CU flag word into the fields the datapath looks at."""
+    return (
+        tuple(i for i in range(8) if (word >> i) & 1),
+        first_bit(word, AI_BIT),
+        first_bit(word, AO_BIT),
+        (word >> ALUO_BIT) & 1,
+        (word >> ROMO_BIT) & 1,
+        (word >> RAMO_BIT) & 1,
+        (word >> IO_BIT) & 1,
+        (word >> JMPO_BIT) & 1,
+        (word >> MARI_BIT) & 1,
+        (word >> MPAGEI_BIT) & 1,
+        (word >> OI_BIT) & 1,
+        (word >> PCC_BIT) & 1,
+        (word >> HALT_BIT) & 1,
+        (word >> AC_BIT) & 1,
+    )
+
+
+def decode_alu(val):
+    return (
+        val & 1,
+        (val >> 1) & 1,
+        (val >> 2) & 1,
+        (val >> 3) & 1,
+        (val >> 4) & 1,
+        (val >> 5) & 1,
+        (val >> 7) & 1,
+        (val >> 8) & 7,
+    )
+
+
+ALU_FIELDS = [decode_alu(val) for val in range(1 << 11)]
+
+
+class Computer(object):
+    def __init__(self, rom=(), roms=None):
+        roms = roms or load_roms()
+        cu_mask = (1 << CU_ROM_WIDTH) - 1
+        self.flags_1 = [decode_flags(w & cu_mask) for w in roms.cu]
+        self.flags_2 = [decode_flags(w & cu_mask) for w in roms.cu_2]
+        self.flags_update_ir = decode_flags(UPDATE_IR_FLAGS)
+        self.flag_words_1 = [w & cu_mask for w in roms.cu]
+        self.flag_words_2 = [w & cu_mask for w in roms.cu_2]
+        self.alu_rom = [v & 0x7FF for v in roms.alu]
+        self.jmp_rom = [v & 0x1F for v in roms.jmp]
+
+        self.rom = rom
+        self.ui_in = 0
+        self.reset()
+
+    def reset(self):
+        # CU
+        self.pc = 0
+        self.ir = 0
+        self.cu_state = UPDATE_IR
+        self.alu_done_reg = 1
+
+        # Registers
+        self.regs = [0] * 8
+        self.mar = 0
+        self.mpage = 0
+        self.oreg = 0
+
+        # ALU
+        self.alu_state = ALU_IDLE
+        self.done_reg = 1
+        self.flags_mode = 1
+        self.carry_mode = 0
+        self.signed_mode = 0
+        self.val = 0
+        self.aandz = 0
+        self.bandz = 0
+        self.xora = 0
+        self.xorb = 0
+        self.muxoutput = 0
+
+        # CMP
+        self.zflag = 0
+        self.oflag = 0
+        self.cflag = 0
+        self.sflag = 0
+
+        # QSPI
+        self.qspi_state = QSPI_IDLE
+        self.shift_counter = 0
+        self.sclk = 0
+        self.qspi_in_reg = 0
+
+        # Flash on the other end of the QSPI bus
+        self.flash_address = 0
+        self.flash_data = 0
+
+        self.cycle = 0
+
+    @property
+    def flags(self):
+        """The CU flag word driven this cycle."""
+        if self.cu_state == UPDATE_IR:
+            return UPDATE_IR_FLAGS
+        if self.cu_state <= FLAGS_1_EVENTS:
+            return self.flag_words_1[self.ir]
+        return self.flag_words_2[self.ir]
+
+    def step(self):
+        """Advance the machine by one rising clock edge."""
+        cu_state = self.cu_state
+        ir = self.ir
+        pc = self.pc
+        regs = self.regs
+
+        # CU flags
+        if cu_state == UPDATE_IR:
+            flags = self.flags_update_ir
+        elif cu_state <= FLAGS_1_EVENTS:
+            flags = self.flags_1[ir]
+        else:
+            flags = self.flags_2[ir]
+        (
+            ins,
+            a_sel,
+            b_sel,
+            aluo,
+            romo,
+            ramo,
+            io,
+            jmpo,
+            mari,
+            mpagei,
+            oi,
+            pcc,
+            halt,
+            another_cycle,
+        ) = flags
+
+        # ALU outputs
+        za, ia, zb, ib, inv, po, carry, cselect = ALU_FIELDS[self.val]
+        xora = self.xora
+        xorb = self.xorb
+        muxoutput = self.muxoutput
+        alu_done = self.done_reg
+        carried = self.carry_mode and self.cflag
+        full_sum = xora + xorb + po + ((carried if (self.carry_mode and carry) else 0))
+        aluout = muxoutput if aluo else 0
+        cmpo = self.flags_mode and self.alu_state == ALU_INVERT
+        if cselect == 0:
+            full_carry = (full_sum >> 16) & 1
+            carryout = (1 - full_carry) if ((ia | ib) & po) else full_carry
+        else:
+            carryout = 0
+        overout = (~muxoutput >> 15) & (xora >> 15) & (xorb >> 15) & 1 | (
+            muxoutput >> 15
+        ) & (~xora >> 15) & (~xorb >> 15) & 1
+
+        # Registers
+        if aluo:
+            databus = aluout
+        elif b_sel >= 0:
+            databus = regs[b_sel]
+        elif romo:
+            databus = (self.qspi_in_reg >> 10) & 0xFFFF
+        elif ramo:
+            databus = 0
+        elif io:
+            databus = self.ui_in & 0xFF
+        else:
+            databus = 0
+        alu_a = regs[a_sel] if a_sel >= 0 else 0
+        alu_b = regs[b_sel] if b_sel >= 0 else 0
+
+        # JMP
+        pcinflag = 0
+        pcin = 0
+        if jmpo:
+            val = self.jmp_rom[ir]
+            pcinflag = JMP_CONDITIONS[val & 0xF](
+                self.zflag, self.oflag, self.cflag, self.sflag
+            )
+            if pcinflag:
+                pcin = jump_target(val, pc, databus)
+
+        # CU next state
+        alu_executing = 0
+        if cu_state == UPDATE_IR:
+            cu_next_state = FLAGS_1
+        elif cu_state == FLAGS_1:
+            cu_next_state = FLAGS_1_ALU if aluo else FLAGS_1_EVENTS
+        elif cu_state == FLAGS_1_ALU or cu_state == FLAGS_2_ALU:
+            alu_executing = self.alu_done_reg
+            if alu_done and not self.alu_done_reg:
+                cu_next_state = cu_state + 1
+            else:
+                cu_next_state = cu_state
+        elif cu_state == FLAGS_1_EVENTS:
+            cu_next_state = UPDATE_IR if another_cycle else FLAGS_2
+        elif cu_state == FLAGS_2:
+            cu_next_state = FLAGS_2_ALU if aluo else FLAGS_2_EVENTS
+        else:
+            cu_next_state = UPDATE_IR
+        write_en = cu_state == FLAGS_1_EVENTS or cu_state == FLAGS_2_EVENTS
+
+        # Clock edge: CU
+        if not halt:
+            self.cu_state = cu_next_state
+            self.alu_done_reg = alu_done
+            if cu_state == UPDATE_IR:
+                self.ir = self.qspi_in_reg & 0x3FF
+            elif cu_state == FLAGS_1 or cu_state == FLAGS_2:
+                if pcc:
+                    self.pc = (pc + 1) & PC_MASK
+            elif cu_state == FLAGS_2_EVENTS:
+                self.pc = pcin if pcinflag else (pc + 1) & PC_MASK
+
+        # Clock edge: ALU
+        state = self.alu_state
+        if state == ALU_IDLE:
+            self.alu_state = ALU_DECODE if alu_executing else ALU_IDLE
+            if ir == FLAGS_OFF_INS:
+                self.done_reg ^= 1
+                self.flags_mode = 0
+            elif ir == FLAGS_ON_INS:
+                self.done_reg ^= 1
+                self.flags_mode = 1
+            elif ir == CARRY_OFF_INS:
+                self.done_reg ^= 1
+                self.carry_mode = 0
+            elif ir == CARRY_ON_INS:
+                self.done_reg ^= 1
+                self.carry_mode = 1
+            elif ir == SIGN_OFF_INS:
+                self.done_reg ^= 1
+                self.signed_mode = 0
+            elif ir == SIGN_ON_INS:
+                self.done_reg ^= 1
+                self.signed_mode = 1
+            elif alu_executing:
+                self.done_reg = 0
+            else:
+                self.done_reg = 1
+        elif state == ALU_DECODE:
+            self.alu_state = ALU_ANDZ
+            self.val = self.alu_rom[ir]
+        elif state == ALU_ANDZ:
+            self.alu_state = ALU_XORZ
+            self.aandz = 0 if za else alu_a
+            self.bandz = 0 if zb else alu_b
+        elif state == ALU_XORZ:
+            self.alu_state = ALU_SUM + cselect if cselect < 7 else ALU_IDLE
+            self.xora = self.aandz ^ (0xFFFF if ia else 0)
+            self.xorb = self.bandz ^ (0xFFFF if ib else 0)
+        elif state == ALU_INVERT:
+            self.alu_state = ALU_IDLE
+            self.muxoutput = muxoutput ^ (0xFFFF if inv else 0)
+        else:
+            self.alu_state = ALU_INVERT
+            if state == ALU_SUM:
+                self.muxoutput = full_sum & 0xFFFF
+            elif state == ALU_AND:
+                self.muxoutput = xora & xorb
+            elif state == ALU_XOR:
+                self.muxoutput = xora ^ xorb
+            elif state == ALU_LEFT_SHIFT:
+                self.muxoutput = (xora << xorb) & 0xFFFF if xorb < 16 else 0
+            elif state == ALU_RIGHT_SHIFT:
+                self.muxoutput = xora >> xorb
+
+        # Clock edge: registers
+        if write_en:
+            for i in ins:
+                regs[i] = databus
+            if mari:
+                self.mar = databus
+            if mpagei:
+                self.mpage = databus & 0xFF
+            if oi:
+                self.oreg = databus & 0xFF
+
+        # Clock edge: CMP
+        if cmpo:
+            self.zflag = int(databus == 0)
+            self.oflag = overout
+            self.cflag = carryout
+            self.sflag = databus >> 15
+
+        # Clock edge: QSPI and the flash behind it
+        self._step_qspi()
+
+        self.cycle += 1
+
+    def _step_qspi(self):
+        state = self.qspi_state
+        shift_counter = self.shift_counter
+        sclk = self.sclk
+        last = shift_counter == 0 and sclk
+
+        if state == QSPI_IDLE:
+            self.qspi_state = QSPI_SEND_COMMAND
+            self.sclk = 0
+            self.shift_counter = 7
+            self.flash_address = 0
+            return
+
+        self.sclk = sclk ^ 1
+        if sclk:
+            self.shift_counter = (shift_counter - 1) & 0x1F
+
+        if state == QSPI_SEND_COMMAND:
+            if last:
+                self.qspi_state = QSPI_SEND_ADDRESS
+                self.shift_counter = 7
+        elif state == QSPI_SEND_ADDRESS:
+            if last:
+                self.qspi_state = QSPI_DUMMY
+                self.shift_counter = 3
+        elif state == QSPI_DUMMY:
+            if last:
+                self.qspi_state = QSPI_RECEIVE_DATA
+                self.shift_counter = 7
+                self.flash_data = self._read_flash(self.flash_address & 0xFFFFFF)
+        elif state == QSPI_SEND_DATA:
+            if last:
+                self.qspi_state = QSPI_IDLE
+        elif state == QSPI_RECEIVE_DATA:
+            if sclk:
+                # qspi_in_reg[shift_counter -: 4] <= io_in, bits below 0 drop
+                nibble = (self.flash_data >> (shift_counter * 4)) & 0xF
+                if shift_counter >= 3:
+                    shift = shift_counter - 3
+                    mask = 0xF << shift
+                    value = nibble << shift
+                else:
+                    shift = 3 - shift_counter
+                    mask = 0xF >> shift
+                    value = nibble >> shift
+                self.qspi_in_reg = (self.qspi_in_reg & ~mask) | value
+            if last:
+                self.qspi_state = QSPI_IDLE
+
+        # The flash samples the address on the rising edge of sclk
+        if self.qspi_state == QSPI_SEND_ADDRESS and not sclk:
+            address = ROM_BASE | self.pc
+            nibble = (address >> (self.shift_counter * 4)) & 0xF
+            self.flash_address = (self.flash_address << 4) | nibble
+
+    def _read_flash(self, address):
+        index = address - ROM_BASE
+        if not 0 <= index < len(self.rom):
+            raise ModelError("address %06x outside of memory" % address)
+        return self.rom[index]
+
+    def run(
+        self,
+        cycles,
+        inputs=[],
+        expected_outputs=None,
+        stop_on_halt=True,
+        stop_on_pc_loop=True,
+    ):
+        """Run like test_full.run() does and return the outputs it would see.
+
+        The outputs are sampled and inputs applied the same way the cocotb
+        harness does it, so both produce the same list. How the run ended is
+        left in self.stop_reason and the cycles used in self.cycles_run.
+        """
+        outputs = []
+        current_input = -1
+        previous_output = None
+        previous_pc = None
+        pc_stable = 0
+
+        self.cycles_run = cycles
+        self.stop_reason = "budget"
+
+        for cycle in range(cycles):
+            # The harness sees the values from before the clock edge
+            current_output = self.oreg
+            current_pc = self.pc
+            halted = self.flags >> HALT_BIT & 1
+            try:
+                self.step()
+            except ModelError as e:
+                self.error = e
+                self.cycles_run = cycle + 1
+                self.stop_reason = "error"
+                break
+
+            if current_output != previous_output:
+                outputs.append(current_output)
+                if len(inputs) > 0:
+                    if current_input + 1 < len(inputs):
+                        current_input += 1
+                    self.ui_in = inputs[current_input]
+            previous_output = current_output
+
+            reason = None
+            if expected_outputs is not None and len(outputs) >= expected_outputs:
+                reason = "outputs"
+            elif stop_on_halt and halted:
+                reason = "halt"
+            if reason is None and stop_on_pc_loop:
+                if current_pc == previous_pc:
+                    pc_stable += 1
+                    if pc_stable >= PC_LOOP_CYCLES:
+                        reason = "pc loop"
+                else:
+                    pc_stable = 0
+                previous_pc = current_pc
+
+            if reason is not None:
+                self.cycles_run = cycle + 1
+                self.stop_reason = reason
+                break
+
+        return outputs
@@ -0,0 +1,234 @@
+"""Peephole optimizer for .j source, run before assembling.
+
+Every byte of a program is its own ROM fetch, so the passes here only ever
+remove instructions or make them shorter:
+
+- a mov straight after the same mov, or after its reverse
+- cmp x x when the flags are compared again before anything reads them
+- jumps to an unconditional jmp go to its target instead
+- unconditional jumps to the very next instruction
+- 3 byte jmp to a label becomes 2 byte jmpr where the offset fits
+
+Relative jumps follow compiler/src/vm/hardware_vm.ts: the offset is signed
+and counted from the byte after the jmpr, and the PC wraps at 8 bits, so only
+targets below 0x100 are turned into jmpr.
+"""
+
+import re
+
+from .model import FETCH_CYCLES
+
+# Instructions that neither read nor write the CMP flags
+FLAG_NEUTRAL = ("nop", "mov", "load", "save", "in", "out")
+
+JMPR_MIN = -128
+JMPR_MAX = 127
+JMPR_TARGET_LIMIT = 0x100
+
+
+def source_lines(source):
+    """The instructions and labels of a program, without comments."""
+    if isinstance(source, str):
+        source = source.splitlines()
+    lines = []
+    for line in source:
+        line = re.sub(r"//.*", r"", line).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def is_label(line):
+    return line.startswith(":")
+
+
+class Optimizer(object):
+    def __init__(self, assembler):
+        self.assembler = assembler
+        self.translation = assembler.translation
+        self.changes = []
+
+    def size(self, line):
+        """Bytes an instruction line takes once assembled."""
+        if is_label(line):
+            return 0
+        words = self.assembler.encode(line)
+        if words is None:
+            return 0
+        return len(words) + isinstance(words[-1], str)
+
+    def program_size(self, lines):
+        return sum(self.size(line) for line in lines)
+
+    def jump(self, line):
+        """The condition and label of a jmp to a label, or None."""
+        if not line.startswith("jmp "):
+            return None
+        match = self.translation.match(line)
+        if match is None or match[1] != "{label}":
+            return None
+        instruction, label = match[2], match[3]
+        return instruction[len("jmp ") : -len("{label}")], label
+
+    def targets(self, lines):
+        """The index of the instruction each label points at."""
+        targets = {}
+        pending = []
+        for i, line in enumerate(lines):
+            if is_label(line):
+                pending.append(line[1:])
+            else:
+                for label in pending:
+                    targets.setdefault(label, i)
+                pending = []
+        for label in pending:
+            targets.setdefault(label, len(lines))
+        return targets
+
+    def _log(self, lines, i, message):
+        self.changes.append("%s: %s" % (lines[i], message))
+
+    def drop_redundant_movs(self, lines):
+        out = []
+        for line in lines:
+            if line.startswith("mov ") and out and out[-1].startswith("mov "):
+                previous = out[-1].split()
+                current = line.split()
+                if current == previous or current[1:] == previous[:0:-1]:
+                    self.changes.append("%s: dropped after %s" % (line, out[-1]))
+                    continue
+            out.append(line)
+        return out
+
+    def drop_self_cmps(self, lines):
+        out = []
+        for i, line in enumerate(lines):
+            args = line.split()
+            if args[0] == "cmp" and len(args) == 3 and args[1] == args[2]:
+                for later in lines[i + 1 :]:
+                    if later.split()[0] == "cmp":
+                        self._log(lines, i, "dropped, flags compared again")
+                        break
+                    if is_label(later) or later.split()[0] not in FLAG_NEUTRAL:
+                        out.append(line)
+                        break
+                else:
+                    out.append(line)
+                continue
+            out.append(line)
+        return out
+
+    def fold_jump_chains(self, lines):
+        targets = self.targets(lines)
+        out = list(lines)
+        for i, line in enumerate(lines):
+            jump = self.jump(line)
+            if jump is None:
+                continue
+            condition, label = jump
+            seen = {label}
+            while label in targets and targets[label] < len(lines):
+                next_jump = self.jump(lines[targets[label]])
+                if next_jump is None or next_jump[0] != "" or next_jump[1] in seen:
+                    break
+                label = next_jump[1]
+                seen.add(label)
+            if label != jump[1]:
+                out[i] = "jmp %s%s" % (condition, label)
+                self._log(lines, i, "now jumps straight to %s" % label)
+        return out
+
+    def drop_jumps_to_next(self, lines):
+        targets = self.targets(lines)
+        out = []
+        for i, line in enumerate(lines):
+            jump = self.jump(line)
+            if jump is not None and jump[0] == "":
+                following = i + 1
+                while following < len(lines) and is_label(lines[following]):
+                    following += 1
+                if targets.get(jump[1]) == following:
+                    self._log(lines, i, "dropped, jumps to the next instruction")
+                    continue
+            out.append(line)
+        return out
+
+    def shorten_jumps(self, lines):
+        candidates = {}
+        for i, line in enumerate(lines):
+            jump = self.jump(line)
+            if jump is None:
+                continue
+            condition, label = jump
+            if "jmpr %s{number}" % condition in self.translation.table:
+                candidates[i] = (condition, label)
+
+        # Start with every candidate short and lengthen the ones that don't
+        # fit until nothing changes, shortening one jump never breaks another
+        short = set(candidates)
+        while True:
+            addresses = []
+            labels = {}
+            address = 0
+            for i, line in enumerate(lines):
+                addresses.append(address)
+                if is_label(line):
+                    labels.setdefault(line[1:], address)
+                else:
+                    address += 2 if i in short else self.size(line)
+
+            offsets = {}
+            for i in short:
+                target = labels.get(candidates[i][1])
+                if target is None or target >= JMPR_TARGET_LIMIT:
+                    continue
+                offset = target - (addresses[i] + 2)
+                if JMPR_MIN <= offset <= JMPR_MAX:
+                    offsets[i] = offset
+            if len(offsets) == len(short):
+                break
+            short = set(offsets)
+
+        out = list(lines)
+        for i, offset in offsets.items():
+            condition = candidates[i][0]
+            out[i] = "jmpr %s%d" % (condition, offset & 0xFF)
+            self._log(lines, i, "now %s (%+d)" % (out[i], offset))
+        return out
+
+    def optimize(self, source):
+        lines = source_lines(source)
+        self.changes = []
+        passes = [
+            self.drop_redundant_movs,
+            self.drop_self_cmps,
+            self.fold_jump_chains,
+            self.drop_jumps_to_next,
+        ]
+        while True:
+            before = lines
+            for optimization in passes:
+                lines = optimization(lines)
+            if lines == before:
+                break
+        return self.shorten_jumps(lines)
+
+
+def optimize(source, assembler):
+    """The optimized lines of a program and a list of what was changed."""
+    optimizer = Optimizer(assembler)
+    lines = optimizer.optimize(source)
+    return lines, optimizer.changes
+
+
+def summary(assembler, before, after):
+    """Byte and fetch cycle counts of a program before and after optimizing."""
+    optimizer = Optimizer(assembler)
+    old = optimizer.program_size(source_lines(before))
+    new = optimizer.program_size(after)
+    return "Bytes: %d -> %d, estimated fetch cycles: %d -> %d" % (
+        old,
+        new,
+        old * FETCH_CYCLES,
+        new * FETCH_CYCLES,
+    )
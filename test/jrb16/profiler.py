@@ -0,0 +1,170 @@
+"""Where a run spends its cycles, by PC, instruction and label.
+
+Cycles are charged to the instruction they belong to, from its UPDATE_IR up
+to the next one, and split into three kinds:
+
+    fetch    UPDATE_IR, the cycle the CU takes the IR from the QSPI
+    alu      FLAGS_1_ALU and FLAGS_2_ALU, waiting on the ALU
+    control  every other CU state
+
+The CU does not wait for the fetch, so the QSPI shows up separately as the
+number of cycles the ROM QSPI was in the middle of a transaction.
+"""
+
+import bisect
+import csv
+from collections import Counter
+from pathlib import Path
+
+from .isa import mnemonic
+from .model import FLAGS_1_ALU, FLAGS_2_ALU, UPDATE_IR
+
+KINDS = ("fetch", "alu", "control")
+
+
+def cycle_kind(cu_state):
+    if cu_state == UPDATE_IR:
+        return "fetch"
+    if cu_state == FLAGS_1_ALU or cu_state == FLAGS_2_ALU:
+        return "alu"
+    return "control"
+
+
+class Profile(object):
+    """Cycle counts collected one clock cycle at a time with record()."""
+
+    def __init__(self, symbols=None, name="run"):
+        self.name = name
+        symbols = sorted((address, label) for label, address in (symbols or {}).items())
+        self.addresses = [address for address, _ in symbols]
+        self.labels = [label for _, label in symbols]
+        # (pc, ir) -> Counter of cycle kinds
+        self.cycles = {}
+        # (pc, ir) -> times the instruction ran
+        self.counts = Counter()
+        self.qspi_busy = 0
+        self.total = 0
+
+        self._pc = None
+        self._ir = None
+        self._kinds = Counter()
+
+    def record(self, pc, cu_state, ir, qspi_busy=False):
+        """Account for one cycle, pc and ir are sampled after the edge."""
+        self.total += 1
+        self.qspi_busy += bool(qspi_busy)
+        if cu_state == UPDATE_IR:
+            self.finish()
+            self._pc = pc
+        elif self._ir is None:
+            # The IR only holds the new instruction once UPDATE_IR is over
+            self._ir = ir
+        self._kinds[cycle_kind(cu_state)] += 1
+
+    def finish(self):
+        """Charge the instruction in progress, call once the run is over."""
+        if self._kinds:
+            key = (self._pc, self._ir)
+            self.cycles.setdefault(key, Counter()).update(self._kinds)
+            self.counts[key] += 1
+        self._pc = None
+        self._ir = None
+        self._kinds = Counter()
+
+    def label(self, pc):
+        """The closest label at or before pc, as label+offset."""
+        if pc is None:
+            return "?"
+        i = bisect.bisect_right(self.addresses, pc) - 1
+        if i < 0:
+            return "%04x" % pc
+        address, name = self.addresses[i], self.labels[i]
+        return name if address == pc else "%s+%d" % (name, pc - address)
+
+    def _group(self, key):
+        totals = {}
+        for (pc, ir), kinds in self.cycles.items():
+            totals.setdefault(key(pc, ir), Counter()).update(kinds)
+        return totals
+
+    def by_pc(self):
+        return self._group(lambda pc, ir: pc)
+
+    def by_instruction(self):
+        return self._group(lambda pc, ir: ir)
+
+    def by_label(self):
+        """Cycles per label, the label+offset part of every PC dropped."""
+        return self._group(lambda pc, ir: self.label(pc).split("+")[0])
+
+    def kinds(self):
+        totals = Counter()
+        for kinds in self.cycles.values():
+            totals.update(kinds)
+        return totals
+
+    def rows(self):
+        """One row per PC and instruction, most cycles first."""
+        rows = []
+        for (pc, ir), kinds in self.cycles.items():
+            row = {
+                "pc": "" if pc is None else "%04x" % pc,
+                "label": self.label(pc),
+                "instruction": "" if ir is None else mnemonic(ir),
+                "count": self.counts[(pc, ir)],
+                "cycles": sum(kinds.values()),
+            }
+            row.update((kind, kinds[kind]) for kind in KINDS)
+            rows.append(row)
+        rows.sort(key=lambda row: -row["cycles"])
+        return rows
+
+    def write_csv(self, path):
+        rows = self.rows()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(
+                f, ["pc", "label", "instruction", "count", "cycles"] + list(KINDS)
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def write_folded(self, path):
+        """Collapsed stacks for flamegraph.pl or speedscope.
+
+        Each stack is run;label;pc instruction;kind with its cycle count.
+        """
+        with open(path, "w") as f:
+            for row in self.rows():
+                frame = "%s %s" % (row["pc"] or "?", row["instruction"] or "?")
+                for kind in KINDS:
+                    if row[kind]:
+                        stack = (self.name, row["label"], frame, kind)
+                        f.write("%s %d\n" % (";".join(stack), row[kind]))
+
+    def save(self, directory):
+        """Write <name>.csv and <name>.folded into directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.write_csv(directory / (self.name + ".csv"))
+        self.write_folded(directory / (self.name + ".folded"))
+
+    def summary(self, top=10):
+        kinds = self.kinds()
+        counted = sum(kinds.values()) or 1
+        lines = [
+            "%d cycles, %d instructions: %s, ROM QSPI busy %d%%"
+            % (
+                self.total,
+                sum(self.counts.values()),
+                ", ".join(
+                    "%s %d%%" % (kind, 100 * kinds[kind] // counted) for kind in KINDS
+                ),
+                100 * self.qspi_busy // (self.total or 1),
+            )
+        ]
+        labels = sorted(
+            self.by_label().items(), key=lambda item: -sum(item[1].values())
+        )
+        for label, kinds in labels[:top]:
+            lines.append("  %-20s %8d" % (label, sum(kinds.values())))
+        return "\n".join(lines)
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+ROM_DIR = Path(__file__).resolve().parents[2] / "rom"
+
+# Every ROM in the design is declared with 1024 entries
+ROM_DEPTH = 1024
+
+
+def read_mem(path, depth=ROM_DEPTH):
+    """Read a $readmemh file, entries that are not in the file read as 0."""
+    values = [0] * depth
+    address = 0
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("//")[0]
+            for token in line.split():
+                if token.startswith("@"):
+                    address = int(token[1:], 16)
+                    continue
+                values[address] = int(token, 16)
+                address += 1
+    return values
+
+
+class Roms(object):
+    def __init__(self, cu, cu_2, alu, jmp):
+        self.cu = cu
+        self.cu_2 = cu_2
+        self.alu = alu
+        self.jmp = jmp
+
+
+_cache = {}
+
+
+def load_roms(rom_dir=ROM_DIR):
+    """The ROMs built from microcode.csv, or read from the .mem files of a
+    directory without one."""
+    rom_dir = Path(rom_dir)
+    if rom_dir not in _cache and (rom_dir / "microcode.csv").exists():
+        from .microcode import Microcode
+
+        _cache[rom_dir] = Microcode.read_table(rom_dir / "microcode.csv").roms()
+    if rom_dir not in _cache:
+        _cache[rom_dir] = Roms(
+            read_mem(rom_dir / "cu_rom.mem"),
+            read_mem(rom_dir / "cu_rom_2.mem"),
+            read_mem(rom_dir / "alu_rom.mem"),
+            read_mem(rom_dir / "jmp_rom.mem"),
+        )
+    return _cache[rom_dir]
@@ -0,0 +1,291 @@
+"""Clock cycles per instruction, and cycle estimates for whole programs.
+
+    python -m jrb16.timing --table > timing.csv
+    python -m jrb16.timing ../example_programs/assembly/primes.o
+
+The CU in src/cu.sv does not wait for the instruction fetch, so what an
+instruction costs only depends on the CU states it walks through:
+
+    UPDATE_IR, FLAGS_1, [FLAGS_1_ALU], FLAGS_1_EVENTS,
+    FLAGS_2, [FLAGS_2_ALU], FLAGS_2_EVENTS
+
+with the ALU states only taken when ALUO is set in that half of the CU ROM,
+and FLAGS_2 skipped when AC is set. The static table works this out from
+the ROM contents, the measured table runs every opcode through the Python
+model from reset. Both are expected to agree, --table shows both columns.
+"""
+
+import argparse
+import csv
+import sys
+from collections import namedtuple
+
+from .consts import *
+from .image import load_program
+from .isa import mnemonic
+from .memory import Memory
+from .model import (
+    ALU_FIELDS,
+    FETCH_CYCLES,
+    FLAGS_1,
+    PC_MASK,
+    UPDATE_IR,
+    Computer,
+    decode_flags,
+    jump_target,
+)
+from .rom import ROM_DEPTH, load_roms
+
+# ALU states between the CU raising alu_executing and the result: DECODE,
+# ANDZ and XORZ, then the selected operation and INVERT unless XORZ goes
+# straight back to IDLE (cselect 7)
+ALU_PIPELINE_CYCLES = 3
+ALU_OPERATION_CYCLES = 2
+# IDLE raising done, alu_done_reg following it, the CU seeing the edge
+ALU_HANDSHAKE_CYCLES = 3
+
+# Measuring gives up on an opcode after this many cycles, e.g. HALT
+MEASURE_LIMIT = 256
+
+# Iterations assumed for every loop when weighting a program
+LOOP_WEIGHT = 10
+
+Timing = namedtuple("Timing", "opcode cycles words alu jump halt")
+
+
+def alu_cycles(val):
+    """Cycles the CU spends in one FLAGS_*_ALU state for an ALU ROM entry."""
+    cselect = ALU_FIELDS[val & 0x7FF][7]
+    operation = ALU_OPERATION_CYCLES if cselect < 7 else 0
+    return ALU_PIPELINE_CYCLES + operation + ALU_HANDSHAKE_CYCLES
+
+
+def static_timing(roms=None):
+    """The Timing of every opcode, worked out from the ROM contents."""
+    roms = roms or load_roms()
+    cu_mask = (1 << CU_ROM_WIDTH) - 1
+    table = []
+    for opcode in range(ROM_DEPTH):
+        word_1 = roms.cu[opcode] & cu_mask
+        word_2 = roms.cu_2[opcode] & cu_mask
+        alu = alu_cycles(roms.alu[opcode])
+
+        # UPDATE_IR, FLAGS_1 and FLAGS_1_EVENTS
+        cycles = 3 + (alu if word_1 >> ALUO_BIT & 1 else 0)
+        words = word_1 >> PCC_BIT & 1
+        phases = word_1 >> ALUO_BIT & 1
+        if not word_1 >> AC_BIT & 1:
+            # FLAGS_2 and FLAGS_2_EVENTS, which always moves the PC on
+            cycles += 2 + (alu if word_2 >> ALUO_BIT & 1 else 0)
+            words += (word_2 >> PCC_BIT & 1) + 1
+            phases += word_2 >> ALUO_BIT & 1
+
+        # The jumps of the ISA raise JMPO in the first half. pcin is only
+        # loaded in FLAGS_2_EVENTS, so the RTL does not take them yet, but
+        # they are where the loops of a program are
+        jump = bool((word_1 | word_2) >> JMPO_BIT & 1)
+        halt = bool((word_1 | word_2) >> HALT_BIT & 1)
+        table.append(Timing(opcode, cycles, words, phases, jump, halt))
+    return table
+
+
+def measure(opcode, computer):
+    """Clock cycles from UPDATE_IR to the next UPDATE_IR in the model."""
+    computer.reset()
+    computer.ir = opcode
+    computer.cu_state = FLAGS_1
+    for cycles in range(2, MEASURE_LIMIT):
+        computer.step()
+        if computer.cu_state == UPDATE_IR:
+            return cycles
+    return None
+
+
+def measured_timing(roms=None):
+    """Cycles per opcode as the model runs them, None if it never finishes."""
+    # Every PC the model can fetch from reads as 0, the pages are only
+    # allocated when touched
+    computer = Computer(Memory(PC_MASK + 1), roms)
+    return [measure(opcode, computer) for opcode in range(ROM_DEPTH)]
+
+
+def timing_table(roms=None):
+    """Static and measured timing side by side, one row per opcode."""
+    measured = measured_timing(roms)
+    rows = []
+    for timing in static_timing(roms):
+        rows.append(
+            {
+                "opcode": "%03x" % timing.opcode,
+                "mnemonic": mnemonic(timing.opcode),
+                "cycles": timing.cycles,
+                "measured": measured[timing.opcode],
+                "words": timing.words,
+                "alu": timing.alu,
+                "jump": int(timing.jump),
+                "halt": int(timing.halt),
+            }
+        )
+    return rows
+
+
+class Instruction(object):
+    def __init__(self, address, word, timing, target=None):
+        self.address = address
+        self.word = word
+        self.timing = timing
+        self.target = target
+        self.weight = 1
+
+    @property
+    def cycles(self):
+        return self.timing.cycles
+
+    @property
+    def weighted(self):
+        return self.cycles * self.weight
+
+
+def taken_target(address, words, timing, roms):
+    """Where a jump goes if it is taken, None if it is read from a register."""
+    opcode = timing.opcode
+    cu_mask = (1 << CU_ROM_WIDTH) - 1
+    word_1 = roms.cu[opcode] & cu_mask
+    word_2 = roms.cu_2[opcode] & cu_mask
+    first = word_1 >> JMPO_BIT & 1
+    flags = decode_flags(word_1 if first else word_2)
+    b_sel, romo = flags[2], flags[4]
+    if b_sel >= 0 or not romo:
+        return None
+    # The PC once the increments of FLAGS_1, and FLAGS_2 for a jump in the
+    # second half, are done
+    pc = address + (word_1 >> PCC_BIT & 1)
+    if not first:
+        pc += word_2 >> PCC_BIT & 1
+    # The databus carries bits 10 and up of the word the QSPI holds, taken
+    # here to be the jump itself
+    return jump_target(roms.jmp[opcode], pc, (words[address] >> 10) & 0xFFFF)
+
+
+def annotate(words, table=None, roms=None, loop_weight=LOOP_WEIGHT):
+    """Walk a program in address order and weight the instructions by loop.
+
+    Every jump back to an earlier address is taken as a loop over the
+    instructions in between, run loop_weight times. Nested loops multiply.
+    """
+    roms = roms or load_roms()
+    table = table or static_timing(roms)
+
+    program = []
+    address = 0
+    while address < len(words):
+        word = words[address]
+        timing = table[word & 0x3FF]
+        target = None
+        if timing.jump:
+            target = taken_target(address, words, timing, roms)
+        program.append(Instruction(address, word, timing, target))
+        address += max(timing.words, 1)
+
+    for jump in program:
+        if jump.target is not None and jump.target <= jump.address:
+            for instruction in program:
+                if jump.target <= instruction.address <= jump.address:
+                    instruction.weight *= loop_weight
+    return program
+
+
+def estimate(program):
+    """Cycle estimates for an annotated program.
+
+    straight line runs every instruction once, a lower bound once there are
+    loops. Loop weighted counts loop bodies by their weight and fetch bound
+    charges a full QSPI fetch per word. Worst case charges every instruction
+    its CU states plus a full fetch per word, loop weighted. It bounds the
+    free running fetch of today and a CU that waits for it, as long as no
+    loop runs more than its weight, and is None when a jump is read from a
+    register.
+    """
+    worst_case = None
+    if all(i.target is not None for i in program if i.timing.jump):
+        worst_case = sum(
+            (i.cycles + i.timing.words * FETCH_CYCLES) * i.weight for i in program
+        )
+    return {
+        "instructions": len(program),
+        "straight_line": sum(i.cycles for i in program),
+        "loop_weighted": sum(i.weighted for i in program),
+        "worst_case": worst_case,
+        "fetch_bound": sum(i.timing.words * FETCH_CYCLES for i in program),
+    }
+
+
+def format_program(program, symbols=None):
+    labels = {}
+    for name, address in (symbols or {}).items():
+        labels.setdefault(address, name)
+
+    lines = []
+    for i in program:
+        if i.address in labels:
+            lines.append(":%s" % labels[i.address])
+        text = mnemonic(i.timing.opcode)
+        if i.target is not None:
+            text += " -> %s" % labels.get(i.target, "%04x" % i.target)
+        lines.append(
+            "%04x  %-24s %4d  x%-6d %8d"
+            % (i.address, text, i.cycles, i.weight, i.weighted)
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("program", nargs="?", help="program to annotate")
+    parser.add_argument(
+        "--table", action="store_true", help="print the per opcode table as CSV"
+    )
+    parser.add_argument(
+        "--loop-weight",
+        type=int,
+        default=LOOP_WEIGHT,
+        help="iterations assumed for each loop",
+    )
+    args = parser.parse_args(argv)
+
+    if args.table:
+        rows = timing_table()
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        mismatched = [r["opcode"] for r in rows if r["cycles"] != r["measured"]]
+        if mismatched:
+            print(
+                "static and measured differ: %s" % " ".join(mismatched), file=sys.stderr
+            )
+            return 1
+        return 0
+
+    if args.program is None:
+        parser.error("no program given")
+    image = load_program(args.program)
+    program = annotate(image.words, loop_weight=args.loop_weight)
+    print(format_program(program, image.symbols))
+    totals = estimate(program)
+    worst_case = totals["worst_case"]
+    print(
+        "%(instructions)d instructions, straight line %(straight_line)d cycles, "
+        "loop weighted %(loop_weighted)d cycles, fetch bound %(fetch_bound)d "
+        "cycles, worst case %(worst)s"
+        % dict(
+            totals,
+            worst="unbounded" if worst_case is None else "%d cycles" % worst_case,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
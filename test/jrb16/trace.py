@@ -0,0 +1,148 @@
+"""Ring buffer of QSPI transactions, as seen by the memories on the bus.
+
+Every transaction is one row of fixed width columns, so a long run only ever
+holds the last `capacity` of them. The totals in summary() cover every
+transaction, including the ones that have dropped out of the buffer.
+"""
+
+import array
+import csv
+from collections import Counter
+from pathlib import Path
+
+COMMAND_NAMES = {
+    0x02: "write",
+    0x03: "read",
+    0x32: "quad write",
+    0xEB: "quad read",
+}
+
+# Column name and array typecode: sim time in ns, clock cycle, chip select
+# pin, command, address, data word and duration in clock cycles
+COLUMNS = (
+    ("timestamp", "Q"),
+    ("cycle", "Q"),
+    ("cs", "B"),
+    ("command", "B"),
+    ("address", "I"),
+    ("data", "I"),
+    ("duration", "I"),
+)
+
+CAPACITY = 1 << 16
+
+
+class QspiTrace(object):
+    def __init__(self, period, capacity=CAPACITY, start=0, name="run"):
+        """period is the clock period and start the time of cycle 0, in ns."""
+        self.period = period
+        self.capacity = capacity
+        self.start = start
+        self.name = name
+        self.columns = {
+            column: array.array(typecode, [0]) * capacity
+            for column, typecode in COLUMNS
+        }
+        self.recorded = 0
+
+        # Running totals over everything recorded
+        self.busy = 0
+        self.commands = Counter()
+
+    def __len__(self):
+        return min(self.recorded, self.capacity)
+
+    def record(self, timestamp, cs, command, address, data, duration):
+        """Add a transaction that began at timestamp and lasted duration ns."""
+        cycles = round(duration / self.period)
+        i = self.recorded % self.capacity
+        row = (
+            timestamp,
+            (timestamp - self.start) // self.period,
+            cs,
+            command,
+            address,
+            data & 0xFFFFFFFF,
+            cycles,
+        )
+        for (column, _), value in zip(COLUMNS, row):
+            self.columns[column][i] = int(value)
+        self.recorded += 1
+        self.busy += cycles
+        self.commands[(cs, command)] += 1
+
+    def rows(self):
+        """The buffered transactions, oldest first."""
+        first = self.recorded - len(self)
+        names = [column for column, _ in COLUMNS]
+        for n in range(first, self.recorded):
+            i = n % self.capacity
+            yield {name: self.columns[name][i] for name in names}
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, [column for column, _ in COLUMNS])
+            writer.writeheader()
+            for row in self.rows():
+                row["command"] = "%02x" % row["command"]
+                row["address"] = "%06x" % row["address"]
+                row["data"] = "%08x" % row["data"]
+                writer.writerow(row)
+
+    def write_parquet(self, path):
+        """Needs pyarrow, which is not in requirements.txt."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow, use write_csv()")
+        first = self.recorded - len(self)
+        order = [n % self.capacity for n in range(first, self.recorded)]
+        table = pyarrow.table(
+            {column: [self.columns[column][i] for i in order] for column, _ in COLUMNS}
+        )
+        pyarrow.parquet.write_table(table, path)
+
+    def save(self, directory):
+        """Write <name>.csv into directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.write_csv(directory / (self.name + ".csv"))
+
+    def summary(self, end, instructions=None, fetch_cs=None):
+        """Bus utilization up to the time end, in ns.
+
+        Fetches are the quad reads on the fetch_cs chip select, or on any of
+        them if it is None.
+        """
+        cycles = max((end - self.start) // self.period, 1)
+        fetches = sum(
+            count
+            for (cs, command), count in self.commands.items()
+            if command == 0xEB and fetch_cs in (None, cs)
+        )
+        stats = {
+            "transactions": self.recorded,
+            "cycles": cycles,
+            "bus_idle": 100 * (1 - min(self.busy / cycles, 1)),
+            "average_latency": self.busy / self.recorded if self.recorded else 0,
+            "fetches": fetches,
+            "fetches_per_instruction": None,
+        }
+        if instructions:
+            stats["fetches_per_instruction"] = fetches / instructions
+        return stats
+
+    def format_summary(self, end, instructions=None, fetch_cs=None):
+        stats = self.summary(end, instructions, fetch_cs)
+        text = (
+            "QSPI: %(transactions)d transactions, bus idle %(bus_idle).1f%%, "
+            "average latency %(average_latency).1f cycles" % stats
+        )
+        if stats["fetches_per_instruction"] is not None:
+            text += ", %.2f fetches per instruction" % stats["fetches_per_instruction"]
+        commands = ", ".join(
+            "cs %d %s %d" % (cs, COMMAND_NAMES.get(command, "%02x" % command), count)
+            for (cs, command), count in sorted(self.commands.items())
+        )
+        return text + ("\n  " + commands if commands else "")
@@ -0,0 +1,261 @@
+"""Instruction level model of the 8 bit programs the assembler produces.
+
+The example programs are still encoded for the jrb8 instruction set of
+compiler/src/utils/cu_flags.ts, not the 10 bit opcodes of test/assembly.
+HardwareVM runs them the way compiler/src/vm/hardware_vm.ts does: four 8 bit
+registers, flags worked out from the unmasked result, jump addresses taken
+from the two bytes after the opcode and relative jumps wrapping at 0xff.
+Every opcode is decoded from its mnemonic, so cu_flags.ts stays the only
+place the encoding lives.
+"""
+
+import re
+from collections import Counter
+from pathlib import Path
+
+CU_FLAGS_TS = (
+    Path(__file__).resolve().parents[2] / "compiler" / "src" / "utils" / "cu_flags.ts"
+)
+
+_RANGE = re.compile(
+    r"export const (\w+)_RANGE = \{ MIN: (0x[0-9a-f]+), MAX: (0x[0-9a-f]+) \}"
+)
+_FLAG = re.compile(r'^[ \t]+"?([^":\n]+?)"?: (0x[0-9a-f]+),', re.M)
+
+REGISTERS = "abcd"
+
+# Math.floor(x / 0) is Infinity, which JavaScript masks to 0 but which still
+# sets carry and clears zero. Any value above 0xff with a clear low byte does
+# the same here.
+INFINITY = 1 << 32
+
+
+def read_cu_flags(path=CU_FLAGS_TS):
+    """({mnemonic: opcode}, {family: (min, max)}) from cu_flags.ts."""
+    text = Path(path).read_text()
+    ranges = {
+        name: (int(low, 16), int(high, 16)) for name, low, high in _RANGE.findall(text)
+    }
+    flags = {name: int(opcode, 16) for name, opcode in _FLAG.findall(text)}
+    return flags, ranges
+
+
+def family(opcode, ranges):
+    for name, (low, high) in ranges.items():
+        if low <= opcode <= high:
+            return name
+    return None
+
+
+def instruction_length(opcode, mnemonic, ranges):
+    """Bytes an instruction takes up, the opcode and its operands."""
+    name = family(opcode, ranges)
+    if name == "JMP":
+        return 3
+    if name == "JMP2":
+        return 2
+    if mnemonic is not None and "{" in mnemonic:
+        return 2
+    return 1
+
+
+class HardwareVM(object):
+    def __init__(self, rom, cu_flags=None, inputs=()):
+        flags, self.ranges = cu_flags or read_cu_flags()
+        self.mnemonics = {opcode: name for name, opcode in flags.items()}
+        self.rom = list(rom)
+        self.inputs = list(inputs)
+        self.reset()
+
+    def reset(self):
+        self.regs = [0, 0, 0, 0]
+        self.ram = [0] * 256
+        self.mar = 0
+        self.ram_page = 0
+        self.pc = 0
+        self.outputs = []
+        self.counts = Counter()
+        self.retired = 0
+        self.stop_reason = None
+        self._input = 0
+        self.reset_flags()
+
+    def reset_flags(self):
+        self.zflag = self.oflag = self.cflag = self.sflag = False
+        self.carry_mode = False
+        self.signed_mode = False
+
+    def fetch(self):
+        value = self.rom[self.pc] if self.pc < len(self.rom) else 0
+        self.pc += 1
+        return value
+
+    def update_flags(self, result):
+        self.zflag = result == 0
+        self.sflag = bool(result & 0x80)
+        self.cflag = result > 255 or result < 0
+        self.oflag = self.signed_mode and (result > 127 or result < -128)
+
+    def should_jump(self, condition):
+        z, o, c, s = self.zflag, self.oflag, self.cflag, self.sflag
+        return (
+            True,
+            z,
+            not z,
+            c,
+            c or z,
+            not c and not z,
+            not c,
+            s != o,
+            s != o or z,
+            s == o and not z,
+            s == o,
+            z,
+            o,
+            c,
+            s,
+            False,
+        )[condition]
+
+    def reg(self, name):
+        return self.regs[REGISTERS.index(name)]
+
+    def set_reg(self, name, value):
+        self.regs[REGISTERS.index(name)] = value & 0xFF
+
+    def step(self):
+        """Run one instruction, False once the program halts."""
+        opcode = self.fetch()
+        self.counts[opcode] += 1
+        self.retired += 1
+        mnemonic = self.mnemonics.get(opcode)
+        if mnemonic == "halt":
+            return False
+        name = family(opcode, self.ranges)
+        if name == "JMP":
+            address = self.fetch() << 8 | self.fetch()
+            if self.should_jump(opcode & 0xF):
+                self.pc = address
+        elif name == "JMP2":
+            offset = self.fetch()
+            if self.should_jump(opcode & 0xF):
+                offset -= 256 if offset & 0x80 else 0
+                self.pc = (self.pc + offset) & 0xFF
+        elif mnemonic is not None and mnemonic != "nop":
+            self.execute(mnemonic.split(" "))
+        return True
+
+    def execute(self, words):
+        op = words[0]
+        if op == "mov":
+            self.set_reg(words[2], self.reg(words[1]))
+        elif op == "cmp":
+            other = words[2]
+            value = self.reg(other) if other in REGISTERS else int(other)
+            self.update_flags(self.reg(words[1]) - value)
+        elif op == "opp":
+            self.alu(" ".join(words[1:]))
+        elif op == "load":
+            self.load(words)
+        elif op == "set":
+            self.ram_page = self.reg(words[1])
+        elif op == "save":
+            self.save(words)
+        elif op == "in":
+            value = self.inputs[self._input] if self._input < len(self.inputs) else 0
+            self._input += 1
+            self.set_reg(words[1], value)
+        elif op == "out":
+            self.out(words[1])
+
+    def alu(self, text):
+        if text == "clr":
+            self.reset_flags()
+            return
+        if text in ("carry on", "carry off"):
+            self.carry_mode = text == "carry on"
+            return
+        if text in ("sign on", "sign off"):
+            self.signed_mode = text == "sign on"
+            return
+        if text in ("0", "1", "-1"):
+            # hardware_vm.ts writes these to register a
+            result, dest = int(text), "a"
+        elif len(text) == 1:
+            result, dest = self.reg(text), text
+        elif text[0] in "~-":
+            a = self.reg(text[1])
+            result, dest = (~a if text[0] == "~" else -a), text[1]
+        elif text[1:] in ("+1", "-1"):
+            result, dest = self.reg(text[0]) + int(text[1:]), text[0]
+        else:
+            dest, operator, source = text[0], text[1:-1], text[-1]
+            a, b = self.reg(dest), self.reg(source)
+            if operator == "+":
+                result = a + b + (1 if self.carry_mode and self.cflag else 0)
+            elif operator == "-":
+                result = a - b
+            elif operator == "*":
+                result = a * b
+            elif operator == ".*":
+                result = (a * b) >> 8
+            elif operator == "/":
+                result = a // b if b else INFINITY
+            elif operator == "&":
+                result = a & b
+            else:
+                result = a | b
+        self.update_flags(result)
+        self.set_reg(dest, result)
+
+    def load(self, words):
+        if words[1] == "rom":
+            self.set_reg(words[2], self.fetch())
+            return
+        address = words[1][len("ram[") : -1]
+        if address == "{number}":
+            value = self.ram[self.fetch()]
+        else:
+            value = self.ram[(self.reg(address) + (self.ram_page << 8)) & 0xFF]
+        self.set_reg(words[2], value)
+
+    def save(self, words):
+        value = self.reg(words[1])
+        target = words[2]
+        if target == "mar":
+            self.mar = value
+        elif target == "ram[current]":
+            self.ram[self.mar] = value
+        elif target == "ram[{number}]":
+            self.ram[self.fetch()] = value
+        else:
+            self.ram[self.reg(target[len("ram[") : -1])] = value
+
+    def out(self, source):
+        if source == "{number}":
+            value = self.fetch()
+        elif source == "ram[{number}]":
+            value = self.ram[self.fetch()]
+        elif source.startswith("ram["):
+            value = self.ram[self.reg(source[len("ram[") : -1])]
+        else:
+            value = self.reg(source)
+            if self.signed_mode and value & 0x80:
+                value -= 256
+        self.outputs.append(value)
+
+    def run(self, steps, expected_outputs=None):
+        """Run until halt, the end of the program, the step budget or enough
+        outputs, stop_reason says which."""
+        self.stop_reason = "steps"
+        for _ in range(steps):
+            if not self.step():
+                self.stop_reason = "halt"
+                break
+            if self.pc >= len(self.rom):
+                self.stop_reason = "end"
+                break
+            if expected_outputs is not None and len(self.outputs) >= expected_outputs:
+                self.stop_reason = "outputs"
+                break
+        return self.outputs
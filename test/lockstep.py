@@ -0,0 +1,159 @@
+import collections
+
+import cocotb
+from cocotb.triggers import ReadOnly, RisingEdge
+
+from jrb16 import REGISTER_NAMES
+from jrb16.isa import mnemonic
+from jrb16.model import (
+    Computer,
+    CU_STATE_NAMES,
+    FLAGS_1,
+    ModelError,
+    QSPI_IDLE,
+    UPDATE_IR,
+)
+
+# Architectural state compared at every instruction boundary
+FIELDS = (
+    ["cu_state", "pc"]
+    + list(REGISTER_NAMES)
+    + ["mar", "mpage", "zflag", "cflag", "oflag", "sflag"]
+)
+
+
+def dut_handles(computer):
+    registers = computer.registers_module
+    cmp = computer.cmp_module
+    handles = {
+        "cu_state": computer.cu_module.cu_state,
+        "pc": computer.cu_module.pc_reg,
+        "mar": registers.mar_reg,
+        "mpage": registers.mpage_reg,
+        "zflag": cmp.zflag,
+        "cflag": cmp.cflag,
+        "oflag": cmp.oflag,
+        "sflag": cmp.sflag,
+    }
+    for name in REGISTER_NAMES:
+        handles[name] = getattr(registers, name + "reg")
+    return handles
+
+
+def read(handle):
+    value = handle.value
+    return value.integer if value.is_resolvable else None
+
+
+def model_state(model):
+    state = {
+        "cu_state": model.cu_state,
+        "pc": model.pc,
+        "mar": model.mar,
+        "mpage": model.mpage,
+        "zflag": model.zflag,
+        "cflag": model.cflag,
+        "oflag": model.oflag,
+        "sflag": model.sflag,
+    }
+    for i, name in enumerate(REGISTER_NAMES):
+        state[name] = model.regs[i]
+    return state
+
+
+def format_value(field, value):
+    if value is None:
+        return "x"
+    if field == "cu_state":
+        return CU_STATE_NAMES[value] if value < len(CU_STATE_NAMES) else str(value)
+    return "%x" % value
+
+
+class Lockstep(object):
+    """Runs the Python model next to the DUT and compares them every instruction.
+
+    The model is stepped once per rising clock edge. Whenever either side is
+    back at UPDATE_IR the architectural state of both is compared, and the
+    first difference is kept in self.failure along with the last instructions
+    the model executed.
+    """
+
+    def __init__(self, computer, clk, ROM, history=16):
+        self.computer = computer
+        self.clk = clk
+        self.model = Computer(ROM)
+        self.handles = dut_handles(computer)
+        self.qspi_state = computer.qspi_rom_module.qspi_state
+        self.history = collections.deque(maxlen=history)
+        self.instructions = 0
+        self.failure = None
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._check())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def compare(self):
+        dut = {name: read(handle) for name, handle in self.handles.items()}
+        model = model_state(self.model)
+        return [(f, dut[f], model[f]) for f in FIELDS if dut[f] != model[f]]
+
+    def report(self, diff):
+        lines = [
+            "Lockstep divergence at cycle %d after %d instructions"
+            % (self.model.cycle, self.instructions),
+            "  %-8s %10s %10s" % ("", "dut", "model"),
+        ]
+        for field, dut, model in diff:
+            lines.append(
+                "  %-8s %10s %10s"
+                % (field, format_value(field, dut), format_value(field, model))
+            )
+        lines.append("Last instructions (model):")
+        for cycle, pc, ir in self.history:
+            lines.append("  %8d  %06x  %03x  %s" % (cycle, pc, ir, mnemonic(ir)))
+        return "\n".join(lines)
+
+    async def _check(self):
+        model = self.model
+        ui_in = self.computer.ui_in
+
+        # Reset may have been released on a clock edge, in which case the
+        # DUT is one edge ahead of the model already
+        await ReadOnly()
+        if read(self.qspi_state) != QSPI_IDLE:
+            model.step()
+        pending_ui_in = read(ui_in) or 0
+
+        while True:
+            await RisingEdge(self.clk)
+            await ReadOnly()
+
+            # Inputs written after an edge only take effect on the next one
+            model.ui_in = pending_ui_in
+            pending_ui_in = read(ui_in) or 0
+
+            previous_state = model.cu_state
+            try:
+                model.step()
+            except ModelError:
+                # Running off the end of the ROM is reported by the harness
+                return
+            if previous_state == UPDATE_IR and model.cu_state == FLAGS_1:
+                self.instructions += 1
+                self.history.append((model.cycle, model.pc, model.ir))
+
+            if (
+                model.cu_state == UPDATE_IR
+                or read(self.handles["cu_state"]) == UPDATE_IR
+            ):
+                diff = self.compare()
+                if diff:
+                    self.failure = self.report(diff)
+                    print(self.failure)
+                    return
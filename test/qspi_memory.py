@@ -0,0 +1,179 @@
+import cocotb
+from cocotb.triggers import FallingEdge, First, ReadOnly, RisingEdge
+from cocotb.utils import get_sim_time
+
+QUAD_READ_COMMAND = 0xEB
+QUAD_WRITE_COMMAND = 0x32
+
+# Transaction shape driven by src/qspi.sv, in sclk cycles of 4 bits each
+COMMAND_CYCLES = 8
+ADDRESS_CYCLES = 8
+DUMMY_CYCLES = 4
+DATA_CYCLES = 8
+
+# uio pins carrying sd0..sd3
+IO_PINS = (1, 2, 4, 5)
+
+ROM_BASE = 0x800000
+RAM_BASE = 0x000000
+
+# uio pins carrying the chip selects
+ROM_CS = 0
+RAM_CS = 6
+
+# With xip, mode bits M5-4 = 0b10 after the address keep the flash in
+# continuous read mode: the next transaction starts at the address
+XIP_MODE_MASK = 0x30
+XIP_MODE = 0x20
+
+
+class QspiMemory(object):
+    """Flash/PSRAM stand-in hanging off the shared QSPI pins.
+
+    The memory sleeps until its chip select falls and then follows the
+    transaction edge by edge on sclk, so the main test loop never has to poll
+    the bus. Each address holds one 32-bit word. Transactions are added to
+    trace, a jrb16.trace.QspiTrace, when one is given.
+
+    By default it serves exactly what src/qspi.sv asks for. The rest models
+    how a real flash behaves, for trying out fetch changes in the RTL:
+
+    burst         a quad read keeps returning the following words for as long
+                  as CS stays low and sclk keeps running
+    xip           the address phase is 6 address nibbles and 2 mode nibbles,
+                  like a real 0xEB read, instead of {8'b0, address}. Mode
+                  bits 0bxx10xxxx skip the command of the next transaction
+    dummy_cycles  sclk cycles between the address and the data
+    """
+
+    def __init__(
+        self,
+        computer,
+        cs,
+        data,
+        base=0,
+        writable=False,
+        trace=None,
+        burst=False,
+        xip=False,
+        dummy_cycles=DUMMY_CYCLES,
+    ):
+        self.computer = computer
+        self.sclk = computer.uio_out[3]
+        self.cs_pin = cs
+        self.cs = computer.uio_out[cs]
+        self.data = data
+        self.base = base
+        self.writable = writable
+        self.trace = trace
+        self.burst = burst
+        self.xip = xip
+        self.dummy_cycles = dummy_cycles
+        # In continuous read mode, the next transaction has no command
+        self.continuous = False
+        self.error = None
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._serve())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def _index(self, address):
+        index = address - self.base
+        if not 0 <= index < len(self.data):
+            raise IndexError("address %06x outside of memory" % address)
+        return index
+
+    def read(self, address):
+        return self.data[self._index(address)]
+
+    def write(self, address, value):
+        assert self.writable, "write to read-only memory at %06x" % address
+        self.data[self._index(address)] = value
+
+    def _read_nibble(self):
+        uio_out = self.computer.uio_out.value.integer
+        nibble = 0
+        for i, pin in enumerate(IO_PINS):
+            nibble |= ((uio_out >> pin) & 1) << i
+        return nibble
+
+    def _drive_nibble(self, nibble):
+        for i, pin in enumerate(IO_PINS):
+            self.computer.uio_in[pin].value = (nibble >> i) & 1
+
+    async def _shift_in(self, cycles):
+        value = 0
+        for _ in range(cycles):
+            await RisingEdge(self.sclk)
+            # Sample once the edge has settled, the address can change with it
+            await ReadOnly()
+            value = (value << 4) | self._read_nibble()
+        return value
+
+    async def _clock_or_deselect(self):
+        """Wait for the next rising sclk edge, False if CS rises first."""
+        clock = RisingEdge(self.sclk)
+        return await First(clock, RisingEdge(self.cs)) is clock
+
+    async def _address(self):
+        """The address and the mode bits, if the address phase carries any."""
+        value = await self._shift_in(ADDRESS_CYCLES)
+        if self.xip:
+            return (value >> 8) & 0xFFFFFF, value & 0xFF
+        return value & 0xFFFFFF, None
+
+    async def _transaction(self):
+        if self.continuous:
+            command = QUAD_READ_COMMAND
+        else:
+            command = (await self._shift_in(COMMAND_CYCLES)) & 0xFF
+        address, mode = await self._address()
+
+        if command == QUAD_READ_COMMAND:
+            if mode is not None:
+                self.continuous = mode & XIP_MODE_MASK == XIP_MODE
+
+            for _ in range(self.dummy_cycles):
+                await RisingEdge(self.sclk)
+
+            first = data = self.read(address)
+            word = 0
+            while True:
+                for i in range(DATA_CYCLES):
+                    # Only a burst can be cut short, a single read always
+                    # finishes
+                    if word == 0:
+                        await RisingEdge(self.sclk)
+                    elif not await self._clock_or_deselect():
+                        return command, address, first
+                    elif i == 0:
+                        data = self.read(address + word)
+                    self._drive_nibble((data >> (28 - i * 4)) & 0xF)
+                if not self.burst:
+                    return command, address, first
+                word += 1
+        elif command == QUAD_WRITE_COMMAND:
+            data = await self._shift_in(DATA_CYCLES)
+            self.write(address, data)
+            return command, address, data
+        else:
+            raise AssertionError("Unknown QSPI command %02x" % command)
+
+    async def _serve(self):
+        while True:
+            await FallingEdge(self.cs)
+            start = get_sim_time("ns")
+            try:
+                command, address, data = await self._transaction()
+            except Exception as e:
+                self.error = e
+                return
+            if self.trace is not None:
+                duration = get_sim_time("ns") - start
+                self.trace.record(start, self.cs_pin, command, address, data, duration)
@@ -0,0 +1,201 @@
+"""Run every cocotb test in its own simulator process.
+
+The design is built once, then each @cocotb.test is run on its own with
+TESTCASE so the tests are spread across all cores. The per test results are
+merged back into a single results.xml, the same file a plain `make` writes.
+
+    python regression.py                # RTL tests (MODULE=test)
+    python regression.py GATES=yes      # gate level test_full, one per program
+    python regression.py -j 4 -k alu    # 4 processes, tests matching "alu"
+    python regression.py --programs GATES=yes   # reassemble changed programs
+
+Any NAME=value argument is passed through to make.
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from jrb16.assembler import AssemblerError
+from jrb16.build import build
+from jrb16.image import PROGRAM_DIR
+
+TEST_DIR = Path(__file__).resolve().parent
+
+
+def is_cocotb_test(decorator):
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    return (
+        isinstance(decorator, ast.Attribute)
+        and decorator.attr == "test"
+        and isinstance(decorator.value, ast.Name)
+        and decorator.value.id == "cocotb"
+    )
+
+
+def discover(module, seen=None):
+    """Names of the cocotb tests in a test module, following `import *`."""
+    seen = set() if seen is None else seen
+    path = TEST_DIR / (module + ".py")
+    if module in seen or not path.exists():
+        return []
+    seen.add(module)
+
+    tests = []
+    for node in ast.parse(path.read_text(), str(path)).body:
+        if isinstance(node, ast.AsyncFunctionDef) and any(
+            is_cocotb_test(d) for d in node.decorator_list
+        ):
+            tests.append(node.name)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            if any(alias.name == "*" for alias in node.names):
+                tests += discover(node.module, seen)
+    return tests
+
+
+def make(variables, *args, log=None):
+    command = ["make"] + list(args) + ["%s=%s" % kv for kv in variables.items()]
+    with open(log, "w") if log else open(os.devnull, "w") as out:
+        return subprocess.run(
+            command, cwd=TEST_DIR, stdout=out, stderr=subprocess.STDOUT
+        ).returncode
+
+
+def run_test(variables, shard_dir, name):
+    results = shard_dir / (name + ".xml")
+    log = shard_dir / (name + ".log")
+    if results.exists():
+        results.unlink()
+
+    start = time.time()
+    # Waveforms are off by default, when on each test writes its own file
+    extension = ".fst" if variables.get("DUMP") == "fst" else ".vcd"
+    returncode = make(
+        dict(
+            variables,
+            TESTCASE=name,
+            COCOTB_RESULTS_FILE=results,
+            DUMP_FILE=shard_dir / (name + extension),
+        ),
+        log=log,
+    )
+    return name, returncode, time.time() - start, results, log
+
+
+def merge(shards, output):
+    """Combine the per test results into one cocotb style results.xml."""
+    root = ET.Element("testsuites", name="results")
+    suite = ET.SubElement(root, "testsuite", name="all", package="all")
+
+    for name, returncode, duration, results, log in shards:
+        cases = []
+        if results.exists():
+            cases = ET.parse(results).getroot().iter("testcase")
+            cases = [case for case in cases if case.get("name") == name]
+        if not cases:
+            # The simulator died before cocotb could write its results
+            case = ET.Element("testcase", name=name, time="%.2f" % duration)
+            ET.SubElement(
+                case,
+                "failure",
+                message="make exited with %d, see %s" % (returncode, log),
+            )
+            cases = [case]
+        suite.extend(cases)
+
+    ET.ElementTree(root).write(output, encoding="UTF-8", xml_declaration=True)
+    return suite
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="processes to run"
+    )
+    parser.add_argument("-k", "--filter", help="only run tests containing this")
+    parser.add_argument(
+        "-o", "--output", default="results.xml", help="merged results file"
+    )
+    parser.add_argument(
+        "--programs",
+        action="store_true",
+        help="reassemble the example programs that changed first",
+    )
+    parser.add_argument("variables", nargs="*", help="NAME=value passed to make")
+    args = parser.parse_args(argv)
+
+    variables = dict(v.split("=", 1) for v in args.variables)
+    gates = variables.get("GATES") == "yes"
+    variables.setdefault("SIM_BUILD", "sim_build/gl" if gates else "sim_build/rtl")
+    variables.setdefault("MODULE", "test_full" if gates else "test")
+    variables.setdefault("DUMP", "off")
+    if variables.setdefault("SIM", "icarus") != "icarus":
+        parser.error("only icarus is supported")
+
+    tests = discover(variables["MODULE"])
+    if args.filter:
+        tests = [t for t in tests if args.filter in t]
+    if not tests:
+        parser.error("no tests found in %s" % variables["MODULE"])
+
+    if args.programs:
+        try:
+            report = build(sorted(PROGRAM_DIR.glob("*.j")))
+        except AssemblerError as e:
+            print("Can't assemble the example programs: %s" % e)
+            return 1
+        failed = [
+            (source, message) for source, state, message in report if state == "failed"
+        ]
+        built = sum(state == "built" for _, state, _ in report)
+        print("Assembled %d of %d example programs" % (built, len(report)))
+        for source, message in failed:
+            print("Failed to assemble %s: %s" % (source.name, message))
+        if failed:
+            return 1
+
+    sim_build = TEST_DIR / variables["SIM_BUILD"]
+    shard_dir = sim_build / "shards"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    print("Building %s" % variables["SIM_BUILD"])
+    build_log = shard_dir / "build.log"
+    if make(variables, "-B", variables["SIM_BUILD"] + "/sim.vvp", log=build_log):
+        print("Build failed, see %s" % build_log)
+        return 1
+
+    print("Running %d tests with %d processes" % (len(tests), args.jobs))
+    start = time.time()
+    shards = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        jobs = [pool.submit(run_test, variables, shard_dir, t) for t in tests]
+        for job in jobs:
+            shards.append(job.result())
+
+    suite = merge(shards, TEST_DIR / args.output)
+    failures = 0
+    for case in suite.iter("testcase"):
+        failed = case.find("failure") is not None
+        failures += failed
+        print(
+            "%-40s %s %8ss"
+            % (case.get("name"), "FAIL" if failed else "PASS", case.get("time"))
+        )
+    print(
+        "%d passed, %d failed in %.1fs, results in %s"
+        % (len(shards) - failures, failures, time.time() - start, args.output)
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
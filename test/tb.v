@@ -6,13 +6,6 @@
 */
 module tb ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
-  initial begin
-    $dumpfile("tb.vcd");
-    $dumpvars(0, tb);
-    #1;
-  end
-
   // Wire up the inputs and outputs:
   reg clk;
   reg rst_n;
@@ -27,6 +20,77 @@ module tb ();
   wire VGND = 1'b0;
 `endif
 
+  // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  //
+  // The dump is controlled with plusargs, see the Makefile for the matching
+  // variables:
+  //   +nodump               only dump while cocotb drives dump_on high
+  //   +dumpfile=<file>      defaults to tb.vcd, run vvp with -fst for FST
+  //   +dumpstart=<cycle>    first clock cycle to dump
+  //   +dumpstop=<cycle>     clock cycle to stop dumping at
+  //   +dumpscope=<module>   cu, alu, cmp, jmp, qspi or registers (RTL only)
+  //   +dumpdepth=<levels>   $dumpvars depth, 0 for everything below the scope
+  reg [8*256-1:0] dump_file;
+  reg [8*16-1:0] dump_scope;
+  integer dump_depth = 0;
+  integer dump_start = 0;
+  integer dump_stop = 0;
+  integer dump_cycle = 0;
+  reg dump_started = 1'b0;
+  reg no_dump;
+
+  // cocotb can drive this to window the dump from Python
+  reg dump_on;
+
+  task start_dump;
+    begin
+      if (!dump_started) begin
+        $dumpfile(dump_file);
+`ifndef GL_TEST
+        // Keep the pins when only dumping one module
+        if (dump_scope != "") $dumpvars(1, tb);
+        if (dump_scope == "cu") $dumpvars(dump_depth, tb.tt_um_aerox2_jrb16_computer.cu_module);
+        else if (dump_scope == "alu") $dumpvars(dump_depth, tb.tt_um_aerox2_jrb16_computer.alu_module);
+        else if (dump_scope == "cmp") $dumpvars(dump_depth, tb.tt_um_aerox2_jrb16_computer.cmp_module);
+        else if (dump_scope == "jmp") $dumpvars(dump_depth, tb.tt_um_aerox2_jrb16_computer.jmp_module);
+        else if (dump_scope == "qspi") $dumpvars(dump_depth, tb.tt_um_aerox2_jrb16_computer.qspi_rom_module);
+        else if (dump_scope == "registers") $dumpvars(dump_depth, tb.tt_um_aerox2_jrb16_computer.registers_module);
+        else
+`endif
+        $dumpvars(dump_depth, tb);
+        dump_started = 1'b1;
+      end else begin
+        $dumpon;
+      end
+    end
+  endtask
+
+  initial begin
+    if (!$value$plusargs("dumpfile=%s", dump_file)) dump_file = "tb.vcd";
+    if (!$value$plusargs("dumpscope=%s", dump_scope)) dump_scope = "";
+    if ($value$plusargs("dumpdepth=%d", dump_depth)) begin end
+    if ($value$plusargs("dumpstart=%d", dump_start)) begin end
+    if ($value$plusargs("dumpstop=%d", dump_stop)) begin end
+    no_dump = $test$plusargs("nodump");
+    if (!no_dump && dump_start == 0) begin
+      start_dump;
+      dump_on = 1'b1;
+    end
+  end
+
+  always @(dump_on) begin
+    if (dump_on === 1'b1) start_dump;
+    else if (dump_started) $dumpoff;
+  end
+
+  always @(posedge clk) begin
+    dump_cycle <= dump_cycle + 1;
+    if (!no_dump) begin
+      if (dump_start != 0 && dump_cycle == dump_start) dump_on <= 1'b1;
+      if (dump_stop != 0 && dump_cycle == dump_stop) dump_on <= 1'b0;
+    end
+  end
+
   tt_um_aerox2_jrb16_computer  tt_um_aerox2_jrb16_computer(
 
       // Include power ports for the Gate Level test:
@@ -1,12 +1,20 @@
 import cocotb
+import os
 import random
+import numpy as np
 from cocotb.clock import Clock
 from cocotb.triggers import Timer, ClockCycles, RisingEdge
 from cocotb.handle import Force
 
+from jrb16.alu import UNIMPLEMENTED, alu_operations, evaluate, random_operands
+
 # TODO: Fine tune this
 ALU_CYCLES = 5
 
+# Operand pairs per opcode in test_alu_bulk. The default keeps a plain make
+# about as long as the single pair tests, ALU_BULK_PAIRS=1000 for a bulk run
+BULK_PAIRS = int(os.environ.get("ALU_BULK_PAIRS", "2"))
+
 async def setup(dut):
     alu = dut.tt_um_aerox2_jrb16_computer.alu_module
     clk = alu.clk
@@ -225,3 +233,46 @@ async def test_alu_shifts(dut):
     alu.a.value = Force(a)
     alu.b.value = Force(b)
     await test(alu, clk, [0x203+i for i in range(56)], [((a & 0xFFFF) >> b) & 0xFFFF for _ in range(56)], False)
+
+async def stream(alu, clk, ir, a_values, b_values):
+    # One opcode, every operand pair back to back, results kept as arrays
+    results = np.zeros(len(a_values), dtype=np.uint16)
+    overflows = np.zeros(len(a_values), dtype=bool)
+    alu.ir.value = Force(ir)
+    for i in range(len(a_values)):
+        alu.a.value = Force(int(a_values[i]))
+        alu.b.value = Force(int(b_values[i]))
+        alu.start.value = Force(1)
+        await ClockCycles(clk, 1)
+        alu.start.value = Force(0)
+        await RisingEdge(alu.done)
+        results[i] = alu.aluout.value.integer
+        overflows[i] = alu.overout.value.integer
+    return results, overflows
+
+def mismatches(operation, a, b, results, overflows, limit=5):
+    expected, overflow = evaluate(operation, a, b)
+    wrong = results != expected
+    if operation in ("+", "-"):
+        wrong |= overflows != overflow
+    return len(np.flatnonzero(wrong)), [
+        "a=%04x b=%04x got %04x/%d expected %04x/%d" % (a[i], b[i], results[i], overflows[i], expected[i], overflow[i])
+        for i in np.flatnonzero(wrong)[:limit]
+    ]
+
+@cocotb.test()
+async def test_alu_bulk(dut):
+    alu, clk, a, b = await setup(dut)
+    rng = np.random.default_rng(random.getrandbits(32))
+
+    failures = []
+    for opcode, operation in sorted(alu_operations().items()):
+        if operation in UNIMPLEMENTED:
+            continue
+        a_values, b_values = random_operands(operation, BULK_PAIRS, rng)
+        results, overflows = await stream(alu, clk, opcode, a_values, b_values)
+        count, examples = mismatches(operation, a_values, b_values, results, overflows)
+        if count:
+            failures.append("%03x (%s): %d of %d wrong\n    %s" % (opcode, operation, count, BULK_PAIRS, "\n    ".join(examples)))
+
+    assert not failures, "\n".join(failures)
@@ -1,12 +1,31 @@
 import math
 import glob
+import os
 from pathlib import Path
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import Timer, ClockCycles
+from cocotb.triggers import Timer, ClockCycles, FallingEdge
+from cocotb.utils import get_sim_time
 
-RAM = [0xFF] * 65536
+from checkpoint import can_capture, capture, restore
+from jrb16 import HALT_BIT, Memory, load_image, load_program
+from jrb16.model import PC_LOOP_CYCLES, QSPI_IDLE, UPDATE_IR
+from jrb16.profiler import Profile
+from jrb16.trace import QspiTrace
+from lockstep import Lockstep, read
+from qspi_memory import QspiMemory, ROM_BASE, RAM_BASE, ROM_CS, RAM_CS
+
+# 10 us, in ns
+CLOCK_PERIOD = 10000
+
+# The whole {mpage, mar} space, only the pages a program touches are reset
+RAM = Memory(1 << 24, fill=0xFF)
+
+# Today's RTL fetches a word every five cycles whatever the QSPI returned, so
+# the example programs stop with an error within a few hundred cycles. A
+# long enough image keeps the core fetching for over 20000 cycles.
+LONG_IMAGE = [word & 0x3FF for word in range(4096)]
 
 
 class MicroMock(object):
@@ -15,14 +34,13 @@ class MicroMock(object):
 
 
 async def setup(dut):
-    global RAM
-    RAM = [0xFF] * 65536
+    RAM.reset()
 
     computer = dut.tt_um_aerox2_jrb16_computer
     clk = computer.clk
     sclk = computer.uio_out[3]
 
-    clock = Clock(clk, 10, units="us")
+    clock = Clock(clk, CLOCK_PERIOD, units="ns")
     cocotb.start_soon(clock.start())
 
     computer.rst_n.value = 1
@@ -45,79 +63,133 @@ async def setup(dut):
     return mock, clk, sclk
 
 
-async def wait_for_sclk(sclk, v):
-    q = sclk.value
-    while q != v:
-        q = sclk.value
-        await Timer(5, "us")
-
-
-async def send_data(computer, sclk, ROM, address_24bit, cs_ram):
-    read_or_write = 0
-    for i in range(8):
-        await wait_for_sclk(sclk, 1)
-        read_or_write |= computer.uio_out[1].value.integer << (7 - i)
-        await wait_for_sclk(sclk, 0)
-    assert bin(read_or_write) == bin(0x2) or bin(read_or_write) == bin(0x3)
-
-    address = 0
-    v = 24 if address_24bit else 16
-    for i in range(v):
-        await wait_for_sclk(sclk, 1)
-        address |= computer.uio_out[1].value.integer << (v - 1 - i)
-        await wait_for_sclk(sclk, 0)
-
-    if address >= 0x10000 or cs_ram:
-        address -= 0x10000
-        if read_or_write == 0x2:
-            # Write
-            data = 0
-            for i in range(8):
-                await wait_for_sclk(sclk, 1)
-                data |= computer.uio_out[1].value.integer << (7 - i)
-                await wait_for_sclk(sclk, 0)
-            await wait_for_sclk(sclk, 0)
-
-            # print("Written data is", data, "at", address)
-            RAM[address] = data
-        else:
-            # Read
-            data = RAM[address]
-            # print("Read data is", data)
-            for i in range(8):
-                await wait_for_sclk(sclk, 0)
-                computer.uio_in[2].value = (data >> (7 - i)) & 1
-                await wait_for_sclk(sclk, 1)
-            await wait_for_sclk(sclk, 0)
-            computer.uio_in[2].value = 0
-    else:
-        assert bin(read_or_write) == bin(0x03)
-        data = ROM[address]
-        # print("Reading ROM from", address, "which is", data)
+# How the last run() ended, filled in as each run finishes
+STATS = MicroMock(
+    cycles=0, reason=None, checkpoint=None, profile=None, trace=None, instructions=None
+)
+
+
+def probe(handle, name):
+    # Internal signals are not available in every netlist (e.g. gate level)
+    try:
+        return getattr(handle, name)
+    except AttributeError:
+        return None
+
+
+async def run(
+    dut,
+    ROM,
+    cycles,
+    address_24bit=False,
+    inputs=[],
+    expected_outputs=None,
+    stop_on_halt=True,
+    stop_on_pc_loop=True,
+    lockstep=None,
+    dump_window=None,
+    checkpoint_at=None,
+    resume=None,
+    profile=None,
+    trace=None,
+    flash=None,
+):
+    # Only for debugging
+    _computer = dut.tt_um_aerox2_jrb16_computer
 
-        for i in range(8):
-            await wait_for_sclk(sclk, 0)
-            computer.uio_in[2].value = (data >> (7 - i)) & 1
-            await wait_for_sclk(sclk, 1)
-        await wait_for_sclk(sclk, 0)
-        computer.uio_in[2].value = 0
+    # Every QSPI transaction, QSPI_TRACE=<directory> traces every run and
+    # writes the logs there
+    trace_dir = os.environ.get("QSPI_TRACE")
+    if trace is None and trace_dir and dump_window is None:
+        trace = QspiTrace(CLOCK_PERIOD, start=get_sim_time("ns"))
 
+    # flash holds QspiMemory options for the ROM, e.g. {"burst": True}
+    flash = flash or {}
 
-async def run(dut, ROM, cycles, address_24bit=False, inputs=[]):
-    computer, clk, sclk = await setup(dut)
+    # The memories have to be listening before reset releases the QSPI bus
+    rom = QspiMemory(_computer, ROM_CS, ROM, ROM_BASE, trace=trace, **flash).start()
+    ram = QspiMemory(_computer, RAM_CS, RAM, RAM_BASE, True, trace).start()
 
-    # Only for debugging
-    _computer = dut.tt_um_aerox2_jrb16_computer
+    computer, clk, sclk = await setup(dut)
 
     computer.uio_in[7].value = address_24bit
 
     outputs = []
     current_input = -1
     previous_output = None
+    first_cycle = 0
+
+    if resume is not None:
+        # The QSPI can start a transaction as reset is released, so put the
+        # state back between two edges and give the memories a fresh start
+        await FallingEdge(clk)
+        rom.stop()
+        ram.stop()
+        restore(resume, _computer, RAM)
+        rom = QspiMemory(_computer, ROM_CS, ROM, ROM_BASE, trace=trace, **flash).start()
+        ram = QspiMemory(_computer, RAM_CS, RAM, RAM_BASE, True, trace).start()
+
+        outputs = list(resume.outputs)
+        current_input = resume.current_input
+        previous_output = outputs[-1] if outputs else None
+        first_cycle = resume.cycle
+
+    # Compare against the Python model every instruction, LOCKSTEP=1 turns
+    # this on for every run
+    if lockstep is None:
+        lockstep = os.environ.get("LOCKSTEP", "0") == "1"
+    # The model always starts from reset
+    if lockstep and resume is None:
+        checker = Lockstep(_computer, clk, ROM).start()
+    else:
+        checker = None
+
+    # Cycles per PC and instruction, PROFILE=<directory> profiles every run
+    # and writes the reports there
+    profile_dir = os.environ.get("PROFILE")
+    if profile is None and profile_dir and dump_window is None:
+        profile = Profile()
+    cu = probe(_computer, "cu_module")
+    if profile is not None and cu is None:
+        print("Profiling needs the RTL, not the gate level netlist")
+        profile = None
+    if profile is not None:
+        qspi_state = _computer.qspi_rom_module.qspi_state
+
+    flags = probe(_computer, "flags") if stop_on_halt else None
+    pc = probe(_computer, "pc") if stop_on_pc_loop else None
+
+    previous_pc = None
+    pc_stable = 0
+    instructions = 0
+
+    STATS.cycles = cycles
+    STATS.reason = "budget"
+    STATS.checkpoint = None
+    STATS.profile = profile
+    STATS.trace = trace
+    STATS.instructions = None
+
+    for cycle in range(first_cycle, cycles):
+        if dump_window is not None:
+            if cycle == dump_window[0]:
+                dut.dump_on.value = 1
+            elif cycle == dump_window[1]:
+                dut.dump_on.value = 0
 
-    for cycle in range(cycles):
         await ClockCycles(clk, 1)
 
+        if profile is not None:
+            profile.record(
+                read(cu.pc_reg),
+                read(cu.cu_state),
+                read(cu.ir_reg),
+                read(qspi_state) != QSPI_IDLE,
+            )
+        # Instructions retired, the gate level netlist has no CU state
+        if cu is not None:
+            instructions += read(cu.cu_state) == UPDATE_IR
+
         current_output = computer.uo_out.value
         if current_output != previous_output:
             outputs.append(current_output)
@@ -127,34 +199,119 @@ async def run(dut, ROM, cycles, address_24bit=False, inputs=[]):
                 computer.ui_in.value = inputs[current_input]
         previous_output = current_output
 
-        try:
-            cs_rom = computer.uio_out[0] == 0
-            cs_ram = computer.uio_out[4] == 0
-
-            v = (cs_rom) if address_24bit else (cs_rom | cs_ram)
-            if v:
-                await send_data(
-                    computer,
-                    sclk,
-                    ROM,
-                    address_24bit,
-                    cs_ram and not address_24bit,
-                )
-        except Exception as e:
-            print(e)
+        error = rom.error or ram.error
+        if error is not None:
+            print(error)
             print(f"Failure at cycle: {cycle}")
             print(f"PC was: {_computer.pc.value.integer}")
-            print(RAM[:50])
+            print(RAM[:50].tolist())
+            STATS.cycles = cycle + 1
+            STATS.reason = "error"
             break
+
+        if checker is not None and checker.failure is not None:
+            STATS.cycles = cycle + 1
+            STATS.reason = "lockstep"
+            break
+
+        reason = None
+        if expected_outputs is not None and len(outputs) >= expected_outputs:
+            reason = "outputs"
+        elif flags is not None:
+            value = flags.value
+            if value.is_resolvable and (value.integer >> HALT_BIT) & 1:
+                reason = "halt"
+        if reason is None and pc is not None:
+            current_pc = pc.value
+            if current_pc == previous_pc:
+                pc_stable += 1
+                if pc_stable >= PC_LOOP_CYCLES:
+                    reason = "pc loop"
+            else:
+                pc_stable = 0
+            previous_pc = current_pc
+
+        if reason is not None:
+            STATS.cycles = cycle + 1
+            STATS.reason = reason
+            break
+
+        # Snapshot at the first cycle from checkpoint_at with the bus idle
+        if checkpoint_at is not None and STATS.checkpoint is None:
+            if cycle + 1 >= checkpoint_at:
+                await FallingEdge(clk)
+                if can_capture(_computer):
+                    STATS.checkpoint = capture(
+                        _computer, cycle + 1, RAM, current_input, outputs
+                    )
+
+    if cu is not None:
+        STATS.instructions = instructions
+    print(f"Ran {STATS.cycles} of {cycles} cycles, stopped by {STATS.reason}")
+    if profile is not None:
+        profile.finish()
+        print(profile.summary())
+        if profile_dir:
+            profile.save(profile_dir)
+    if trace is not None:
+        print(trace.format_summary(get_sim_time("ns"), instructions, ROM_CS))
+        if trace_dir:
+            trace.save(trace_dir)
+
+    rom.stop()
+    ram.stop()
+    if checker is not None:
+        checker.stop()
+    if dump_window is not None:
+        dut.dump_on.value = 0
+
+    # Run the program again with waveforms on for the last few cycles before
+    # it failed, DUMP_ON_FAILURE=<cycles> sets how many
+    window = int(os.environ.get("DUMP_ON_FAILURE", "0"))
+    if window > 0 and dump_window is None and failed(expected_outputs):
+        end = STATS.cycles
+        start = max(0, end - window)
+        print(f"Re-running with waveforms on for cycles {start} to {end}")
+        # STATS has to describe the failing run, not the rerun
+        failing = dict(vars(STATS))
+        await run(
+            dut,
+            ROM,
+            end,
+            address_24bit,
+            inputs,
+            expected_outputs,
+            stop_on_halt,
+            stop_on_pc_loop,
+            lockstep,
+            (start, end),
+            resume=resume if resume is not None and resume.cycle <= start else None,
+            flash=flash,
+        )
+        vars(STATS).update(failing)
+
+    if checker is not None:
+        assert checker.failure is None, checker.failure
     return outputs
 
 
-async def load_and_run(dut, path, steps, address_24bit=False, inputs=[]):
-    with open(path, "r") as f:
-        program_d = f.readlines()
-    program_b = [int(x, 16) for x in program_d[1].split()]
+def failed(expected_outputs):
+    if STATS.reason in ("error", "lockstep"):
+        return True
+    return expected_outputs is not None and STATS.reason != "outputs"
+
+
+async def load_and_run(dut, path, steps, address_24bit=False, inputs=[], **kwargs):
+    program_b = load_image(path)
 
-    return await run(dut, program_b, steps, address_24bit, inputs)
+    # Name the reports after the program, and use its labels if it has any
+    name = Path(path).stem + ("_24bit" if address_24bit else "")
+    if os.environ.get("PROFILE") and "profile" not in kwargs:
+        kwargs["profile"] = Profile(load_program(path).symbols, name)
+    if os.environ.get("QSPI_TRACE") and "trace" not in kwargs:
+        kwargs["trace"] = QspiTrace(CLOCK_PERIOD, start=get_sim_time("ns"), name=name)
+
+    return await run(dut, program_b, steps, address_24bit, inputs, **kwargs)
 
 
 def string_to_dict(s):
@@ -167,24 +324,28 @@ def string_to_dict(s):
 
 @cocotb.test()
 async def test_add_example(dut):
-    outputs = await load_and_run(dut, "../example_programs/assembly/add_program.o", 200)
+    outputs = await load_and_run(
+        dut, "../example_programs/assembly/add_program.o", 200, expected_outputs=2
+    )
     assert outputs[1] == 34
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/add_program.o", 200, True
+        dut, "../example_programs/assembly/add_program.o", 200, True, expected_outputs=2
     )
     assert outputs[1] == 34
 
 
 @cocotb.test()
 async def test_output_example(dut):
-    outputs = await load_and_run(dut, "../example_programs/assembly/output.o", 200)
+    outputs = await load_and_run(
+        dut, "../example_programs/assembly/output.o", 200, expected_outputs=4
+    )
     assert outputs[1] == 13
     assert outputs[2] == 37
     assert outputs[3] == 74
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/output.o", 200, True
+        dut, "../example_programs/assembly/output.o", 200, True, expected_outputs=4
     )
     assert outputs[1] == 13
     assert outputs[2] == 37
@@ -194,14 +355,24 @@ async def test_output_example(dut):
 @cocotb.test()
 async def test_input_example(dut):
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/input_program.o", 500, False, [41, 42, 43]
+        dut,
+        "../example_programs/assembly/input_program.o",
+        500,
+        False,
+        [41, 42, 43],
+        expected_outputs=4,
     )
     assert outputs[1] == -1 & 0xFF
     assert outputs[2] == 0
     assert outputs[3] == 1
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/input_program.o", 500, True, [41, 42, 43]
+        dut,
+        "../example_programs/assembly/input_program.o",
+        500,
+        True,
+        [41, 42, 43],
+        expected_outputs=4,
     )
     assert outputs[1] == -1 & 0xFF
     assert outputs[2] == 0
@@ -210,11 +381,13 @@ async def test_input_example(dut):
 
 @cocotb.test()
 async def test_jmp_example(dut):
-    outputs = await load_and_run(dut, "../example_programs/assembly/jmp_program.o", 300)
+    outputs = await load_and_run(
+        dut, "../example_programs/assembly/jmp_program.o", 300, expected_outputs=2
+    )
     assert outputs[1] == 6
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/jmp_program.o", 300, True
+        dut, "../example_programs/assembly/jmp_program.o", 300, True, expected_outputs=2
     )
     assert outputs[1] == 6
 
@@ -222,13 +395,17 @@ async def test_jmp_example(dut):
 @cocotb.test()
 async def test_division_example(dut):
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/division_test.o", 2000
+        dut, "../example_programs/assembly/division_test.o", 2000, expected_outputs=3
     )
     assert outputs[1] == 4
     assert outputs[2] == 7
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/division_test.o", 2000, True
+        dut,
+        "../example_programs/assembly/division_test.o",
+        2000,
+        True,
+        expected_outputs=3,
     )
     assert outputs[1] == 4
     assert outputs[2] == 7
@@ -237,14 +414,18 @@ async def test_division_example(dut):
 @cocotb.test()
 async def test_division_example_2(dut):
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/div_mult_test.o", 900
+        dut, "../example_programs/assembly/div_mult_test.o", 900, expected_outputs=4
     )
     assert outputs[1] == 7
     assert outputs[2] == 115
     assert outputs[3] == 1
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/div_mult_test.o", 900, True
+        dut,
+        "../example_programs/assembly/div_mult_test.o",
+        900,
+        True,
+        expected_outputs=4,
     )
     assert outputs[1] == 7
     assert outputs[2] == 115
@@ -253,7 +434,9 @@ async def test_division_example_2(dut):
 
 @cocotb.test()
 async def test_ram_example(dut):
-    outputs = await load_and_run(dut, "../example_programs/assembly/memory_test.o", 300)
+    outputs = await load_and_run(
+        dut, "../example_programs/assembly/memory_test.o", 300, expected_outputs=3
+    )
     assert RAM[21] == 12
     assert RAM[43] == 34
     assert RAM[65] == 56
@@ -261,7 +444,7 @@ async def test_ram_example(dut):
     assert outputs[2] == 56
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/memory_test.o", 300, True
+        dut, "../example_programs/assembly/memory_test.o", 300, True, expected_outputs=3
     )
     assert RAM[21] == 12
     assert RAM[43] == 34
@@ -273,7 +456,7 @@ async def test_ram_example(dut):
 @cocotb.test()
 async def test_large_numbers_example(dut):
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/large_numbers.o", 3000
+        dut, "../example_programs/assembly/large_numbers.o", 3000, expected_outputs=6
     )
     a = 4567 + 1234
     assert outputs[1] == a & 0xFF
@@ -285,7 +468,11 @@ async def test_large_numbers_example(dut):
     assert outputs[5] == (a >> 16) & 0xFF
 
     outputs = await load_and_run(
-        dut, "../example_programs/assembly/large_numbers.o", 3000, True
+        dut,
+        "../example_programs/assembly/large_numbers.o",
+        3000,
+        True,
+        expected_outputs=6,
     )
     a = 4567 + 1234
     assert outputs[1] == a & 0xFF
@@ -349,3 +536,46 @@ async def test_primes_example(dut):
     assert len(outputs) > 2
     for output in outputs[2:]:
         assert is_prime(output.integer)
+
+
+@cocotb.test()
+async def test_checkpoint_example(dut):
+    if probe(dut.tt_um_aerox2_jrb16_computer, "cu_module") is None:
+        print("Checkpoints need the RTL, skipping")
+        return
+
+    await run(dut, LONG_IMAGE, 5000, checkpoint_at=2500)
+    assert STATS.reason == "budget", STATS.reason
+    checkpoint = STATS.checkpoint
+    assert checkpoint is not None and checkpoint.cycle >= 2500
+
+    # The same later snapshot, once straight through and once resumed
+    await run(dut, LONG_IMAGE, 5000, checkpoint_at=4000)
+    expected = STATS.checkpoint
+    assert expected is not None
+
+    await run(dut, LONG_IMAGE, 5000, checkpoint_at=4000, resume=checkpoint)
+    resumed = STATS.checkpoint
+    assert resumed is not None
+    assert resumed.cycle == expected.cycle
+    assert resumed.signals == expected.signals
+    assert resumed.outputs == expected.outputs
+
+
+@cocotb.test()
+async def test_burst_flash(dut):
+    # src/qspi.sv raises CS after every word, so a flash that would keep
+    # streaming must not change anything
+    rtl = probe(dut.tt_um_aerox2_jrb16_computer, "cu_module") is not None
+    runs = []
+    for flash in ({}, {"burst": True}):
+        outputs = await run(
+            dut, LONG_IMAGE, 2000, checkpoint_at=1500 if rtl else None, flash=flash
+        )
+        assert STATS.reason == "budget", STATS.reason
+        signals = None
+        if rtl:
+            assert STATS.checkpoint is not None, "no idle bus checkpoint by cycle 2000"
+            signals = STATS.checkpoint.signals
+        runs.append((outputs, signals))
+    assert runs[0] == runs[1]
@@ -4,6 +4,9 @@ from cocotb.clock import Clock
 from cocotb.triggers import ClockCycles, Timer
 from cocotb.handle import Force
 
+from jrb16.jmp import FLAG_STATES, flag_state, target, truth_table
+from jrb16.rom import load_roms
+
 
 async def setup(dut):
     jmp = dut.tt_um_aerox2_jrb16_computer.jmp_module
@@ -190,3 +193,35 @@ async def test_jmp_signed_conditions(dut):
     await ClockCycles(clk, 1)
     assert jmp.pcoe.value == 1
 
+
+@cocotb.test()
+async def test_jmp_truth_table(dut):
+    jmp, clk = await setup(dut)
+
+    # pcoe and pcout only depend on ir, the flags and the buses, so every
+    # jump opcode and flag state is checked without clocking or resetting
+    roms = load_roms()
+    jmp.oe.value = Force(1)
+    failures = []
+    for ir, row in truth_table(roms).items():
+        pcin = random.randint(0, (1 << 23) - 1)
+        databus = random.randint(0, 0xFFFF)
+        jmp.ir.value = Force(ir)
+        jmp.pcin.value = Force(pcin)
+        jmp.databus.value = Force(databus)
+        for state in range(FLAG_STATES):
+            z, c, o, s = flag_state(state)
+            jmp.zflag.value = Force(z)
+            jmp.cflag.value = Force(c)
+            jmp.oflag.value = Force(o)
+            jmp.sflag.value = Force(s)
+            await Timer(1)
+
+            expected = target(roms.jmp[ir], pcin, databus) if row[state] else 0
+            if jmp.pcoe.value != row[state] or jmp.pcout.value != expected:
+                failures.append(
+                    "ir %03x z=%d c=%d o=%d s=%d: pcoe %s pcout %s, expected %d %06x"
+                    % (ir, z, c, o, s, jmp.pcoe.value, jmp.pcout.value, row[state], expected)
+                )
+
+    assert not failures, "\n".join(failures)
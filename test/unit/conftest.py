@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The jrb16 package lives next to the cocotb tests in test/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,29 @@
+import numpy as np
+
+from jrb16.alu import UNIMPLEMENTED, alu_operations, datapath, expected
+from jrb16.alu import random_operands
+
+PAIRS = 1000
+
+
+def test_reference_matches_the_alu_rom():
+    operations = alu_operations()
+    rng = np.random.default_rng(0)
+    failures = []
+    for opcode, operation in sorted(operations.items()):
+        if operation in UNIMPLEMENTED:
+            continue
+        a, b = random_operands(operation, PAIRS, rng)
+        result, overflow = datapath(opcode, a, b)
+        want, want_overflow = expected(opcode, a, b, operations)
+        wrong = result != want
+        if operation in ("+", "-"):
+            wrong |= overflow != want_overflow
+        if wrong.any():
+            i = np.flatnonzero(wrong)[0]
+            failures.append(
+                "%03x (%s): a=%04x b=%04x rom %04x reference %04x"
+                % (opcode, operation, a[i], b[i], result[i], want[i])
+            )
+    assert not failures, "\n".join(failures)
+
@@ -0,0 +1,59 @@
+from jrb16.bench import compare, model_instructions, model_results, result
+from jrb16.bench import rtl_word, workloads
+from jrb16.model import Computer
+
+
+def test_errored_runs_fail_without_a_baseline():
+    results = [result("primes", 16, "rtl", 155, 31, 1.0, "error")]
+    _, regressions = compare(results, [])
+    assert regressions == ["primes 16bit rtl: stopped by error"]
+
+
+def test_cpi_and_speed_regressions():
+    baseline = [result("primes", 16, "rtl", 1000, 200, 1.0, "halt")]
+    # Slower, but within the speed tolerance
+    _, regressions = compare(
+        [result("primes", 16, "rtl", 1000, 200, 1.9, "halt")], baseline
+    )
+    assert regressions == []
+
+    _, regressions = compare(
+        [result("primes", 16, "rtl", 1100, 200, 1.0, "halt")], baseline
+    )
+    assert regressions == ["primes 16bit rtl: CPI 5.000 -> 5.500"]
+
+    _, regressions = compare(
+        [result("primes", 16, "rtl", 1000, 200, 2.5, "halt")], baseline
+    )
+    assert regressions == ["primes 16bit rtl: 1000 -> 400 cycles/s"]
+
+
+def test_model_baseline_has_no_speed():
+    baseline = [result("primes", 16, "rtl", 1000, 200, None, "halt")]
+    rows, regressions = compare(
+        [result("primes", 16, "rtl", 1000, 200, 3.0, "halt")], baseline
+    )
+    assert regressions == []
+    assert rows[0]["speed_change"] is None
+
+
+def test_rtl_word_reaches_the_ir():
+    for opcode in (0x00, 0x01, 0xEB, 0xFF):
+        computer = Computer([rtl_word(opcode)] * 64)
+        irs = set()
+        for _ in range(200):
+            computer.step()
+            irs.add(computer.ir)
+        assert opcode in irs
+
+
+def test_workloads_run_for_the_whole_budget():
+    cycles = 2000
+    programs = workloads(cycles)
+    results = model_results(programs, cycles)
+    assert {r["reason"] for r in results} == {"budget"}
+    for r in results:
+        assert r["cycles"] == cycles
+        assert r["instructions"] == model_instructions(programs[r["program"]], cycles)
+    _, regressions = compare(results, [])
+    assert regressions == []
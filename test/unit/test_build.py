@@ -0,0 +1,51 @@
+import shutil
+
+from jrb16.assembler import CU_FLAGS
+from jrb16.build import build
+from jrb16.image import PROGRAM_DIR
+
+PROGRAMS = ("add_program.j", "fibonacci.j", "primes.j")
+
+
+def setup_tree(tmp_path):
+    sources = []
+    for name in PROGRAMS:
+        shutil.copy(PROGRAM_DIR / name, tmp_path)
+        sources.append(tmp_path / name)
+    table = tmp_path / CU_FLAGS.name
+    shutil.copy(CU_FLAGS, table)
+    return sources, table, tmp_path / "cache"
+
+
+def states(report):
+    return [state for _, state, _ in report]
+
+
+def test_second_build_is_a_no_op(tmp_path):
+    sources, table, cache = setup_tree(tmp_path)
+    assert states(build(sources, table, cache)) == ["built"] * len(PROGRAMS)
+    outputs = {path: path.with_suffix(".o").read_bytes() for path in sources}
+
+    report = build(sources, table, cache)
+    assert states(report) == ["cached"] * len(PROGRAMS)
+    # Nothing was installed again either
+    assert [message for _, _, message in report] == [None] * len(PROGRAMS)
+    assert {path: path.with_suffix(".o").read_bytes() for path in sources} == outputs
+
+
+def test_table_change_rebuilds_everything(tmp_path):
+    sources, table, cache = setup_tree(tmp_path)
+    build(sources, table, cache)
+
+    with open(table, "a") as f:
+        f.write("// touched\n")
+    assert states(build(sources, table, cache)) == ["built"] * len(PROGRAMS)
+
+
+def test_source_change_rebuilds_only_that_program(tmp_path):
+    sources, table, cache = setup_tree(tmp_path)
+    build(sources, table, cache)
+
+    with open(sources[0], "a") as f:
+        f.write("\nnop\n")
+    assert states(build(sources, table, cache)) == ["built", "cached", "cached"]
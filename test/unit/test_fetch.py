@@ -0,0 +1,40 @@
+from jrb16.fetch import NOP, FetchBuffer, main, unbuffered_cycles, vm_trace
+from jrb16.image import PROGRAM_DIR, load_image
+from jrb16.isa import read_assembly
+
+
+def test_vm_trace_reads_opcodes_and_operands():
+    trace = vm_trace(load_image(PROGRAM_DIR / "add_program.o"))
+    opcodes = {text: opcode for opcode, text in read_assembly().items()}
+    # load rom a 16, load rom b 18, three nops, opp a+b, out a, halt
+    assert trace == [
+        (0, opcodes["load rom a {number}"]),
+        (1, None),
+        (2, opcodes["load rom b {number}"]),
+        (3, None),
+        (4, NOP),
+        (5, NOP),
+        (6, NOP),
+        (7, opcodes["opp a+b"]),
+        (8, opcodes["out a"]),
+        (9, opcodes["halt"]),
+    ]
+
+
+def test_replay_of_a_straight_program():
+    trace = [(pc, NOP) for pc in range(8)]
+
+    def execute_cycles(word):
+        return 5
+
+    assert unbuffered_cycles(trace, execute_cycles) == 8 * (57 + 5)
+    result = FetchBuffer(line_words=4).replay(trace, execute_cycles)
+    assert result["hits"] == 6
+    assert result["hit_rate"] == 0.75
+
+
+def test_every_example_is_traced(capsys):
+    assert main(["--line-words", "1", "--lines", "1"]) == 0
+    out = capsys.readouterr().out
+    for path in PROGRAM_DIR.glob("*.o"):
+        assert "%s: " % path.stem in out
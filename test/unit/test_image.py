@@ -0,0 +1,87 @@
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from jrb16.assembler import assemble
+from jrb16.image import (
+    HEADER,
+    PROGRAM_DIR,
+    Image,
+    load_program,
+    parse_image,
+    parse_raw,
+    read_image,
+    write_raw,
+)
+
+TEST_DIR = Path(__file__).resolve().parents[1]
+
+
+def primes():
+    return assemble((PROGRAM_DIR / "primes.j").read_text())
+
+
+def test_binary_round_trip(tmp_path):
+    image = primes()
+    image.entry = 3
+
+    parsed = parse_image(image.to_bytes())
+    assert parsed.words == image.words
+    assert parsed.symbols == image.symbols
+    assert (parsed.entry, parsed.width, parsed.address_width) == (3, 8, 16)
+
+    path = tmp_path / "primes.img"
+    image.save(path)
+    for loaded in (read_image(path), load_program(path)):
+        assert loaded.words == image.words
+        assert loaded.symbols == image.symbols
+
+
+def test_crc_catches_corruption():
+    data = bytearray(primes().to_bytes())
+    data[HEADER.size + 1] ^= 0x01
+    with pytest.raises(ValueError, match="CRC"):
+        parse_image(data)
+
+
+def test_truncated_image():
+    with pytest.raises(ValueError, match="too short"):
+        parse_image(primes().to_bytes()[: HEADER.size - 1])
+
+
+def test_wide_words_round_trip():
+    image = Image([0x3FF, 0x1234, 0], width=16, symbols={"start": 1})
+    parsed = parse_image(image.to_bytes())
+    assert parsed.words == [0x3FF, 0x1234, 0]
+    assert parsed.label(2) == "start+1"
+
+
+def test_raw_round_trip():
+    words = primes().words.tolist()
+    f = io.StringIO()
+    write_raw(f, words, chunk=7)
+    assert parse_raw(f.getvalue()) == words
+
+
+def test_stream():
+    programs = [
+        (PROGRAM_DIR / name).read_text() for name in ("simple.j", "add_program.j")
+    ]
+    stdin = "\n---\n".join(programs + ["jmp nowhere"])
+    result = subprocess.run(
+        [sys.executable, str(PROGRAM_DIR / "assembler.py"), "--stream"],
+        input=stdin,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONPATH=str(TEST_DIR)),
+    )
+    lines = result.stdout.splitlines()
+    assert result.returncode == 1
+    assert len(lines) == 3
+    for line, source in zip(lines, programs):
+        assert parse_raw("v2.0 raw\n" + line) == assemble(source).words.tolist()
+    assert lines[2].startswith("error: ")
@@ -0,0 +1,63 @@
+import resource
+
+from jrb16.memory import PAGE_WORDS, Memory
+
+
+def test_fill_reads_back_without_touching_pages():
+    memory = Memory(1 << 24, fill=0xFF)
+    assert memory[0] == 0xFF
+    assert memory[len(memory) - 1] == 0xFF
+    assert memory.present == set()
+    assert memory.dirty == set()
+
+
+def test_large_fill_is_lazy():
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    memory = Memory(1 << 24, fill=0xFF)
+    memory[12345] = 1
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB, the whole buffer would be 64 MiB
+    assert after - before < 8 * 1024
+
+
+def test_writes_mark_their_pages_dirty():
+    memory = Memory(4 * PAGE_WORDS, fill=0xFF)
+    memory[PAGE_WORDS + 3] = 7
+    memory.load([1, 2, 3], 3 * PAGE_WORDS - 1)
+    assert memory.dirty == {1, 2, 3}
+    assert memory[PAGE_WORDS + 3] == 7
+    assert memory[PAGE_WORDS + 4] == 0xFF
+    assert memory[3 * PAGE_WORDS - 1 : 3 * PAGE_WORDS + 2].tolist() == [1, 2, 3]
+
+
+def test_reset_restores_the_fill_value():
+    for fill in (0, 0xFF):
+        memory = Memory(4 * PAGE_WORDS, fill=fill)
+        memory[5] = 1
+        memory[2 * PAGE_WORDS] = 2
+        memory.reset()
+        assert memory.dirty == set()
+        assert memory.tolist() == [fill] * len(memory)
+
+
+def test_snapshot_round_trip():
+    memory = Memory(4 * PAGE_WORDS, fill=0xFF)
+    memory[5] = 1
+    memory[3 * PAGE_WORDS + 1] = 2
+    pages = memory.snapshot()
+    assert sorted(pages) == [0, 3]
+    contents = memory.tolist()
+
+    memory.reset()
+    memory[PAGE_WORDS] = 9
+    memory.restore(pages)
+    assert memory.tolist() == contents
+    assert memory.dirty == {0, 3}
+
+
+def test_slices_see_the_fill_value():
+    memory = Memory(2 * PAGE_WORDS, fill=0xFF)
+    memory[1] = 0
+    assert memory[:3].tolist() == [0xFF, 0, 0xFF]
+    assert memory[PAGE_WORDS : PAGE_WORDS + 2].tolist() == [0xFF, 0xFF]
+    assert memory == [0xFF, 0] + [0xFF] * (2 * PAGE_WORDS - 2)
@@ -0,0 +1,30 @@
+import csv
+import shutil
+
+from jrb16.microcode import ROM_FILES, ROMS, TABLE
+from jrb16.rom import ROM_DIR, load_roms, read_mem
+
+
+def test_table_builds_the_mem_files():
+    roms = load_roms()
+    for rom in ROMS:
+        assert getattr(roms, rom) == read_mem(ROM_DIR / ROM_FILES[rom]), rom
+
+
+def test_load_roms_follows_the_table(tmp_path):
+    for name in ROM_FILES.values():
+        shutil.copy(ROM_DIR / name, tmp_path)
+    with open(TABLE, newline="") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    # Drop the CU flags of one opcode, the .mem files still have them
+    row = next(row for row in rows if row["cu"])
+    row["cu"] = ""
+    with open(tmp_path / "microcode.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, reader.fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    opcode = int(row["opcode"], 16)
+    assert load_roms(tmp_path).cu[opcode] == 0
+    assert read_mem(tmp_path / "cu_rom.mem")[opcode] != 0
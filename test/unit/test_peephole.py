@@ -0,0 +1,103 @@
+import pytest
+
+from jrb16.assembler import Assembler
+from jrb16.image import PROGRAM_DIR
+from jrb16.peephole import Optimizer, optimize, source_lines
+from jrb16.vm import HardwareVM, read_cu_flags
+
+ASSEMBLER = Assembler()
+CU_FLAGS = read_cu_flags()
+
+STEPS = 20000
+INPUTS = [3, 250, 0, 7, 1]
+
+# One program per optimization, each halts after writing its outputs
+PATTERNS = {
+    "redundant_movs": """
+        load rom a 5
+        mov a b
+        mov a b
+        mov b a
+        opp a+b
+        out a
+        halt
+    """,
+    "self_cmp": """
+        load rom a 3
+        load rom b 3
+        cmp a a
+        mov a c
+        cmp a b
+        jmp = same
+        out 1
+        halt
+        :same
+        out 2
+        halt
+    """,
+    "jump_chain": """
+        load rom a 1
+        cmp a 1
+        jmp = hop
+        out 1
+        halt
+        :hop
+        jmp land
+        out 3
+        :land
+        out 2
+        halt
+    """,
+    "jump_to_next": """
+        load rom a 7
+        jmp next
+        :next
+        out a
+        halt
+    """,
+    "short_jump": """
+        load rom a 0
+        load rom b 3
+        :loop
+        opp a+1
+        out a
+        cmp a b
+        jmp < loop
+        halt
+    """,
+}
+
+
+def run(lines, expected_outputs=None):
+    vm = HardwareVM(ASSEMBLER.assemble(lines).words, CU_FLAGS, INPUTS)
+    outputs = vm.run(STEPS, expected_outputs)
+    return outputs, vm.stop_reason
+
+
+@pytest.mark.parametrize("name", sorted(PATTERNS))
+def test_pattern_keeps_behaviour(name):
+    before = source_lines(PATTERNS[name])
+    after, changes = optimize(before, ASSEMBLER)
+    assert changes
+
+    optimizer = Optimizer(ASSEMBLER)
+    assert optimizer.program_size(after) < optimizer.program_size(before)
+
+    outputs, reason = run(before)
+    assert reason == "halt" and outputs
+    assert run(after) == (outputs, reason)
+
+
+@pytest.mark.parametrize(
+    "path", sorted(PROGRAM_DIR.glob("*.j")), ids=lambda path: path.stem
+)
+def test_example_keeps_behaviour(path):
+    before = source_lines(path.read_text())
+    after, _ = optimize(before, ASSEMBLER)
+
+    outputs, reason = run(before)
+    if reason == "halt":
+        assert run(after) == (outputs, reason)
+    else:
+        # Cut off by the budget, the optimized program gets there sooner
+        assert run(after, len(outputs))[0][: len(outputs)] == outputs
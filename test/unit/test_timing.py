@@ -0,0 +1,39 @@
+from jrb16.model import FETCH_CYCLES
+from jrb16.timing import annotate, estimate
+
+NOP = 0x000
+MOV_A_B = 0x001
+JMP = 0x099
+JMPR = 0x0A8
+
+
+def jump(opcode, operand):
+    return opcode | operand << 10
+
+
+def test_backward_jump_weights_the_loop():
+    words = [NOP, MOV_A_B, MOV_A_B, jump(JMP, 1), NOP]
+    program = annotate(words, loop_weight=10)
+    assert [i.target for i in program] == [None, None, None, 1, None]
+    assert [i.weight for i in program] == [1, 10, 10, 10, 1]
+
+    totals = estimate(program)
+    cycles = [i.cycles for i in program]
+    assert totals["straight_line"] == sum(cycles)
+    assert totals["loop_weighted"] == cycles[0] + 10 * sum(cycles[1:4]) + cycles[4]
+    assert totals["worst_case"] == totals["loop_weighted"] + 32 * FETCH_CYCLES
+
+
+def test_nested_loops_multiply():
+    # The jmp ROM sets no relative bit, so jmpr takes its operand as is too
+    words = [NOP, NOP, jump(JMPR, 1), jump(JMP, 0)]
+    program = annotate(words, loop_weight=10)
+    assert [i.target for i in program] == [None, None, 1, 0]
+    assert [i.weight for i in program] == [10, 100, 100, 10]
+
+
+def test_forward_jumps_are_not_loops():
+    program = annotate([jump(JMP, 2), NOP, NOP], loop_weight=10)
+    assert [i.weight for i in program] == [1, 1, 1]
+    totals = estimate(program)
+    assert totals["loop_weighted"] == totals["straight_line"]